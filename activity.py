@@ -0,0 +1,155 @@
+"""Day-partitioned log of finished attempts across all users, rolled up per day for date-range queries.
+
+Every save also writes one small event under activity/events/<day>/. A day's
+events are summed into activity/daily/<day>.json once the day can no longer
+change, so a range query reads one document per day however many users there are.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import perf
+from storage import SHARDS, user_key
+
+EVENTS_PREFIX = "activity/events/{day}/"
+ROLLUP_BLOB = "activity/daily/{day}.json"
+# Days newer than this are always summed from their events - an exam finished just
+# before midnight can still be saved after it
+SETTLE_DAYS = 1
+READ_WORKERS = len(SHARDS)
+
+
+def day_of(timestamp):
+    return datetime.fromisoformat(str(timestamp)).date().isoformat()
+
+
+def days_between(start, end):
+    """ISO dates from start to end inclusive"""
+    start, end = date.fromisoformat(str(start)), date.fromisoformat(str(end))
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def is_settled(day):
+    return date.fromisoformat(day) < date.today() - timedelta(days=SETTLE_DAYS)
+
+
+def event_blob_name(email, timestamp):
+    # Named after the user and the attempt, so replaying a history (backfill) overwrites instead of duplicating
+    stamp = datetime.fromisoformat(str(timestamp)).strftime("%H%M%S%f")
+    return EVENTS_PREFIX.format(day=day_of(timestamp)) + f"{stamp}-{user_key(email)}.json"
+
+
+def make_event(email, result, pass_mark):
+    percentage = round(result["score"] / result["total"] * 100) if result["total"] else 0
+    return {
+        "user": user_key(email),
+        "timestamp": str(result["timestamp"]),
+        "score": int(result["score"]),
+        "total": int(result["total"]),
+        "percentage": percentage,
+        "passed": percentage >= pass_mark * 100,
+        "timed": bool(result.get("time_limit_s")),
+    }
+
+
+def record_attempt(storage_mgr, spec, email, result):
+    """Log one saved attempt (result as stored, timestamp included)"""
+    with perf.span("activity.record"):
+        storage_mgr.write_json(event_blob_name(email, result["timestamp"]), make_event(email, result, spec.pass_mark))
+
+
+def _map(fn, items, workers):
+    if workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(min(workers, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+def read_events(storage_mgr, day, workers=READ_WORKERS):
+    names = storage_mgr.list_json(EVENTS_PREFIX.format(day=day))
+    return [event for event in _map(storage_mgr.read_json, names, workers) if event]
+
+
+def rollup_day(day, events):
+    """Per-day totals; active users are kept as hashed keys so a range can count each user once"""
+    return {
+        "day": day,
+        "attempts": len(events),
+        "passed": sum(event["passed"] for event in events),
+        "timed": sum(event.get("timed", False) for event in events),
+        "percentage_sum": sum(event["percentage"] for event in events),
+        "users": sorted({event["user"] for event in events}),
+    }
+
+
+def build_rollup(storage_mgr, day, workers=READ_WORKERS):
+    """Sum a day's events, storing the rollup once the day is settled"""
+    with perf.span("activity.build_rollup"):
+        rollup = rollup_day(day, read_events(storage_mgr, day, workers))
+        if is_settled(day):
+            storage_mgr.write_json(ROLLUP_BLOB.format(day=day), rollup)
+    return rollup
+
+
+def daily_rollups(storage_mgr, start, end, workers=READ_WORKERS):
+    """One rollup per day in the range - stored ones where they exist, built from events otherwise"""
+    def get(day):
+        rollup = storage_mgr.read_json(ROLLUP_BLOB.format(day=day)) if is_settled(day) else None
+        return rollup if rollup is not None else build_rollup(storage_mgr, day, workers=1)
+
+    with perf.span("activity.daily_rollups"):
+        return _map(get, days_between(start, end), workers)
+
+
+def daily_frame(rollups):
+    """Table of the rollups: attempts, passes, mean score and active users per day"""
+    df = pd.DataFrame([
+        {
+            'day': pd.Timestamp(rollup["day"]),
+            'attempts': rollup["attempts"],
+            'passed': rollup["passed"],
+            'timed': rollup["timed"],
+            'mean_score': rollup["percentage_sum"] / rollup["attempts"] if rollup["attempts"] else None,
+            'active_users': len(rollup["users"]),
+        }
+        for rollup in rollups
+    ], columns=['day', 'attempts', 'passed', 'timed', 'mean_score', 'active_users'])
+    df['pass_rate'] = (df['passed'] / df['attempts'].where(df['attempts'] > 0) * 100).round(1)
+    return df
+
+
+def range_summary(rollups):
+    """Totals over the whole range; a user active on several days counts once"""
+    attempts = sum(rollup["attempts"] for rollup in rollups)
+    passed = sum(rollup["passed"] for rollup in rollups)
+    return {
+        "attempts": attempts,
+        "passed": passed,
+        "pass_rate": passed / attempts * 100 if attempts else None,
+        "mean_score": sum(rollup["percentage_sum"] for rollup in rollups) / attempts if attempts else None,
+        "active_users": len({user for rollup in rollups for user in rollup["users"]}),
+    }
+
+
+def rollup_range(storage_mgr, start, end, workers=READ_WORKERS):
+    """Rebuild the stored rollups of every settled day in the range from their events"""
+    days = [day for day in days_between(start, end) if is_settled(day)]
+    with perf.span("activity.rollup_range"):
+        return _map(lambda day: build_rollup(storage_mgr, day, workers=1), days, workers)
+
+
+def backfill(storage_mgr, spec, workers=READ_WORKERS):
+    """Log every attempt already in the stored histories and roll up the days they fall on. Returns the days touched."""
+    def log_user(email):
+        days = set()
+        for result in storage_mgr.get_test_results(email):
+            if result.get("timestamp") and result.get("total"):
+                record_attempt(storage_mgr, spec, email, result)
+                days.add(day_of(result["timestamp"]))
+        return days
+
+    with perf.span("activity.backfill"):
+        days = sorted(set().union(*storage_mgr.map_users(log_user, workers)))
+        _map(lambda day: build_rollup(storage_mgr, day, workers=1), [day for day in days if is_settled(day)], workers)
+    return days
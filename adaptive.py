@@ -0,0 +1,178 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import perf
+
+PASS_MARK = 0.70
+HONOURS_MARK = 0.80
+THETA_GRID = np.linspace(-4, 4, 81)
+CALIBRATION_BLOB = "calibration/item_difficulty.json"
+# Pick among the few most informative items so two people at the same ability don't get identical exams
+RANDOMESQUE_TOP_K = 5
+# An adaptive exam may stop early once the pass/fail call is this confident
+CONFIDENCE = 0.95
+MIN_QUESTIONS = 30
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def score_distribution(p):
+    """Distribution of the number correct for independent questions with probabilities p"""
+    dist = np.zeros(len(p) + 1)
+    dist[0] = 1.0
+    for pi in p:
+        dist[1:] = dist[1:] * (1 - pi) + dist[:-1] * pi
+        dist[0] *= 1 - pi
+    return dist
+
+
+class ItemBank:
+    """Rasch (1PL) difficulties for every question plus precomputed pass curves"""
+
+    def __init__(self, test, difficulty=None, pass_mark=PASS_MARK, honours_mark=HONOURS_MARK, stratify=("Section", "Group")):
+        # Item positions index this frame - kept so an exam in progress survives a bank reload
+        self.test = test
+        self.question_ids = test['question_id'].to_numpy()
+        self.group_codes = test.groupby(list(stratify)).ngroup().to_numpy()
+        self.n_groups = int(self.group_codes.max()) + 1
+        self.difficulty = np.zeros(len(test)) if difficulty is None else np.asarray(difficulty, dtype=float)
+
+        # P(pass) and P(honours) of a standard exam (one random question per group) at each grid ability.
+        # Depends only on the difficulties, so it is done once here and a lookup is a dot product later.
+        p_item = _sigmoid(THETA_GRID[:, None] - self.difficulty[None, :])
+        group_sizes = np.bincount(self.group_codes, minlength=self.n_groups)
+        p_group = np.zeros((len(THETA_GRID), self.n_groups))
+        np.add.at(p_group.T, self.group_codes, p_item.T)
+        p_group /= group_sizes
+        pass_at = int(np.ceil(pass_mark * self.n_groups))
+        # Qualifications without an honours grade have no honours curve
+        honours_at = int(np.ceil(honours_mark * self.n_groups)) if honours_mark else None
+        self.pass_curve = np.empty(len(THETA_GRID))
+        self.honours_curve = np.empty(len(THETA_GRID)) if honours_at is not None else None
+        for k in range(len(THETA_GRID)):
+            dist = score_distribution(p_group[k])
+            self.pass_curve[k] = dist[pass_at:].sum()
+            if honours_at is not None:
+                self.honours_curve[k] = dist[honours_at:].sum()
+
+    @classmethod
+    def from_calibration(cls, bank, calibration):
+        """Use stored difficulties where we have them, 0 (average) elsewhere"""
+        test = bank.test
+        difficulty = None
+        if calibration:
+            difficulty = test['question_id'].map(calibration["difficulty"]).fillna(0.0).to_numpy()
+        return cls(test, difficulty, bank.spec.pass_mark, bank.spec.honours_mark, bank.spec.stratify)
+
+
+class AdaptiveSession:
+    """Ability estimate and item selection for one adaptive exam.
+
+    The posterior over ability lives on a fixed grid, so each answer is one
+    vectorized multiply. The next item is the most informative unused question
+    from a section/group that has not been asked yet, which keeps the exam's
+    coverage identical to the standard one-question-per-group exam.
+    """
+
+    def __init__(self, bank, stop_when_confident=False, seed=None):
+        self.bank = bank
+        self.stop_when_confident = stop_when_confident
+        self.rng = np.random.default_rng(seed)
+        self.posterior = np.exp(-0.5 * THETA_GRID ** 2)
+        self.posterior /= self.posterior.sum()
+        self.available = np.ones(len(bank.difficulty), dtype=bool)
+        self.items = []
+
+    @property
+    def target(self):
+        return self.bank.n_groups
+
+    @property
+    def ability(self):
+        return float(self.posterior @ THETA_GRID)
+
+    @property
+    def pass_probability(self):
+        return float(self.posterior @ self.bank.pass_curve)
+
+    @property
+    def honours_probability(self):
+        if self.bank.honours_curve is None:
+            return None
+        return float(self.posterior @ self.bank.honours_curve)
+
+    @property
+    def confident(self):
+        p = self.pass_probability
+        return len(self.items) >= MIN_QUESTIONS and (p >= CONFIDENCE or p <= 1 - CONFIDENCE)
+
+    @perf.timed("adaptive.next_item")
+    def next_item(self):
+        """Bank row position of the next question, or None when the exam is over"""
+        if self.stop_when_confident and self.confident:
+            return None
+        candidates = np.flatnonzero(self.available)
+        if len(candidates) == 0:
+            return None
+        p = _sigmoid(self.ability - self.bank.difficulty[candidates])
+        information = p * (1 - p)
+        top = candidates[np.argsort(-information)[:RANDOMESQUE_TOP_K]]
+        item = int(self.rng.choice(top))
+        self.items.append(item)
+        # One question per section/group, like the standard exam
+        self.available[self.bank.group_codes == self.bank.group_codes[item]] = False
+        return item
+
+    @perf.timed("adaptive.record")
+    def record(self, item, is_correct):
+        p = _sigmoid(THETA_GRID - self.bank.difficulty[item])
+        self.posterior *= p if is_correct else 1 - p
+        self.posterior /= self.posterior.sum()
+
+
+def calibrate(test, answers_df, prior_weight=5.0):
+    """Rasch difficulties from everyone's stored answers.
+
+    Each question's proportion correct is shrunk towards its group's (and the
+    group's towards the overall) so rarely-seen questions get sensible values.
+    answers_df needs a question_id column (see BankVersion.question_ids).
+    """
+    frame = pd.DataFrame({'question_id': test['question_id'], 'Section': test['Section'], 'Group': test['Group']})
+
+    responses = pd.DataFrame(columns=['question_id', 'is_correct'])
+    if not answers_df.empty:
+        responses = pd.DataFrame({
+            'question_id': answers_df['question_id'],
+            'is_correct': answers_df['is_correct'].astype(float),
+        }).dropna()
+    counts = responses.groupby('question_id')['is_correct'].agg(['sum', 'count'])
+    frame = frame.join(counts, on='question_id').fillna({'sum': 0.0, 'count': 0.0})
+
+    overall = (frame['sum'].sum() + prior_weight * PASS_MARK) / (frame['count'].sum() + prior_weight)
+    group = frame.groupby(['Section', 'Group'])[['sum', 'count']].transform('sum')
+    p_group = (group['sum'] + prior_weight * overall) / (group['count'] + prior_weight)
+    p_question = (frame['sum'] + prior_weight * p_group) / (frame['count'] + prior_weight)
+    p_question = p_question.clip(0.02, 0.98)
+
+    return {
+        "created": datetime.now().isoformat(),
+        "responses": int(frame['count'].sum()),
+        "difficulty": dict(zip(frame['question_id'], (-np.log(p_question / (1 - p_question))).round(4))),
+    }
+
+
+_item_banks = {}
+
+
+def item_bank(bank, calibration=None):
+    """ItemBank for this BankVersion and calibration, built once per process and kept one per registered bank"""
+    key = (id(bank), calibration["created"] if calibration else None)
+    cached = _item_banks.get(bank.spec.key)
+    if cached is None or cached[0] != key:
+        with perf.span("adaptive.item_bank"):
+            cached = _item_banks[bank.spec.key] = (key, ItemBank.from_calibration(bank, calibration))
+    return cached[1]
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import history
+import perf
+
+# Answers quicker than this can hardly have been read - likely guesses
+GUESS_MS = 5000
+
+
+@perf.timed("analytics.flatten_answers")
+def flatten_answers(results):
+    """Flatten the answers of every test into a single DataFrame (the folded answers of a compacted history first)"""
+    all_answers = [ans for res in results for ans in res['answers']]
+    cold = getattr(results, "cold", None)
+    if cold:
+        return pd.concat([history.cold_answers(cold), pd.DataFrame(all_answers)], ignore_index=True)
+    return pd.DataFrame(all_answers)
+
+
+@perf.timed("analytics.summary_metrics")
+def summary_metrics(results):
+    """Headline numbers shown above the score chart"""
+    # Adaptive tests can finish early, so work in percent rather than raw scores
+    scores = [round(r['score'] / r['total'] * 100) for r in results]
+    return {
+        "total_tests": len(results),
+        "average": sum(scores) / len(scores),
+        "best": max(scores),
+        "latest": scores[-1],
+        "last_5_average": sum(scores[-5:]) / min(len(scores), 5),
+    }
+
+
+@perf.timed("analytics.scores_frame")
+def scores_frame(results, pass_mark=0.70, honours_mark=0.80):
+    """One row per test with the timestamp, score and bar colour"""
+    scores_df = pd.DataFrame([
+        {
+            'timestamp': pd.to_datetime(res['timestamp']),
+            'score': round(res['score'] / res['total'] * 100),
+            'test_number': f"Test {i+1}"
+        } for i, res in enumerate(results)
+    ])
+    scores_df = scores_df.sort_values('timestamp')
+
+    # Create color array based on scores
+    score = scores_df['score'].to_numpy()
+    honours = score >= honours_mark * 100 if honours_mark else np.zeros(len(score), dtype=bool)
+    scores_df['color'] = np.select([honours, score >= pass_mark * 100], ['lightblue', 'lightgreen'], default='lightcoral')
+    return scores_df
+
+
+@perf.timed("analytics.heatmap_table")
+def heatmap_table(answers_df):
+    """Percent correct per section/group plus matching text annotations"""
+    pivot_table = answers_df.pivot_table(
+        values='is_correct',
+        index='section',
+        columns='group',
+        aggfunc='mean'
+    ) * 100
+
+    # Sort columns (groups) numerically
+    pivot_table = pivot_table.reindex(sorted(pivot_table.columns, key=int), axis=1)
+
+    # Create 2D array of text annotations that matches the pivot table data exactly
+    values = pivot_table.to_numpy(dtype=float)
+    annotation_text = np.where(np.isnan(values), "", np.nan_to_num(values).astype(int).astype(str)).tolist()
+    return pivot_table, annotation_text
+
+
+@perf.timed("analytics.section_group_stats")
+def section_group_stats(df_all):
+    """Correct/total/percent for every section and group answered"""
+    return df_all.groupby(['section', 'group'])['is_correct'].agg([
+        ('correct', 'sum'),
+        ('total', 'count'),
+        ('percent', lambda x: (x.mean() * 100).round(1))
+    ]).reset_index()
+
+
+def add_summary_column(stats):
+    stats['Summary'] = stats.apply(
+        lambda x: f"{int(x['correct'])}/{int(x['total'])} ({x['percent']}%)",
+        axis=1
+    )
+    return stats
+
+
+@perf.timed("analytics.question_coverage")
+def question_coverage(df_all, test):
+    """How many questions of each section/group have been answered at least once.
+
+    df_all needs a question_id column (see BankVersion.question_ids); answers to
+    questions that are no longer in the bank are left out.
+    """
+    # Create a dataframe of all possible questions from test bank
+    all_questions = test[['Section', 'Group', 'question_id', 'question_english']].copy()
+    all_questions.columns = ['section', 'group', 'question_id', 'question']
+
+    # Get all unique questions answered by user, placed where the current bank has them
+    answered_questions = all_questions[all_questions['question_id'].isin(df_all['question_id'])]
+
+    # Group by section and group to get totals
+    question_coverage = all_questions.groupby(['section', 'group']).agg({
+        'question': 'count'
+    }).reset_index()
+    question_coverage.columns = ['section', 'group', 'total_questions']
+
+    # Get count of answered questions by section and group
+    answered_counts = answered_questions.groupby(['section', 'group']).size().reset_index()
+    answered_counts.columns = ['section', 'group', 'answered_questions']
+
+    # Merge the counts
+    coverage_stats = question_coverage.merge(
+        answered_counts,
+        on=['section', 'group'],
+        how='left'
+    ).fillna(0)
+
+    coverage_stats['answered_questions'] = coverage_stats['answered_questions'].astype(int)
+    coverage_stats['remaining_questions'] = coverage_stats['total_questions'] - coverage_stats['answered_questions']
+    coverage_stats['coverage_percent'] = (coverage_stats['answered_questions'] / coverage_stats['total_questions'] * 100).round(1)
+    return coverage_stats, answered_questions
+
+
+@perf.timed("analytics.response_times")
+def response_times(df_all):
+    """Median and p90 seconds per question by section, and how many answers were quick enough to be guesses.
+
+    Only answers saved with a time_ms are counted - older tests did not record it.
+    """
+    columns = ['section', 'answers', 'median_s', 'p90_s', 'fast_percent']
+    if 'time_ms' not in df_all:
+        return pd.DataFrame(columns=columns)
+    timed = df_all.loc[df_all['time_ms'].notna(), ['section', 'time_ms']]
+    if timed.empty:
+        return pd.DataFrame(columns=columns)
+
+    grouped = timed.assign(
+        seconds=timed['time_ms'].to_numpy(dtype=float) / 1000,
+        fast=timed['time_ms'].to_numpy(dtype=float) < GUESS_MS,
+    ).groupby('section')
+    stats = grouped['seconds'].quantile([0.5, 0.9]).unstack()
+    stats.columns = ['median_s', 'p90_s']
+    stats['answers'] = grouped.size()
+    stats['fast_percent'] = grouped['fast'].mean() * 100
+    return stats.reset_index()[columns].round({'median_s': 1, 'p90_s': 1, 'fast_percent': 1})
@@ -0,0 +1,131 @@
+"""Paper practice exams: print one from a seed, then grade and store the answer sheets in bulk.
+
+    python answer_sheets.py paper --seed 7 [--bank basic] > exam.txt
+    python answer_sheets.py grade sheets.csv [--bank basic] [--dry-run] [--workers 16]
+
+paper prints the exam drawn for the seed, options lettered A-D, with the answer
+key at the end. Every copy printed from the same seed is the same exam while
+the bank's workbook is unchanged.
+
+grade reads a .csv (with a header row) or .jsonl file, one answer sheet per row:
+
+    email         whose history the test is saved to
+    seed          the paper exam it was taken from
+    question_ids  instead of a seed, the questions in the order they were asked;
+                  their options are lettered in the order the seed (0 if none) gives
+    answers       the letters ticked, one per question: "A;C;;B" or "AC-B", blank or - when left out
+    timestamp     optional, when it was taken in ISO 8601, e.g. 2024-05-01T09:30 (default: now)
+
+In CSV, question_ids are separated by ";"; in JSONL both fields may also be
+lists. Sheets are graded together with array comparisons, then saved like
+exams taken in the app (history, mastery, activity log, distractor counts) -
+one write per user. Sheets that don't fit the bank are listed and skipped.
+So are sheets whose timestamp is already in the user's history, so grading a
+file again only saves what is new - sheets without a timestamp are stamped
+now and saved again.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+import banks
+import grading
+from question_bank import ANSWER_COLUMNS, current_bank
+from storage import SHARDS, get_storage_manager
+
+load_dotenv()
+
+
+def _split(value):
+    if isinstance(value, list):
+        return value
+    value = (value or "").strip()
+    if ";" in value:
+        return [item.strip() for item in value.split(";")]
+    # Letters typed without separators
+    return [item if item != "-" else "" for item in value]
+
+
+def _sheet(row):
+    seed = row.get("seed")
+    question_ids = row.get("question_ids")
+    if isinstance(question_ids, str):
+        question_ids = [item.strip() for item in question_ids.split(";") if item.strip()]
+    return {
+        "email": row["email"],
+        "seed": int(seed) if seed not in (None, "") else None,
+        "question_ids": question_ids or None,
+        "answers": _split(row.get("answers")),
+        "timestamp": row.get("timestamp") or None,
+    }
+
+
+def read_sheets(path):
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [_sheet(row) for row in rows]
+
+
+def print_paper(bank, seed, out=sys.stdout):
+    pool, orders = grading.paper_exam(bank, seed)
+    out.write(f"{bank.spec.name} practice exam - seed {seed}, bank version {bank.version}\n\n")
+    key = []
+    for i, (row, order) in enumerate(zip(pool.itertuples(index=False), orders), 1):
+        out.write(f"{i}. {row.question_english}\n")
+        for letter, option in zip(grading.OPTION_LETTERS, order):
+            out.write(f"   {letter}) {getattr(row, ANSWER_COLUMNS[option])}\n")
+        out.write("\n")
+        key.append(grading.OPTION_LETTERS[list(order).index(0)])
+    out.write(f"Answer key: {''.join(key)}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("job", choices=["paper", "grade"])
+    parser.add_argument("path", nargs="?", help="answer sheets for grade (.csv or .jsonl)")
+    parser.add_argument("--bank", default=banks.DEFAULT_BANK, choices=sorted(banks.BANKS))
+    parser.add_argument("--seed", type=int, help="exam to print for paper")
+    parser.add_argument("--workers", type=int, default=len(SHARDS))
+    parser.add_argument("--dry-run", action="store_true", help="grade and report without saving")
+    args = parser.parse_args(argv)
+
+    bank = current_bank(args.bank)
+    if args.job == "paper":
+        if args.seed is None:
+            parser.error("paper needs --seed")
+        print_paper(bank, args.seed)
+        return 0
+
+    if not args.path:
+        parser.error("grade needs the answer sheets file")
+    sheets = read_sheets(args.path)
+    start = time.perf_counter()
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+    results, errors, skipped = grading.grade_sheets(bank, sheets, storage_mgr, args.workers)
+    graded = time.perf_counter() - start
+    answers = sum(result["total"] for _, result in results)
+    print(f"graded {len(results)} sheets, {answers} questions in {graded:.2f}s ({answers / max(graded, 1e-9):,.0f}/s)")
+    if skipped:
+        print(f"skipped {len(skipped)} sheets already saved")
+    for number, error in errors:
+        print(f"sheet {number} ({sheets[number - 1]['email']}): {error}", file=sys.stderr)
+    if results and not args.dry_run:
+        start = time.perf_counter()
+        saved, failed = grading.save_results(bank, results, args.workers)
+        users = len({email for email, _ in results})
+        print(f"saved {saved} tests for {users} users in {time.perf_counter() - start:.2f}s")
+        if failed:
+            # The tests are stored - the admin page's rebuilds recount these from the histories
+            print(f"some {', '.join(failed)} updates failed (see the log)", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""JSON API over the same question banks, exam reservoir and storage as the Streamlit app.
+
+    python api.py --port 8600
+
+POST /api/exams                           {"bank": "basic", "email": "...", "type": "New Questions Only", "time_limit_s": 5400}
+GET  /api/exams/<exam_id>/questions/<n>   question n (from 0) with its options in display order
+POST /api/exams/<exam_id>/answers         {"answers": [{"question": n, "choice": i, "time_ms": t}, ...], "email": "...", "finish": true}
+GET  /api/users/<email>/summary?bank=...  headline scores and readiness
+GET  /api/health
+GET  /guide/<bank>/                       the static Study Guide (see static_guide.py)
+
+Every field except "answers" is optional. "choice" is the position of the picked
+option in the list the question endpoint returned. An exam finishes with its last
+answer, "finish" or the deadline; until it is saved, a later request with just
+"email" saves it. Exams live in this process (at most MAX_EXAMS, the least
+recently used dropped first), so run one API process per port (behind a load
+balancer with sticky routing to scale out).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+from dotenv import load_dotenv
+from tornado import ioloop, web
+
+import analytics
+import banks
+import exam_pool
+import grading
+import mastery
+import perf
+import static_guide
+from question_bank import ANSWER_COLUMNS, build_personalized_pool, current_bank, history_profile
+from storage import get_storage_manager
+
+load_dotenv()
+
+# Exams nobody has touched for this long are dropped
+EXAM_TTL = 4 * 3600
+# Exams held at once - beyond it the least recently touched is dropped, so clients can't grow memory without limit
+MAX_EXAMS = 10000
+# Summaries kept, each valid for as long as the user's results blob keeps its ETag
+SUMMARY_CACHE_SIZE = 4096
+TEST_TYPES = ("Standard Random Test", "New Questions Only", "Practice Weak Areas")
+
+
+class ApiExam:
+    """One exam handed out over the API: its questions in order, each with a fixed option order"""
+
+    def __init__(self, bank, pool, time_limit_s=None):
+        self.id = uuid.uuid4().hex
+        self.bank = bank
+        self.pool = pool.iloc[:bank.spec.exam_size].reset_index(drop=True)
+        self.orders = [grading.shuffled_order() for _ in range(len(self.pool))]
+        self.time_limit_s = time_limit_s
+        self.deadline = time.time() + time_limit_s if time_limit_s else None
+        self.answers = {}
+        self.shown = {}
+        self.touched = time.time()
+        self.finished = False
+        # Fixed when the exam finishes, so a later save stores the same result
+        self.final = None
+        self.saved = False
+        # Question payloads are rendered once so serving one is a list lookup
+        self.questions = [self._render(n) for n in range(len(self.pool))]
+
+    def _render(self, n):
+        row = self.pool.iloc[n]
+        options = [row[ANSWER_COLUMNS[i]] for i in self.orders[n]]
+        return json.dumps({
+            "exam_id": self.id,
+            "question": n,
+            "total": len(self.pool),
+            "question_id": row['question_id'],
+            "section": row['Section'],
+            "section_name": row['Section Name'],
+            "group": int(row['Group']),
+            "text": row['question_english'],
+            "options": [None if pd.isna(option) else option for option in options],
+        }).encode()
+
+    @property
+    def time_up(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def answer(self, n, choice, time_ms=None):
+        """Grade one answer; a question already answered keeps its first answer, like the page"""
+        if n not in self.answers:
+            self.answers[n] = grading.answer_record(self.pool.iloc[n], self.orders[n], choice, time_ms)
+        return self.answers[n]
+
+    def result(self):
+        answers = [self.answers[n] for n in sorted(self.answers)]
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "score": sum(answer["is_correct"] for answer in answers),
+            "total": len(self.pool),
+            "answers": answers,
+            "time_limit_s": self.time_limit_s,
+        }
+
+
+_exams = OrderedDict()
+_exams_lock = threading.Lock()
+_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def add_exam(exam):
+    now = time.time()
+    with _exams_lock:
+        # Oldest-touched first, so expired exams are all at the front
+        while _exams and next(iter(_exams.values())).touched < now - EXAM_TTL:
+            _exams.popitem(last=False)
+        while len(_exams) >= MAX_EXAMS:
+            _exams.popitem(last=False)
+            perf.record("api.exam_evicted", 0.0)
+        _exams[exam.id] = exam
+    return exam
+
+
+def get_exam(exam_id):
+    with _exams_lock:
+        exam = _exams.get(exam_id)
+        if exam is None:
+            raise web.HTTPError(404, reason="No such exam (it may have expired)")
+        exam.touched = time.time()
+        _exams.move_to_end(exam_id)
+    return exam
+
+
+def create_exam(bank, email=None, test_type="Standard Random Test", time_limit_s=None):
+    """Same sources as the Take Test page: the warm reservoir first, built on the spot when it is empty"""
+    reservoir = exam_pool.get_reservoir(bank)
+    message = None
+    if email and test_type != "Standard Random Test":
+        exam = reservoir.pop_personalized(email, test_type)
+        if exam is None:
+            storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+            exam = build_personalized_pool(bank, history_profile(storage_mgr.get_test_results(email), bank), test_type)
+        pool, message = exam
+    else:
+        pool = reservoir.pop_standard()
+    return add_exam(ApiExam(bank, pool, time_limit_s)), message
+
+
+def user_summary(bank, email):
+    """Summary metrics and readiness, recomputed only when the user's results blob changes"""
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+    version = storage_mgr.results_version(email)
+    if version is None:
+        return None
+    key = (bank.spec.key, email)
+    with _summaries_lock:
+        cached = _summaries.get(key)
+        if cached is not None and cached[0] == version:
+            _summaries.move_to_end(key)
+            perf.record("api.summary_hit", 0.0)
+            return cached[1]
+
+    with perf.span("api.summary_build"):
+        results = storage_mgr.get_test_results(email)
+        if not results:
+            return None
+        summary = analytics.summary_metrics(results)
+        state = mastery.load(storage_mgr, email, results)
+        spec = bank.spec
+        summary["readiness"] = mastery.readiness(state, mastery.bank_groups(bank.test), spec.pass_mark, spec.honours_mark)
+        payload = json.dumps({"email": email, "bank": spec.key, **summary}).encode()
+    with _summaries_lock:
+        _summaries[key] = (version, payload)
+        while len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    return payload
+
+
+class JsonHandler(web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json")
+
+    def write_error(self, status_code, **kwargs):
+        self.finish(json.dumps({"error": self._reason}))
+
+    def body(self):
+        try:
+            data = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise web.HTTPError(400, reason="Body is not valid JSON")
+        if not isinstance(data, dict):
+            raise web.HTTPError(400, reason="Body must be a JSON object")
+        return data
+
+    def bank(self, key):
+        if key is not None and key not in banks.available_banks():
+            raise web.HTTPError(404, reason=f"No question bank '{key}'")
+        return current_bank(key)
+
+    def run_blocking(self, fn, *args):
+        """Storage calls block - keep them off the event loop"""
+        return ioloop.IOLoop.current().run_in_executor(None, fn, *args)
+
+
+class HealthHandler(JsonHandler):
+    def get(self):
+        self.write(b'{"status": "ok"}')
+
+
+class ExamsHandler(JsonHandler):
+    async def post(self):
+        data = self.body()
+        bank = self.bank(data.get("bank"))
+        test_type = data.get("type", "Standard Random Test")
+        if test_type not in TEST_TYPES:
+            raise web.HTTPError(400, reason=f"type must be one of {', '.join(TEST_TYPES)}")
+        time_limit_s = data.get("time_limit_s")
+        if time_limit_s is not None and (type(time_limit_s) is not int or time_limit_s <= 0):
+            raise web.HTTPError(400, reason="time_limit_s must be a positive whole number of seconds or null")
+        email = (data.get("email") or "").lower().strip() or None
+        with perf.span("api.create_exam"):
+            exam, message = await self.run_blocking(create_exam, bank, email, test_type, time_limit_s)
+        self.set_status(201)
+        self.write(json.dumps({
+            "exam_id": exam.id,
+            "bank": bank.spec.key,
+            "total": len(exam.pool),
+            "time_limit_s": exam.time_limit_s,
+            "message": message[1] if message else None,
+        }))
+
+
+class QuestionHandler(JsonHandler):
+    def get(self, exam_id, n):
+        with perf.span("api.question"):
+            exam = get_exam(exam_id)
+            n = int(n)
+            if n >= len(exam.questions):
+                raise web.HTTPError(404, reason=f"The exam has {len(exam.questions)} questions")
+            # Response time runs from the first fetch of the question, like the page's first render
+            exam.shown.setdefault(n, time.monotonic())
+            self.write(exam.questions[n])
+
+
+class AnswersHandler(JsonHandler):
+    async def post(self, exam_id):
+        exam = get_exam(exam_id)
+        data = self.body()
+        answers = data.get("answers", [])
+        if not isinstance(answers, list):
+            raise web.HTTPError(400, reason="answers must be a list")
+        if exam.saved:
+            raise web.HTTPError(409, reason="The exam is already finished and saved")
+        if exam.finished and answers:
+            raise web.HTTPError(409, reason="The exam is already finished - send just the email to save it")
+
+        # Check the whole batch before grading any of it
+        parsed = []
+        for item in answers:
+            try:
+                n, choice = int(item["question"]), int(item["choice"])
+            except (KeyError, TypeError, ValueError):
+                raise web.HTTPError(400, reason="Each answer needs an integer question and choice")
+            if not 0 <= n < len(exam.pool) or not 0 <= choice < len(exam.orders[n]):
+                raise web.HTTPError(400, reason=f"No choice {choice} for question {n}")
+            parsed.append((n, choice, item.get("time_ms")))
+
+        graded = []
+        with perf.span("api.grade"):
+            # Answers sent after the deadline do not count, as on the page
+            for n, choice, time_ms in [] if exam.time_up else parsed:
+                if time_ms is None and n in exam.shown:
+                    time_ms = int((time.monotonic() - exam.shown[n]) * 1000)
+                record = exam.answer(n, choice, time_ms)
+                graded.append({
+                    "question": n,
+                    "is_correct": bool(record["is_correct"]),
+                    "correct_choice": exam.orders[n].index(0),
+                    "correct": record["correct"],
+                })
+
+        response = {
+            "graded": graded,
+            "answered": len(exam.answers),
+            "total": len(exam.pool),
+            "time_up": exam.time_up,
+        }
+        if exam.finished or data.get("finish") or exam.time_up or len(exam.answers) == len(exam.pool):
+            if not exam.finished:
+                exam.finished = True
+                exam.final = exam.result()
+            result = exam.final
+            spec = exam.bank.spec
+            percentage = round(result["score"] / result["total"] * 100)
+            response.update({
+                "finished": True,
+                "score": result["score"],
+                "percentage": percentage,
+                "passed": percentage >= spec.pass_mark * 100,
+                "honours": spec.honours_mark is not None and percentage >= spec.honours_mark * 100,
+                "saved": False,
+            })
+            email = (data.get("email") or "").lower().strip()
+            if email:
+                # Claimed before the save yields, so a second request can't store the test again
+                exam.saved = True
+                try:
+                    with perf.span("api.save"):
+                        await self.run_blocking(grading.save_result, exam.bank, email, result)
+                except Exception:
+                    exam.saved = False
+                    raise
+                response["saved"] = True
+        self.write(json.dumps(response, default=grading.convert_to_serializable))
+
+
+class SummaryHandler(JsonHandler):
+    async def get(self, email):
+        bank = self.bank(self.get_query_argument("bank", None))
+        payload = await self.run_blocking(user_summary, bank, email.lower().strip())
+        if payload is None:
+            raise web.HTTPError(404, reason=f"No test history for {email}")
+        self.write(payload)
+
+
+def make_app():
+    return web.Application([
+        (r"/api/health", HealthHandler),
+        (r"/api/exams", ExamsHandler),
+        (r"/api/exams/([0-9a-f]+)/questions/([0-9]+)", QuestionHandler),
+        (r"/api/exams/([0-9a-f]+)/answers", AnswersHandler),
+        (r"/api/users/([^/]+)/summary", SummaryHandler),
+        (r"/guide/(.*)", web.StaticFileHandler, {"path": static_guide.OUT_DIR, "default_filename": "index.html"}),
+    ], compress_response=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8600")))
+    parser.add_argument("--address", default="127.0.0.1")
+    args = parser.parse_args(argv)
+
+    # Load the default bank and fill its reservoir before taking traffic
+    exam_pool.get_reservoir(current_bank())
+    # Rebuilt only for banks whose workbook changed since the last build
+    for key in banks.available_banks():
+        static_guide.build(current_bank(key))
+    make_app().listen(args.port, args.address)
+    print(f"API listening on http://{args.address}:{args.port}", flush=True)
+    ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Registry of the question banks the app can serve.
+
+Only describes the banks - nothing here loads a workbook, so importing it is
+free. question_bank.current_bank(key) loads a bank the first time it is used.
+"""
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class BankSpec:
+    """Where a bank's questions live and how its exam is put together"""
+
+    def __init__(self, key, name, file, exam_size, pass_mark, honours_mark=None,
+                 stratify=("Section", "Group"), study_guide_sheet="study guide", test_sheet="test",
+                 study_guide_header=2, storage_prefix=""):
+        self.key = key
+        self.name = name
+        self.file = file if os.path.isabs(file) else os.path.join(ROOT, file)
+        self.exam_size = exam_size
+        self.pass_mark = pass_mark
+        self.honours_mark = honours_mark  # None when the qualification has no honours grade
+        # An exam takes one random question from each combination of these columns
+        self.stratify = list(stratify)
+        self.study_guide_sheet = study_guide_sheet
+        self.test_sheet = test_sheet
+        self.study_guide_header = study_guide_header
+        # Prepended to every blob this bank's results use, so banks never see each other's history
+        self.storage_prefix = storage_prefix
+
+    @property
+    def available(self):
+        return os.path.exists(self.file)
+
+    @property
+    def wording_file(self):
+        return os.path.splitext(self.file)[0] + ".wording.json"
+
+
+BANKS = {
+    # The original bank keeps the original blob layout, so existing results need no migration
+    "basic": BankSpec("basic", "Basic Qualification", "ham.xlsx", exam_size=100, pass_mark=0.70, honours_mark=0.80),
+    "advanced": BankSpec("advanced", "Advanced Qualification", "advanced.xlsx", exam_size=50, pass_mark=0.70,
+                         storage_prefix="banks/advanced/"),
+}
+DEFAULT_BANK = "basic"
+
+
+def available_banks():
+    """Keys of the registered banks whose workbook is present in this deployment"""
+    return [key for key, spec in BANKS.items() if spec.available]
+
+
+def get_spec(key=None):
+    return BANKS[key or DEFAULT_BANK]
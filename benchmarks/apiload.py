@@ -0,0 +1,179 @@
+"""Request throughput of the JSON API (api.py).
+
+Starts `python api.py` against the in-memory storage backend, saves a few
+users' results through the API, then drives the read endpoints over
+keep-alive connections for a fixed time and reports requests/s and latency
+percentiles. Creating and submitting whole exams (which write to storage)
+is measured separately.
+
+    python -m benchmarks.apiload --connections 1,16,64 --duration 5
+
+The client is a bare asyncio HTTP/1.1 loop so it costs far less CPU than the
+server it is measuring; run with --client-processes > 1 if it still becomes
+the bottleneck on a fast machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.loadtest import ROOT, free_port, percentiles, rss_bytes
+
+USERS = 20
+
+
+class ApiServer:
+    def __init__(self):
+        self.port = free_port()
+        self.proc = None
+
+    def __enter__(self):
+        env = dict(os.environ, AZURE_STORAGE_CONNECTION_STRING="memory://apiload", PERF_ENABLED="1")
+        self.proc = subprocess.Popen(
+            [sys.executable, "api.py", "--port", str(self.port)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(f"{self.url}/api/health", timeout=1) as r:
+                    if r.status == 200:
+                        return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("API server did not become healthy")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"{self.url}{path}", data=data, method=method)
+        with urllib.request.urlopen(request, timeout=60) as r:
+            return json.loads(r.read())
+
+
+def take_exam(server, email, finish=True):
+    """Create an exam, fetch every question, answer them in one batch - what a client app does"""
+    exam = server.call("POST", "/api/exams", {"email": email})
+    answers = []
+    for n in range(exam["total"]):
+        question = server.call("GET", f"/api/exams/{exam['exam_id']}/questions/{n}")
+        answers.append({"question": n, "choice": hash((email, question["question_id"])) % len(question["options"])})
+    return exam, server.call("POST", f"/api/exams/{exam['exam_id']}/answers", {"answers": answers, "email": email, "finish": finish})
+
+
+async def _hammer(port, paths, duration, latencies, statuses):
+    """One keep-alive connection sending GETs back to back until the time is up"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    requests = [f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode() for path in paths]
+    end = time.perf_counter() + duration
+    i = 0
+    try:
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            i += 1
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def _client(port, paths, connections, duration):
+    async def run():
+        latencies, statuses = [], {}
+        await asyncio.gather(*[_hammer(port, paths, duration, latencies, statuses) for _ in range(connections)])
+        return latencies, statuses
+    return asyncio.run(run())
+
+
+def read_level(server, name, paths, connections, duration, client_processes):
+    per_process = max(1, connections // client_processes)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(client_processes) as pool:
+        futures = [pool.submit(_client, server.port, paths, per_process, duration) for _ in range(client_processes)]
+        outputs = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    latencies = [s for lat, _ in outputs for s in lat]
+    statuses = {}
+    for _, st in outputs:
+        for code, count in st.items():
+            statuses[code] = statuses.get(code, 0) + count
+    return {
+        "endpoint": name,
+        "connections": per_process * client_processes,
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / min(elapsed, duration), 1),
+        "latency": percentiles(latencies) if latencies else None,
+        "statuses": statuses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", default="1,16,64", help="comma separated keep-alive connection counts")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per read level")
+    parser.add_argument("--client-processes", type=int, default=1)
+    parser.add_argument("--exams", type=int, default=20, help="full create/answer/save round trips to time")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = {"reads": [], "exams": None}
+    with ApiServer() as server:
+        # Histories for the summary endpoint, saved through the API itself
+        emails = [f"api{i:03d}@example.com" for i in range(USERS)]
+        for email in emails:
+            take_exam(server, email)
+        exam = server.call("POST", "/api/exams", {})
+        question_paths = [f"/api/exams/{exam['exam_id']}/questions/{n}" for n in range(exam["total"])]
+        summary_paths = [f"/api/users/{email}/summary" for email in emails]
+
+        for connections in [int(x) for x in args.connections.split(",")]:
+            for name, paths in [("question", question_paths), ("summary", summary_paths)]:
+                result = read_level(server, name, paths, connections, args.duration, args.client_processes)
+                report["reads"].append(result)
+                latency = result["latency"] or {}
+                print(
+                    f"{name:>9}  {result['connections']:>4} conn  {result['requests_per_s']:>9} req/s  "
+                    f"p50 {latency.get('p50_ms')} ms  p99 {latency.get('p99_ms')} ms  statuses {result['statuses']}"
+                )
+
+        timings = []
+        for i in range(args.exams):
+            start = time.perf_counter()
+            take_exam(server, f"round{i:03d}@example.com")
+            timings.append(time.perf_counter() - start)
+        report["exams"] = percentiles(timings)
+        report["server_rss_mb"] = round((rss_bytes(server.proc.pid) or 0) / 2**20, 1)
+        print(f"full exam round trip (create, {exam['total']} question fetches, submit + save): {report['exams']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(set(r["statuses"]) - {200} for r in report["reads"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
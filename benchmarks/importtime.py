@@ -0,0 +1,88 @@
+"""What a cold process imports (and how long it takes) to render one page.
+
+    python -m benchmarks.importtime                  # Home
+    python -m benchmarks.importtime --page "Take Test" --top 15
+    python -m benchmarks.importtime --all
+
+Each page is rendered in a fresh interpreter started with -X importtime, using
+the in-memory storage backend. Streamlit itself (and its test harness) is
+imported before the measurement starts, so the report only shows what the app
+pulls in on top of it: "cold start" is the first run of the script, which is
+what a new server process pays before the first user sees the page.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES = ["Home", "Take Test", "Review History", "Study Guide"]
+MARKER = "----- importtime: app starts here -----"
+
+CHILD = """
+import json, os, sys, time
+os.environ["AZURE_STORAGE_CONNECTION_STRING"] = "memory://importtime"
+sys.path.insert(0, {root!r})
+import streamlit
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+at = AppTest.from_file(os.path.join({root!r}, "test.py"), default_timeout=120)
+at.run()
+if {page!r} != "Home":
+    at.sidebar.radio[0].set_value({page!r}).run()
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "modules": len(set(sys.modules) - before),
+    "exceptions": [e.value for e in at.exception],
+}}))
+"""
+
+
+def measure(page):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(root=str(ROOT), marker=MARKER, page=page)],
+        capture_output=True, text=True, cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    # "import time: self [us] | cumulative | imported package", nested imports are indented
+    packages = defaultdict(int)
+    lines = proc.stderr.split(MARKER, 1)[-1].splitlines()
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        packages[name.strip().split(".")[0]] += int(self_us)
+    result["import_s"] = sum(packages.values()) / 1e6
+    result["packages"] = dict(sorted(packages.items(), key=lambda kv: -kv[1]))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", choices=PAGES, default="Home")
+    parser.add_argument("--all", action="store_true", help="report every page")
+    parser.add_argument("--top", type=int, default=10, help="packages to list per page")
+    args = parser.parse_args(argv)
+
+    for page in PAGES if args.all else [args.page]:
+        result = measure(page)
+        print(f"{page}: first render {result['seconds'] * 1000:.0f} ms, "
+              f"{result['modules']} modules imported in {result['import_s'] * 1000:.0f} ms")
+        for name, us in list(result["packages"].items())[:args.top]:
+            print(f"    {name:<24} {us / 1000:8.1f} ms")
+        if result["exceptions"]:
+            print(f"    exceptions: {result['exceptions']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""Concurrent-session load test for the Streamlit app.
+
+Starts `streamlit run test.py` against the in-memory storage backend and drives
+N scripted sessions over Streamlit's websocket protocol, the same way a browser
+does: open the app, take a 100 question test, save it and open Review History.
+
+    python -m benchmarks.loadtest --levels 1,10,50,100,200
+
+AppTest cannot be used for this: it patches process-wide runtime state, so
+several AppTest sessions in one process deadlock instead of running side by side.
+
+For every concurrency level a fresh server is started so memory readings are
+comparable. Reported per level: session and interaction throughput, latency
+percentiles per interaction, server RSS growth per connected session and the
+number of StorageManager calls the server made (read from its perf JSON-lines sink).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter, defaultdict
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WIDGET_TYPES = ("button", "radio", "text_input", "selectbox", "slider")
+
+
+class ScriptError(Exception):
+    pass
+
+
+class Session:
+    """A minimal Streamlit browser: remembers widget values and waits for each rerun to finish"""
+
+    def __init__(self, url):
+        self.url = url
+        self.conn = None
+        self.page_script_hash = ""
+        self.values = {}    # widget id -> WidgetState sent on every rerun, like the frontend does
+        self.widgets = {}   # key or label -> (widget id, element proto) from the latest run
+        self.errors = []
+
+    async def connect(self):
+        self.conn = await websocket_connect(self.url, subprotocols=["streamlit"], max_message_size=256 * 1024 * 1024)
+        await self.rerun()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    async def rerun(self, triggers=()):
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.page_script_hash = self.page_script_hash
+        for widget_state in self.values.values():
+            state.widget_states.widgets.append(widget_state)
+        for widget_id in triggers:
+            trigger = state.widget_states.widgets.add()
+            trigger.id = widget_id
+            trigger.trigger_value = True
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+        await self._wait_finished()
+
+    async def _wait_finished(self):
+        while True:
+            raw = await self.conn.read_message()
+            if raw is None:
+                raise ConnectionError("server closed the websocket")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # Sent at the start of every script run, including runs triggered by st.rerun()
+                self.page_script_hash = msg.new_session.page_script_hash
+                self.widgets = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._collect(msg.delta.new_element)
+            elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    def _collect(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.errors.append(element.exception.message)
+        elif kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            # Widget ids end with the user key ("...-submit_3") or "-None" when no key was given
+            key = widget.id.rsplit("-", 1)[-1]
+            self.widgets[key if key != "None" else widget.label] = (widget.id, widget)
+
+    def _widget(self, name):
+        if name not in self.widgets:
+            raise ScriptError(f"widget {name!r} not on page; errors: {self.errors[-1:]}")
+        return self.widgets[name]
+
+    def _set(self, name, **value):
+        widget_id, _ = self._widget(name)
+        state = self.values.setdefault(widget_id, WidgetState(id=widget_id))
+        for field, v in value.items():
+            setattr(state, field, v)
+
+    def choose(self, name, option):
+        _, widget = self._widget(name)
+        self._set(name, int_value=list(widget.options).index(option))
+
+    def choose_index(self, name, index):
+        self._set(name, int_value=index)
+
+    def type(self, name, text):
+        self._set(name, string_value=text)
+
+    async def click(self, name):
+        widget_id, _ = self._widget(name)
+        await self.rerun(triggers=[widget_id])
+
+
+async def exam_session(url, n, questions, timings, failures, finished, hold):
+    """One user: open the app, take the test, save it and review it"""
+    rng = random.Random(n)
+    email = f"load{n:05d}@example.com"
+    session = Session(url)
+
+    async def step(name, action):
+        start = time.perf_counter()
+        await action
+        timings[name].append(time.perf_counter() - start)
+
+    try:
+        await step("open", session.connect())
+        session.choose("Go to", "Take Test")
+        await step("open_take_test", session.rerun())
+        for q in range(questions):
+            session.choose_index(str(q), rng.randrange(4))
+            await step("submit_answer", session.click(f"submit_{q}"))
+            await step("next_question", session.click(f"next_{q}"))
+        if "save_email" in session.widgets:
+            session.type("save_email", email)
+            await step("save_results", session.click("Save Test Results"))
+        session.choose("Go to", "Review History")
+        await step("open_review_history", session.rerun())
+        session.type("view_email", email)
+        await step("load_review_history", session.rerun())
+        failures.extend(session.errors)
+    except Exception as e:
+        failures.append(f"{type(e).__name__}: {e}")
+    finished.append(n)
+    # Keep the session connected until every session has finished so memory is read with all of them live
+    await hold.wait()
+    session.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+class Server:
+    def __init__(self, perf_log):
+        self.port = free_port()
+        self.perf_log = perf_log
+        self.proc = None
+
+    def __enter__(self):
+        env = dict(
+            os.environ,
+            AZURE_STORAGE_CONNECTION_STRING="memory://loadtest",
+            PERF_JSONL_PATH=self.perf_log,
+        )
+        self.proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", "test.py",
+                "--server.port", str(self.port),
+                "--server.headless", "true",
+                "--server.enableCORS", "false",
+                "--server.enableXsrfProtection", "false",
+                "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false",
+            ],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1) as r:
+                    if r.status == 200:
+                        return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("streamlit server did not become healthy")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+
+def storage_calls(perf_log):
+    counts = Counter()
+    if os.path.exists(perf_log):
+        with open(perf_log) as f:
+            for line in f:
+                name = json.loads(line)["span"]
+                if name.startswith("storage."):
+                    counts[name] += 1
+    return dict(counts)
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2), "max_ms": round(ms.max(), 2)}
+
+
+async def run_level(concurrency, questions):
+    with tempfile.TemporaryDirectory() as tmp:
+        perf_log = os.path.join(tmp, "perf.jsonl")
+        with Server(perf_log) as server:
+            # One warm-up session loads the question bank so it is not charged to the measured sessions
+            warm = Session(server.url)
+            await warm.connect()
+            warm.close()
+            await asyncio.sleep(0.5)
+            open(perf_log, "w").close()
+            rss_before = rss_bytes(server.proc.pid)
+
+            timings, failures, finished = defaultdict(list), [], []
+            hold = asyncio.Event()
+            start = time.perf_counter()
+            tasks = [
+                asyncio.ensure_future(exam_session(server.url, n, questions, timings, failures, finished, hold))
+                for n in range(concurrency)
+            ]
+            # Sessions park on `hold` when they are done; wait until every one has got there
+            while len(finished) < concurrency:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - start
+            rss_after = rss_bytes(server.proc.pid)
+            hold.set()
+            await asyncio.gather(*tasks)
+            # Give the server a moment to flush the last spans
+            await asyncio.sleep(0.5)
+            calls = storage_calls(perf_log)
+
+    interactions = sum(len(v) for v in timings.values())
+    all_samples = [s for v in timings.values() for s in v]
+    return {
+        "concurrency": concurrency,
+        "questions": questions,
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_s": round(concurrency / elapsed, 3),
+        "interactions": interactions,
+        "interactions_per_s": round(interactions / elapsed, 1),
+        "latency": percentiles(all_samples) if all_samples else None,
+        "latency_by_interaction": {name: percentiles(v) for name, v in timings.items() if v},
+        "server_rss_mb": {
+            "before": round(rss_before / 2**20, 1) if rss_before else None,
+            "after": round(rss_after / 2**20, 1) if rss_after else None,
+            "per_session": round((rss_after - rss_before) / concurrency / 2**20, 2) if rss_before and rss_after else None,
+        },
+        "storage_calls": calls,
+        "failures": len(failures),
+        "failure_samples": failures[:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,5,10,25,50,100", help="comma separated session counts")
+    parser.add_argument("--questions", type=int, default=100, help="questions answered per session (100 completes the test)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = []
+    for level in [int(x) for x in args.levels.split(",")]:
+        result = asyncio.run(run_level(level, args.questions))
+        report.append(result)
+        latency = result["latency"] or {}
+        print(
+            f"{level:>5} sessions  {result['sessions_per_s']:>7} sess/s  {result['interactions_per_s']:>8} int/s  "
+            f"p50 {latency.get('p50_ms')} ms  p95 {latency.get('p95_ms')} ms  p99 {latency.get('p99_ms')} ms  "
+            f"{result['server_rss_mb']['per_session']} MB/session  storage {result['storage_calls']}  "
+            f"failures {result['failures']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(r["failures"] for r in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""Time the question sampling, storage and Review History hot paths.
+
+    python -m benchmarks.run                        # quick preset, writes benchmarks/results/<timestamp>.json
+    python -m benchmarks.run --preset full
+    python -m benchmarks.run --baseline benchmarks/results/old.json --threshold 0.25
+
+With --baseline the run exits non-zero when any benchmark's median got slower
+than the baseline by more than the threshold (and by more than --min-delta-ms,
+so microsecond noise does not fail a run).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+
+import activity
+import adaptive
+import banks
+import charts
+import confusion
+import exam_balance
+import grading
+import live
+from analytics import (
+    flatten_answers, heatmap_table, question_coverage, response_times, scores_frame,
+    section_group_stats, summary_metrics,
+)
+from benchmarks.synthetic import SyntheticBank
+from exam_pool import ExamReservoir
+from history import HOT_ATTEMPTS, fold
+from question_bank import build_personalized_pool, current_bank, get_question_pool, history_profile, load_bank
+import shared_cache
+from search import SearchIndex
+from storage import DIRECTORY_BLOB, StorageManager, results_blob_name, shard_of, user_key
+
+# Full-scan scaling runs on a backend that sleeps this long per call
+SCAN_LATENCY_MS = 5
+SCAN_USERS = 200
+ACTIVITY_DAYS = 30
+# Paper exam versions the graded answer sheets are spread over
+SHEET_SEEDS = 10
+# Throughput counts printed after a result's time
+COUNTS = (("backend_calls", "backend calls"), ("answers_per_s", "answers/s"), ("exams_per_s", "exams/s"))
+# Callers asking for the same history at once (a user's tabs, an admin on the same user)
+BURST_CALLERS = 16
+
+PRESETS = {
+    "quick": {"history_sizes": [1, 10, 100], "users": 1_000, "sheets": 1_000, "exams": 200_000, "repeat": 5},
+    "full": {"history_sizes": [1, 10, 100, 1_000, 10_000], "users": 100_000, "sheets": 10_000, "exams": 2_000_000, "repeat": 3},
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def timeit(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "mean_s": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+def fresh_storage():
+    """A StorageManager on its own in-memory container"""
+    return StorageManager(f"memory://bench-{uuid.uuid4().hex}")
+
+
+def populate_users(storage, n):
+    """n users with empty histories in the sharded layout, directories included"""
+    directories = {}
+    for i in range(n):
+        email = f"user{i:06d}@example.com"
+        key = user_key(email)
+        directories.setdefault(shard_of(key), {})[key] = email
+        storage.container_client.get_blob_client(results_blob_name(email)).upload_blob(b"[]", overwrite=True)
+    for shard, directory in directories.items():
+        storage.write_json(DIRECTORY_BLOB.format(shard=shard), directory)
+
+
+def burst(fn, n):
+    """Run fn on n threads released at the same moment"""
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(n) as pool:
+        for future in [pool.submit(call) for _ in range(n)]:
+            future.result()
+
+
+def review_history(results, test):
+    """The aggregation steps the Review History page runs for one user"""
+    summary_metrics(results)
+    scores_frame(results)
+    df_all = flatten_answers(results)
+    df_all['group'] = df_all['group'].astype(int)
+    heatmap_table(flatten_answers(results))
+    section_group_stats(df_all)
+    question_coverage(df_all, test)
+    response_times(df_all)
+
+
+def run(preset, seed=0):
+    config = PRESETS[preset]
+    repeat = config["repeat"]
+    out = {}
+
+    # Parsing the workbook (what the first process pays) vs mapping the Arrow copy it leaves behind
+    shared_cache.ENABLED = False
+    out["read_excel"] = timeit(load_bank, repeat)
+    shared_cache.ENABLED = True
+    load_bank()
+    out["read_excel[shared cache]"] = timeit(load_bank, repeat)
+    bank = current_bank()
+    test = bank.test
+    out["get_question_pool"] = timeit(lambda: get_question_pool(test), repeat * 4)
+
+    # A restart served from a warm reservoir; the worker is given time to refill between pops
+    reservoir = ExamReservoir(bank, standard_size=repeat * 4)
+    while len(reservoir._standard) < reservoir.standard_size:
+        time.sleep(0.01)
+    out["exam_pool.pop_standard"] = timeit(reservoir._standard.popleft, repeat * 4)
+    reservoir.close()
+    out["search_index.build"] = timeit(lambda: SearchIndex.from_frame(test), repeat)
+    index = SearchIndex.from_frame(test)
+    out["search_index.search"] = timeit(lambda: index.search("freq modul"), repeat * 20)
+
+    item_bank = adaptive.ItemBank(test)
+    out["adaptive.item_bank"] = timeit(lambda: adaptive.ItemBank(test), repeat)
+
+    def adaptive_exam():
+        session = adaptive.AdaptiveSession(item_bank, seed=seed)
+        item = session.next_item()
+        while item is not None:
+            session.record(item, True)
+            item = session.next_item()
+    out["adaptive.full_exam"] = timeit(adaptive_exam, repeat)
+
+    synthetic = SyntheticBank(test, seed=seed)
+    rng = np.random.default_rng(seed)
+    new_attempt = synthetic.attempt(rng, 0.0, datetime(2025, 6, 1))
+
+    document_store = shared_cache.DocumentStore(os.path.join(tempfile.mkdtemp(), "documents.sqlite"))
+    for size in config["history_sizes"]:
+        history = synthetic.history(rng, size)
+        email = "bench@example.com"
+
+        # Save is a read-modify-write of the whole history, so it is measured at each size
+        storage = fresh_storage()
+
+        def reset():
+            storage.container_client.get_blob_client(
+                results_blob_name(email)
+            ).upload_blob(json.dumps(history), overwrite=True)
+
+        out[f"storage.save_test_result[history={size}]"] = timeit(
+            lambda: storage.save_test_result(email, new_attempt), repeat, setup=reset
+        )
+        reset()
+        out[f"storage.get_test_results[history={size}]"] = timeit(
+            lambda: storage.get_test_results(email), repeat
+        )
+        # Another process already downloaded this history: a properties call and a SQLite read
+        cached_storage = StorageManager(storage.connection_string, cache=document_store)
+        cached_storage.get_test_results(email)
+        out[f"storage.get_test_results[history={size}, shared cache]"] = timeit(
+            lambda: cached_storage.get_test_results(email), repeat
+        )
+
+        if size > HOT_ATTEMPTS:
+            # Compacted: the last HOT_ATTEMPTS tests in full, the rest as a rollup
+            compacted = fresh_storage()
+            compacted.container_client.get_blob_client(results_blob_name(email)).upload_blob(json.dumps(history), overwrite=True)
+            compacted.compact_results(email, lambda cold, results: fold(cold, results, bank.question_ids))
+            label = f"history={size}, compacted to {HOT_ATTEMPTS}"
+            out[f"storage.get_test_results[{label}]"] = timeit(lambda: compacted.get_test_results(email), repeat)
+            merged = compacted.get_test_results(email)
+            out[f"personalized.build[{label}]"] = timeit(
+                lambda: build_personalized_pool(bank, history_profile(merged, bank), "Practice Weak Areas"), repeat
+            )
+
+        profile = history_profile(history, bank)
+        out[f"personalized.build[history={size}]"] = timeit(
+            lambda: build_personalized_pool(bank, history_profile(history, bank), "Practice Weak Areas"), repeat
+        )
+        out[f"personalized.from_profile[history={size}]"] = timeit(
+            lambda: build_personalized_pool(bank, profile, "Practice Weak Areas"), repeat
+        )
+
+        df_all = flatten_answers(history)
+        df_all['group'] = df_all['group'].astype(int)
+        out[f"analytics.flatten_answers[history={size}]"] = timeit(lambda: flatten_answers(history), repeat)
+        out[f"analytics.scores_frame[history={size}]"] = timeit(lambda: scores_frame(history), repeat)
+        out[f"analytics.heatmap_table[history={size}]"] = timeit(lambda: heatmap_table(flatten_answers(history)), repeat)
+        out[f"analytics.section_group_stats[history={size}]"] = timeit(lambda: section_group_stats(df_all), repeat)
+        out[f"analytics.question_coverage[history={size}]"] = timeit(lambda: question_coverage(df_all, test), repeat)
+        out[f"analytics.response_times[history={size}]"] = timeit(lambda: response_times(df_all), repeat)
+        out[f"analytics.review_history[history={size}]"] = timeit(lambda: review_history(history, test), repeat)
+
+        # First render of the Review History charts vs a rerun from an unrelated widget
+        spec = banks.get_spec()
+        out[f"charts.score_trend[history={size}]"] = timeit(
+            lambda: charts.score_trend("bench", history, spec), repeat, setup=charts._figures.clear
+        )
+        out[f"charts.score_trend[history={size}, cached]"] = timeit(lambda: charts.score_trend("bench", history, spec), repeat)
+        out[f"charts.section_heatmap[history={size}]"] = timeit(
+            lambda: charts.section_heatmap("bench", history), repeat, setup=charts._figures.clear
+        )
+        out[f"charts.section_heatmap[history={size}, cached]"] = timeit(lambda: charts.section_heatmap("bench", history), repeat)
+
+        # What a save adds to the confusion table vs recounting the history, and the admin view read off the table
+        table = confusion.from_answers(df_all, test)
+        attempt_df = confusion.with_options(flatten_answers([new_attempt]), test)
+        out[f"confusion.add[attempt, table={size}]"] = timeit(lambda: table.add(attempt_df), repeat)
+        out[f"confusion.from_answers[history={size}]"] = timeit(lambda: confusion.from_answers(df_all, test), repeat)
+        out[f"confusion.most_confused[history={size}]"] = timeit(lambda: table.most_confused(test), repeat)
+
+    # Bulk grading of paper answer sheets, in answers per second (exams drawn once per seed, as a study group would)
+    sheets = [
+        {"email": f"user{i:06d}@example.com", "seed": i % SHEET_SEEDS, "question_ids": None, "timestamp": None,
+         "answers": list(rng.choice(list(grading.OPTION_LETTERS) + [""], size=bank.spec.exam_size))}
+        for i in range(config["sheets"])
+    ]
+    grading.grade_sheets(bank, sheets[:SHEET_SEEDS])
+    result = out[f"grading.grade_sheets[sheets={config['sheets']}]"] = timeit(lambda: grading.grade_sheets(bank, sheets), repeat)
+    result["answers_per_s"] = config["sheets"] * bank.spec.exam_size / result["median_s"]
+
+    # Exam balance simulation against made-up difficulties, one worker (process start included)
+    item_bank = adaptive.ItemBank(test, rng.normal(-0.8, 1.0, len(test)), stratify=bank.spec.stratify)
+    for strategy in exam_balance.STRATEGIES:
+        result = out[f"exam_balance.simulate[exams={config['exams']}, {strategy}, workers=1]"] = timeit(
+            lambda: exam_balance.simulate(item_bank, 0.0, (strategy,), config["exams"], workers=1, seed=seed), 1
+        )
+        result["exams_per_s"] = config["exams"] / result["median_s"]
+
+    # Publishing sits on the Submit click; reading is the admin's Live tab over a full buffer
+    bus = live.LiveBus()
+    for i in range(live.BUFFER_SIZE):
+        bus.publish(f"session{i % 500}", "bench", "basic", i % 100, i % 100, i % 70, 100)
+    out["live.publish"] = timeit(lambda: bus.publish("bench", "bench", "basic", 1, 1, 1, 100), repeat * 20)
+    out[f"live.sessions[buffer={live.BUFFER_SIZE}]"] = timeit(bus.sessions, repeat)
+
+    # Listing cost only depends on how many blobs exist, so the population uses tiny payloads
+    storage = fresh_storage()
+    populate_users(storage, config["users"])
+    out[f"storage.list_users[users={config['users']}]"] = timeit(storage.list_users, repeat)
+
+    # Per-shard workers against a backend with a round trip per call, like Azure
+    storage = StorageManager(f"memory://bench-{uuid.uuid4().hex}?latency_ms={SCAN_LATENCY_MS}")
+    populate_users(storage, SCAN_USERS)
+    for workers in (1, 4, 16):
+        label = f"users={SCAN_USERS}, {SCAN_LATENCY_MS}ms calls, workers={workers}"
+        out[f"storage.list_users[{label}]"] = timeit(lambda: storage.list_users(workers), repeat)
+        out[f"storage.map_users[{label}]"] = timeit(lambda: storage.map_users(storage.get_test_results, workers), 1)
+
+    # A burst of identical history reads: one download shared by all callers vs one each
+    storage = StorageManager(f"memory://bench-{uuid.uuid4().hex}?latency_ms={SCAN_LATENCY_MS}")
+    email = "bench@example.com"
+    storage.container_client.get_blob_client(results_blob_name(email)).upload_blob(
+        json.dumps(synthetic.history(rng, max(config["history_sizes"]))), overwrite=True
+    )
+    for single_flight in (False, True):
+        storage.single_flight = single_flight
+        label = f"callers={BURST_CALLERS}, {SCAN_LATENCY_MS}ms calls, single_flight={'on' if single_flight else 'off'}"
+        calls = storage.container_client.calls
+        result = out[f"storage.get_test_results[{label}]"] = timeit(
+            lambda: burst(lambda: storage.get_test_results(email), BURST_CALLERS), repeat
+        )
+        result["backend_calls"] = (storage.container_client.calls - calls) / repeat
+
+    # A month of activity; a range query reads one rollup per day, a rebuild reads every event
+    storage = StorageManager(f"memory://bench-{uuid.uuid4().hex}")
+    spec = banks.get_spec()
+    rng = np.random.default_rng(seed)
+    end = datetime.now().date() - timedelta(days=activity.SETTLE_DAYS + 1)
+    for day in range(ACTIVITY_DAYS):
+        for user in np.flatnonzero(rng.random(SCAN_USERS) < 0.3):
+            timestamp = datetime.combine(end - timedelta(days=day), datetime.min.time()) + timedelta(minutes=int(user))
+            result = {"timestamp": timestamp.isoformat(), "score": int(rng.integers(40, 100)), "total": 100}
+            activity.record_attempt(storage, spec, f"user{user:06d}@example.com", result)
+    storage.container_client.latency = SCAN_LATENCY_MS / 1000
+    start = end - timedelta(days=ACTIVITY_DAYS - 1)
+    label = f"days={ACTIVITY_DAYS}, users={SCAN_USERS}, {SCAN_LATENCY_MS}ms calls"
+    out[f"activity.rollup_range[{label}]"] = timeit(lambda: activity.rollup_range(storage, start, end), 1)
+    out[f"activity.daily_rollups[{label}]"] = timeit(lambda: activity.daily_rollups(storage, start, end), repeat)
+
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, threshold, min_delta_s):
+    """Names of benchmarks whose median regressed past the threshold"""
+    regressions = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_s"], result["median_s"]
+        if after > before * (1 + threshold) and after - before > min_delta_s:
+            regressions.append((name, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction (default 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "preset": args.preset,
+            "seed": args.seed,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": run(args.preset, seed=args.seed),
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    width = max(len(name) for name in report["results"])
+    for name, result in report["results"].items():
+        counts = "".join(f"  {result[key]:,.0f} {label}" for key, label in COUNTS if key in result)
+        print(f"{name:<{width}}  {result['median_s'] * 1000:10.3f} ms{counts}")
+    print(f"\nWrote {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(report["results"], baseline, args.threshold, args.min_delta_ms / 1000)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
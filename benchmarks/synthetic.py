@@ -0,0 +1,100 @@
+"""Synthetic users and test histories built from the real question bank.
+
+Histories have the same shape as the records saved by test.py, so they can be
+pushed through StorageManager and the analytics helpers unchanged.
+"""
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class SyntheticBank:
+    """Question bank laid out as plain arrays for fast exam generation"""
+
+    def __init__(self, test, seed=0):
+        rng = np.random.default_rng(seed)
+        self.sections = test['Section'].astype(str).to_numpy()
+        self.groups = test['Group'].astype(str).to_numpy()
+        self.question_ids = test['question_id'].astype(str).to_numpy()
+        text = test[[
+            'question_english',
+            'correct_answer_english',
+            'incorrect_answer_1_english',
+            'incorrect_answer_2_english',
+            'incorrect_answer_3_english',
+        ]].to_numpy()
+        self.questions = text[:, 0]
+        self.correct = text[:, 1]
+        self.incorrect = text[:, 2:]
+        # Each question gets a fixed difficulty so weak areas look consistent across attempts
+        self.difficulty = rng.normal(-0.5, 1.0, len(test))
+
+        codes = test.groupby(['Section', 'Group']).ngroup().to_numpy()
+        order = np.argsort(codes, kind='stable')
+        self._order = order
+        self._starts = np.searchsorted(codes[order], np.arange(codes.max() + 1))
+        self._sizes = np.bincount(codes)
+
+    def exam_indices(self, rng):
+        """One random question per section/group, shuffled - like get_question_pool"""
+        picks = self._starts + (rng.random(len(self._sizes)) * self._sizes).astype(int)
+        idx = self._order[picks]
+        rng.shuffle(idx)
+        return idx
+
+    def attempt(self, rng, ability, timestamp):
+        idx = self.exam_indices(rng)
+        p_correct = 1 / (1 + np.exp(self.difficulty[idx] - ability))
+        is_correct = rng.random(len(idx)) < p_correct
+        wrong_pick = rng.integers(0, 3, len(idx))
+        position = rng.integers(0, 4, len(idx))
+        # Right-skewed like real response times: mostly 10-40 s, some long thinks and quick guesses
+        time_ms = np.minimum(rng.lognormal(np.log(20_000), 0.6, len(idx)), 600_000).astype(int)
+
+        answers = []
+        for k, q in enumerate(idx):
+            ok = bool(is_correct[k])
+            answers.append({
+                "section": self.sections[q],
+                "group": self.groups[q],
+                "question": self.questions[q],
+                "question_id": self.question_ids[q],
+                "selected": self.correct[q] if ok else self.incorrect[q, wrong_pick[k]],
+                "selected_option": 0 if ok else int(wrong_pick[k]) + 1,
+                "position": int(position[k]),
+                "correct": self.correct[q],
+                "is_correct": ok,
+                "time_ms": int(time_ms[k]),
+            })
+        score = int(is_correct.sum())
+        return {
+            "timestamp": timestamp.isoformat(),
+            "score": score,
+            "total": len(answers),
+            "answers": answers,
+        }
+
+    def history(self, rng, n_attempts, start=None):
+        """n_attempts results for one user whose ability improves over time"""
+        start = start or datetime(2025, 1, 1)
+        ability = rng.normal(0.0, 1.0)
+        step = timedelta(hours=6)
+        results = []
+        for i in range(n_attempts):
+            results.append(self.attempt(rng, ability + 1.5 * i / max(n_attempts, 1), start + i * step))
+        return results
+
+
+def attempts_per_user(rng, n_users, min_attempts=1, max_attempts=10_000):
+    """Log-uniform attempt counts - most users take a few tests, a handful take thousands"""
+    low, high = math.log(min_attempts), math.log(max_attempts + 1)
+    return np.exp(rng.uniform(low, high, n_users)).astype(int).clip(min_attempts, max_attempts)
+
+
+def generate_users(bank, n_users, min_attempts=1, max_attempts=10_000, seed=0):
+    """Yield (email, history) pairs lazily so very large populations fit in memory"""
+    rng = np.random.default_rng(seed)
+    counts = attempts_per_user(rng, n_users, min_attempts, max_attempts)
+    for i, n in enumerate(counts):
+        yield f"user{i:06d}@example.com", bank.history(rng, int(n))
@@ -0,0 +1,128 @@
+"""Score-trend and heatmap figures, memoized per user and history version.
+
+Reruns from unrelated widgets (picking a test to review, a date filter on
+another chart) hand back the stored figure JSON instead of rebuilding the
+figure from the history.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.express as px
+
+import analytics
+import perf
+
+# Figures kept per process - the least recently shown are dropped first
+MAX_FIGURES = int(os.getenv("CHART_CACHE_SIZE", "256"))
+
+# Reference line colour/dash and heatmap hover footer for each page that shows these charts
+STYLES = {
+    "review": {"pass": ("green", "solid"), "honours": ("blue", "solid"), "extra": "<extra>Click to see questions</extra>"},
+    "admin": {"pass": ("red", "solid"), "honours": ("green", "dash"), "extra": "<extra></extra>"},
+}
+
+_figures = OrderedDict()
+_lock = threading.Lock()
+
+
+def history_version(results):
+    """Changes whenever a test is saved - results are only ever appended"""
+    return len(results), results[-1]['timestamp'] if results else None
+
+
+def _cached(key, build):
+    with _lock:
+        figure = _figures.get(key)
+        if figure is not None:
+            _figures.move_to_end(key)
+    if figure is None:
+        with perf.span("charts.build") as span:
+            figure = build().to_json()
+            span.bytes = len(figure)
+        with _lock:
+            _figures[key] = figure
+            while len(_figures) > MAX_FIGURES:
+                _figures.popitem(last=False)
+    else:
+        perf.record("charts.hit", 0.0, len(figure))
+    return json.loads(figure)
+
+
+def score_trend(user, results, spec, view="review", window=None):
+    """Bar chart of every test's score with the bank's pass/honours lines; window is an optional (start, end) date range"""
+    def build():
+        scores_df = analytics.scores_frame(results, spec.pass_mark, spec.honours_mark)
+        if window is not None:
+            start_date, end_date = window
+            scores_df = scores_df[
+                (scores_df['timestamp'].dt.date >= start_date) &
+                (scores_df['timestamp'].dt.date <= end_date)
+            ]
+        fig = px.bar(
+            scores_df,
+            x='test_number',
+            y='score',
+            labels={'test_number': 'Test Number', 'score': 'Score (%)'},
+            title='Test Scores Over Time' if view == "review" else f'Test Scores Over Time - {user}',
+            hover_data={'timestamp': '|%Y-%m-%d %H:%M:%S'},
+            text='score',  # Show data labels
+            color='color',  # Use our color column
+            color_discrete_map="identity"  # Use the colors as defined
+        )
+
+        # Add reference lines first (they'll be in the background)
+        style = STYLES[view]
+        lines = [("Pass", spec.pass_mark, style["pass"]), ("Honours", spec.honours_mark, style["honours"])]
+        for label, mark, (color, dash) in lines:
+            if mark is not None:
+                fig.add_hline(
+                    y=mark * 100,
+                    line_dash=dash,
+                    line_color=color,
+                    annotation_text=f"{label} ({mark:.0%})",
+                    annotation_position="right",
+                    layer="below"  # Put it behind bars
+                )
+
+        fig.update_layout(
+            yaxis_range=[0, 100],
+            showlegend=False
+        )
+        fig.update_traces(
+            textposition='inside',  # Place labels inside the bars
+            texttemplate='%{text}%'  # Add % symbol to labels
+        )
+        return fig
+
+    return _cached(("score_trend", view, spec.key, user, history_version(results), window), build)
+
+
+def section_heatmap(user, results, view="review", window=None):
+    """Percent correct per section/group over the last `window` tests (all of them when None)"""
+    def build():
+        recent = results[-window:] if window else results
+        pivot_table, annotation_text = analytics.heatmap_table(analytics.flatten_answers(recent))
+        fig = px.imshow(
+            pivot_table,
+            labels=dict(x="Group", y="Section", color="% Correct"),
+            aspect="auto",
+            color_continuous_scale=["red", "orange", "yellow", "green", "blue"],
+            range_color=[0, 100]
+        )
+        fig.update_traces(
+            text=annotation_text,
+            texttemplate="%{text}",
+            textfont={"size": 10},
+            hoverongaps=False,
+            hovertemplate="Section: %{y}<br>" +
+                          "Group: %{x}<br>" +
+                          "Score: %{z:.1f}%<br>" +
+                          STYLES[view]["extra"]
+        )
+        if view == "review":
+            fig.update_layout(dragmode="select")
+        return fig
+
+    return _cached(("section_heatmap", view, user, history_version(results), window), build)
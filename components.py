@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+import streamlit as st
+
+import mastery
+
+PAGE_SIZE = 24
+
+
+@lru_cache(maxsize=4096)
+def _card_markdown(question_id, question, answer):
+    return (
+        f"**Question {question_id}**\n\n"
+        f"{question}\n\n"
+        f"**Answer:** {answer}"
+    )
+
+
+@lru_cache(maxsize=4096)
+def _list_markdown(question_id, question, answer):
+    return (
+        f"**Question {question_id}**  \n"
+        f"**Question:** {question}  \n"
+        f"**Answer:** {answer}"
+    )
+
+
+def _page_window(total, key, page_size):
+    """Start/stop rows for the page picked in this list's pager"""
+    pages = max(1, -(-total // page_size))
+    page_key = f"{key}_page"
+    # The list can shrink between reruns (new search, other group) - never point past its end
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = 1
+    page = 1
+    if pages > 1:
+        page = st.number_input(
+            f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key
+        )
+    start = (page - 1) * page_size
+    return start, min(start + page_size, total)
+
+
+def _fragments(questions, render):
+    return [
+        render(str(q.question_id), str(q.question_english), str(q.correct_answer_english))
+        for q in questions[['question_id', 'question_english', 'correct_answer_english']].itertuples(index=False)
+    ]
+
+
+def question_cards(questions, key, columns=3, page_size=PAGE_SIZE):
+    """Bank rows as a grid of cards, one page at a time and one markdown element per column"""
+    start, stop = _page_window(len(questions), key, page_size)
+    fragments = _fragments(questions.iloc[start:stop], _card_markdown)
+    if len(questions) > page_size:
+        st.caption(f"Showing {start + 1}-{stop} of {len(questions)} questions")
+
+    cols = st.columns(columns)
+    for j, col in enumerate(cols):
+        column_cards = fragments[j::columns]
+        if column_cards:
+            col.markdown("---\n\n" + "\n\n---\n\n".join(column_cards) + "\n\n---")
+
+
+def question_list(questions, key, page_size=PAGE_SIZE):
+    """Bank rows as a single paginated list rendered with one markdown element"""
+    start, stop = _page_window(len(questions), key, page_size)
+    fragments = _fragments(questions.iloc[start:stop], _list_markdown)
+    if len(questions) > page_size:
+        st.caption(f"Showing {start + 1}-{stop} of {len(questions)} questions")
+    st.markdown("---\n\n" + "\n\n---\n\n".join(fragments))
+
+
+def readiness(state, bank):
+    """Pass/honours probability of a standard exam from the user's knowledge-tracing model"""
+    groups = mastery.bank_groups(bank.test)
+    ready = mastery.readiness(state, groups, bank.spec.pass_mark, bank.spec.honours_mark)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Pass probability", f"{ready['pass']:.0%}")
+    if ready['honours'] is not None:
+        col2.metric("Honours probability", f"{ready['honours']:.0%}")
+    col3.metric("Groups practiced", f"{ready['groups_practiced']}/{len(groups)}")
+    st.caption(f"Expected score on a standard exam: {ready['expected_score']:.0f}%, based on {state['answers']:,} answers across {state['attempts']} tests")
@@ -0,0 +1,171 @@
+"""Which wrong answers people pick, kept as a running count table per question bank"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import perf
+from question_bank import ANSWER_COLUMNS
+
+CONFUSION_BLOB = "analytics/confusion.json"
+N_OPTIONS = len(ANSWER_COLUMNS)  # option 0 is the correct answer, 1-3 the distractors
+# Questions answered fewer times than this are left out of the most-confused list
+MIN_ANSWERS = 5
+# Chi-square critical value for 3 degrees of freedom at 5% - chosen positions of four shuffled options should be uniform
+POSITION_BIAS_CHI2 = 7.815
+
+
+def with_options(answers_df, test):
+    """Answers with selected_option (0 = correct, 1-3 = incorrect_answer_N) and shown position (-1 when not recorded).
+
+    Newer answers carry both; for older ones the option is recovered by matching the
+    selected text against the question's answers, and the position is unknown.
+    """
+    df = answers_df.copy()
+    if 'selected_option' not in df:
+        df['selected_option'] = np.nan
+    if 'position' not in df:
+        df['position'] = np.nan
+    if 'selected' not in df:
+        df['selected'] = np.nan
+    missing = df['selected_option'].isna().to_numpy()
+    if missing.any():
+        options = test.set_index('question_id')[ANSWER_COLUMNS]
+        options = options[~options.index.duplicated()].reindex(df.loc[missing, 'question_id']).to_numpy()
+        selected = df.loc[missing, 'selected'].astype(str).to_numpy()[:, None]
+        matches = options == selected
+        df.loc[missing, 'selected_option'] = np.where(matches.any(axis=1), matches.argmax(axis=1), -1)
+    df['selected_option'] = df['selected_option'].astype(int)
+    df['position'] = df['position'].fillna(-1).astype(int)
+    return df
+
+
+class ConfusionTable:
+    """Per-question int32 counts of the option chosen and the position it was shown in.
+
+    Each saved test adds its answers, so the admin view reads a precomputed
+    table instead of scanning every user's history.
+    """
+
+    def __init__(self, question_ids=(), options=None, positions=None, answers=0, updated=None):
+        self.question_ids = list(question_ids)
+        self.index = {question_id: i for i, question_id in enumerate(self.question_ids)}
+        n = len(self.question_ids)
+        self.options = np.zeros((n, N_OPTIONS), np.int32) if options is None else np.asarray(options, np.int32).reshape(n, N_OPTIONS)
+        self.positions = np.zeros((n, N_OPTIONS), np.int32) if positions is None else np.asarray(positions, np.int32).reshape(n, N_OPTIONS)
+        self.answers = answers
+        self.updated = updated
+
+    def _rows(self, question_ids):
+        """Row of each question_id, adding rows for questions not seen before"""
+        new = [q for q in dict.fromkeys(question_ids) if q not in self.index]
+        if new:
+            for question_id in new:
+                self.index[question_id] = len(self.question_ids)
+                self.question_ids.append(question_id)
+            padding = np.zeros((len(new), N_OPTIONS), np.int32)
+            self.options = np.vstack([self.options, padding])
+            self.positions = np.vstack([self.positions, padding])
+        return np.fromiter((self.index[q] for q in question_ids), dtype=np.intp, count=len(question_ids))
+
+    @perf.timed("confusion.add")
+    def add(self, answers_df):
+        """Fold in answers that went through with_options()"""
+        df = answers_df[answers_df['question_id'].notna() & (answers_df['selected_option'] >= 0)]
+        if df.empty:
+            return self
+        rows = self._rows(df['question_id'].tolist())
+        np.add.at(self.options, (rows, df['selected_option'].to_numpy()), 1)
+        positions = df['position'].to_numpy()
+        shown = positions >= 0
+        np.add.at(self.positions, (rows[shown], positions[shown]), 1)
+        self.answers += len(df)
+        self.updated = datetime.now().isoformat()
+        return self
+
+    def to_json(self):
+        return {
+            "question_ids": self.question_ids,
+            "options": self.options.ravel().tolist(),
+            "positions": self.positions.ravel().tolist(),
+            "answers": self.answers,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["question_ids"], data["options"], data["positions"], data["answers"], data["updated"])
+
+    @perf.timed("confusion.most_confused")
+    def most_confused(self, test, limit=20):
+        """Questions where the wrong answers pile up on one distractor, most confused first"""
+        totals = self.options.sum(axis=1)
+        top = self.options[:, 1:].argmax(axis=1) + 1
+        top_count = self.options[np.arange(len(top)), top]
+        keep = totals >= MIN_ANSWERS
+        df = pd.DataFrame({
+            'question_id': np.asarray(self.question_ids, dtype=object)[keep],
+            'answers': totals[keep],
+            'wrong_percent': ((totals - self.options[:, 0]) / np.maximum(totals, 1) * 100)[keep].round(1),
+            'top_distractor': top[keep],
+            'distractor_percent': (top_count / np.maximum(totals, 1) * 100)[keep].round(1),
+        })
+        df = df[df['distractor_percent'] > 0].sort_values(['distractor_percent', 'answers'], ascending=False).head(limit)
+
+        bank = test.drop_duplicates('question_id').set_index('question_id')
+        questions = bank.reindex(df['question_id'])
+        df['question'] = questions['question_english'].to_numpy()
+        df['correct'] = questions['correct_answer_english'].to_numpy()
+        distractors = questions[ANSWER_COLUMNS[1:]].to_numpy()
+        df['distractor'] = distractors[np.arange(len(df)), df['top_distractor'].to_numpy() - 1] if len(df) else []
+        return df[['question_id', 'question', 'correct', 'distractor', 'distractor_percent', 'wrong_percent', 'answers']]
+
+    def position_bias(self):
+        """How often each shown position is picked across all users, and a chi-square statistic against uniform"""
+        counts = self.positions.sum(axis=0)
+        total = counts.sum()
+        expected = total / N_OPTIONS
+        chi2 = float(((counts - expected) ** 2 / expected).sum()) if total else 0.0
+        df = pd.DataFrame({
+            'position': np.arange(1, N_OPTIONS + 1),
+            'answers': counts,
+            'percent': (counts / max(total, 1) * 100).round(1),
+        })
+        return df, chi2
+
+
+def from_answers(answers_df, test):
+    """Table built from scratch - used to rebuild from every user's history"""
+    table = ConfusionTable()
+    if not answers_df.empty:
+        table.add(with_options(answers_df, test))
+    return table
+
+
+def load(storage_mgr):
+    data = storage_mgr.read_json(CONFUSION_BLOB)
+    return ConfusionTable.from_json(data) if data else None
+
+
+def add_answers(storage_mgr, answers_df):
+    """Fold answers that went through with_options() into the stored table.
+
+    A conditional write: when another save lands in between, the answers are
+    added to its table instead of overwriting it.
+    """
+    def apply(data):
+        table = ConfusionTable.from_json(data) if data else ConfusionTable()
+        if not answers_df.empty:
+            table.add(answers_df)
+        return table.to_json()
+
+    return ConfusionTable.from_json(storage_mgr.update_json(CONFUSION_BLOB, apply))
+
+
+def record_attempt(storage_mgr, bank, result):
+    """Add a test that has just been saved to the stored table"""
+    answers = pd.DataFrame(result["answers"])
+    if not answers.empty:
+        answers['question_id'] = bank.question_ids(answers)
+        answers = with_options(answers, bank.test)
+    return add_answers(storage_mgr, answers)
@@ -0,0 +1,262 @@
+"""How much harder one generated exam can be than another - a Monte Carlo study of the exam sampler.
+
+    python exam_balance.py [--bank basic] [--exams 1000000] [--strategy stratified simple]
+                           [--email USER | --ability 0.5] [--workers 4] [--seed 0] [--json out.json]
+
+Draws --exams exams with each sampling strategy and scores every exam against
+the question difficulties of the stored calibration (the admin page's Adaptive
+Calibration tab). For each exam it works out the expected score and the chance
+of passing for a candidate of the given ability: the cohort's average candidate
+by default, a user's ability estimated from their history with --email, or
+--ability on the calibration's logit scale. The report is the spread of both
+across exams; a balanced sampler keeps it narrow.
+
+stratified is the app's sampler (one random question per section and group);
+simple draws the same number of questions from the whole bank. Add a sampler to
+STRATEGIES to compare another. Exams are drawn in fixed seeded chunks spread
+over a process pool, so a run gives the same numbers on any number of workers;
+the difficulties and bank layout are handed to the workers in shared memory.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+import adaptive
+import analytics
+import banks
+from question_bank import current_bank
+from storage import get_storage_manager
+
+load_dotenv()
+
+# Exams per task handed to a worker - fixed, so results don't depend on the worker count
+CHUNK_EXAMS = 250_000
+# Exams scored per array operation inside a task (bounds worker memory)
+BATCH_EXAMS = 4096
+# Histogram resolution of expected score (percent) and pass probability
+BINS = 1000
+PERCENTILES = (1, 5, 50, 95, 99)
+
+
+def _normal_sf(z):
+    """P(Z > z) for a standard normal (Abramowitz & Stegun 7.1.26, error below 1.5e-7)"""
+    x = np.abs(z) / math.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erfc = poly * np.exp(-x * x)
+    return np.where(z >= 0, 0.5 * erfc, 1 - 0.5 * erfc)
+
+
+def sample_stratified(rng, n_exams, layout):
+    """One question per section/group, like get_question_pool"""
+    u = rng.random((n_exams, len(layout["sizes"])))
+    return layout["order"][layout["offsets"] + (u * layout["sizes"]).astype(np.int64)]
+
+
+def sample_simple(rng, n_exams, layout):
+    """As many questions as the stratified exam, drawn from the whole bank"""
+    k = len(layout["sizes"])
+    return np.argpartition(rng.random((n_exams, len(layout["order"]))), k, axis=1)[:, :k]
+
+
+STRATEGIES = {"stratified": sample_stratified, "simple": sample_simple}
+
+
+def score_exams(p_correct, exams, pass_at):
+    """Expected number correct and pass probability of each exam (rows of question positions).
+
+    The number correct is a sum of independent Bernoullis; its tail is taken
+    from the normal approximation with a continuity correction, which is within
+    about a percentage point of exact for 50-100 question exams.
+    """
+    p = p_correct[exams]
+    mean = p.sum(axis=1)
+    sd = np.sqrt((p * (1 - p)).sum(axis=1))
+    return mean, _normal_sf((pass_at - 0.5 - mean) / np.maximum(sd, 1e-9))
+
+
+class _Histogram:
+    """Count, moments, extremes and a fixed-bin histogram of values in [0, 1] - merged across workers"""
+
+    def __init__(self):
+        self.counts = np.zeros(BINS + 1, dtype=np.int64)
+        self.total = 0.0
+        self.squares = 0.0
+        self.low = np.inf
+        self.high = -np.inf
+
+    def add(self, values):
+        self.counts += np.bincount(np.rint(np.clip(values, 0, 1) * BINS).astype(np.int64), minlength=BINS + 1)
+        self.total += float(values.sum())
+        self.squares += float((values * values).sum())
+        self.low = min(self.low, float(values.min()))
+        self.high = max(self.high, float(values.max()))
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.squares += other.squares
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        return self
+
+    def summary(self, scale=1.0):
+        n = int(self.counts.sum())
+        mean = self.total / n
+        cumulative = np.cumsum(self.counts)
+        out = {
+            "mean": round(mean * scale, 4),
+            "sd": round(math.sqrt(max(self.squares / n - mean * mean, 0.0)) * scale, 4),
+            "min": round(self.low * scale, 4),
+            "max": round(self.high * scale, 4),
+        }
+        for q in PERCENTILES:
+            out[f"p{q}"] = round(int(np.searchsorted(cumulative, q / 100 * n)) / BINS * scale, 4)
+        return out
+
+
+# Worker state: the shared arrays attached once per process
+_shared = {}
+
+
+def _attach(blocks):
+    """Pool initializer: map the arrays simulate() put in shared memory ({key: (name, shape, dtype)})"""
+    for key, (name, shape, dtype) in blocks.items():
+        block = shared_memory.SharedMemory(name=name)
+        _shared[key] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+
+def _layout():
+    sizes = _shared["sizes"][1]
+    return {"order": _shared["order"][1], "sizes": sizes, "offsets": np.cumsum(sizes) - sizes}
+
+
+def _run_chunk(strategy, n_exams, seed, pass_at):
+    rng = np.random.default_rng(seed)
+    layout = _layout()
+    p_correct = _shared["p_correct"][1]
+    n_questions = len(layout["sizes"])
+    scores, passes = _Histogram(), _Histogram()
+    for start in range(0, n_exams, BATCH_EXAMS):
+        exams = STRATEGIES[strategy](rng, min(BATCH_EXAMS, n_exams - start), layout)
+        mean, pass_probability = score_exams(p_correct, exams, pass_at)
+        scores.add(mean / n_questions)
+        passes.add(pass_probability)
+    return scores, passes
+
+
+def estimate_ability(item_bank, answers_df):
+    """Posterior mean ability on adaptive.THETA_GRID from answers with a question_id (N(0, 1) prior)"""
+    positions = pd.Series(np.arange(len(item_bank.question_ids)), index=item_bank.question_ids)
+    rows = positions[~positions.index.duplicated()].reindex(answers_df['question_id']).to_numpy(dtype=float)
+    known = ~np.isnan(rows)
+    if not known.any():
+        return 0.0
+    difficulty = item_bank.difficulty[rows[known].astype(int)]
+    correct = answers_df['is_correct'].to_numpy(dtype=bool)[known]
+    p = adaptive._sigmoid(adaptive.THETA_GRID[:, None] - difficulty[None, :])
+    log_posterior = -0.5 * adaptive.THETA_GRID ** 2 + np.where(correct, np.log(p), np.log1p(-p)).sum(axis=1)
+    posterior = np.exp(log_posterior - log_posterior.max())
+    return float(posterior @ adaptive.THETA_GRID / posterior.sum())
+
+
+def simulate(item_bank, ability=0.0, strategies=("stratified",), n_exams=1_000_000, workers=None, seed=0, pass_mark=adaptive.PASS_MARK):
+    """{strategy: {"exams", "score_percent": {...}, "pass_probability": {...}, "seconds"}} for a candidate of this ability"""
+    p_correct = adaptive._sigmoid(ability - item_bank.difficulty)
+    order = np.argsort(item_bank.group_codes, kind="stable").astype(np.int64)
+    sizes = np.bincount(item_bank.group_codes, minlength=item_bank.n_groups).astype(np.int64)
+    pass_at = int(np.ceil(pass_mark * item_bank.n_groups))
+    arrays = {"p_correct": p_correct.astype(np.float64), "order": order, "sizes": sizes}
+
+    blocks = {}
+    try:
+        for key, array in arrays.items():
+            block = blocks[key] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        specs = {key: (blocks[key].name, array.shape, array.dtype.str) for key, array in arrays.items()}
+        chunks = [min(CHUNK_EXAMS, n_exams - start) for start in range(0, n_exams, CHUNK_EXAMS)]
+        report = {}
+        with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_attach, initargs=(specs,)) as pool:
+            for strategy in strategies:
+                started = time.perf_counter()
+                # One seed stream per strategy, so adding a strategy doesn't change the others' numbers
+                seeds = np.random.SeedSequence([seed, list(STRATEGIES).index(strategy)]).spawn(len(chunks))
+                scores, passes = _Histogram(), _Histogram()
+                for chunk_scores, chunk_passes in pool.map(_run_chunk, [strategy] * len(chunks), chunks, seeds, [pass_at] * len(chunks)):
+                    scores.merge(chunk_scores)
+                    passes.merge(chunk_passes)
+                report[strategy] = {
+                    "exams": n_exams,
+                    "score_percent": scores.summary(100),
+                    "pass_probability": passes.summary(),
+                    "seconds": round(time.perf_counter() - started, 2),
+                }
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank", default=banks.DEFAULT_BANK, choices=sorted(banks.BANKS))
+    parser.add_argument("--exams", type=int, default=1_000_000)
+    parser.add_argument("--strategy", nargs="+", default=list(STRATEGIES), choices=sorted(STRATEGIES))
+    who = parser.add_mutually_exclusive_group()
+    who.add_argument("--email", help="simulate for this user's ability instead of the cohort's")
+    who.add_argument("--ability", type=float, help="ability on the calibration's logit scale (0 = cohort average)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    if args.exams < 1:
+        parser.error("--exams must be at least 1")
+
+    bank = current_bank(args.bank)
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+    calibration = storage_mgr.read_json(adaptive.CALIBRATION_BLOB)
+    if not calibration:
+        print("No calibration stored - every question counts as average and all exams come out the same. "
+              "Recalibrate on the admin page first.", file=sys.stderr)
+    item_bank = adaptive.item_bank(bank, calibration)
+
+    ability = args.ability or 0.0
+    if args.email:
+        answers = analytics.flatten_answers(storage_mgr.get_test_results(args.email.lower().strip()))
+        if answers.empty:
+            print(f"No stored answers for {args.email} - using the cohort average", file=sys.stderr)
+        else:
+            answers['question_id'] = bank.question_ids(answers)
+            ability = estimate_ability(item_bank, answers)
+
+    report = simulate(item_bank, ability, args.strategy, args.exams, args.workers, args.seed, bank.spec.pass_mark)
+    # The mean pass probability over random standard exams is known exactly - a check on the simulation
+    exact = float(np.interp(ability, adaptive.THETA_GRID, item_bank.pass_curve))
+    print(f"{bank.spec.name}: {args.exams:,} exams per strategy, ability {ability:+.2f}, "
+          f"pass mark {bank.spec.pass_mark:.0%}, P(pass) over random exams {exact:.3f}")
+    for strategy, result in report.items():
+        score, passing = result["score_percent"], result["pass_probability"]
+        print(f"\n{strategy} ({result['seconds']}s)")
+        print(f"  expected score %  mean {score['mean']:.1f}  sd {score['sd']:.2f}  "
+              f"p1 {score['p1']:.1f}  p50 {score['p50']:.1f}  p99 {score['p99']:.1f}  range {score['min']:.1f}-{score['max']:.1f}")
+        print(f"  pass probability  mean {passing['mean']:.3f}  sd {passing['sd']:.3f}  "
+              f"p1 {passing['p1']:.3f}  p50 {passing['p50']:.3f}  p99 {passing['p99']:.3f}  range {passing['min']:.3f}-{passing['max']:.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"bank": bank.spec.key, "version": bank.version, "ability": ability, "exact_pass": exact, "strategies": report}, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import perf
+from question_bank import build_personalized_pool, history_profile
+
+STANDARD_EXAMS = 8
+PERSONALIZED_USERS = 64
+PERSONALIZED_TTL = 600  # seconds - bounds staleness when another server process saved a newer test
+PERSONALIZED_TYPES = ("New Questions Only", "Practice Weak Areas")
+
+
+class ExamReservoir:
+    """Ready-made exams so Restart Test and Start Personalized Test are a pop instead of a build.
+
+    A daemon thread keeps up to STANDARD_EXAMS standard exams queued and builds
+    personalized exams for users who have recently been active. Personalized
+    entries remember only a small profile of the user's history (questions seen,
+    questions they are weak on), are dropped when the user saves a new test and
+    expire after PERSONALIZED_TTL. A build that was already running when the
+    test was saved is thrown away and run again on the new history. A reservoir belongs to one BankVersion;
+    a reloaded bank gets a new reservoir.
+    """
+
+    def __init__(self, bank, standard_size=STANDARD_EXAMS, max_users=PERSONALIZED_USERS):
+        self.bank = bank
+        self.standard_size = standard_size
+        self.max_users = max_users
+        self._standard = deque()
+        self._personalized = OrderedDict()  # email -> {"built": t, "exams": {test_type: (pool, message)}}
+        self._pending = {}  # email -> generation of its queued build, bumped by invalidate
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._work, name="exam-reservoir", daemon=True)
+        self._thread.start()
+        self._jobs.put(("standard", None))
+
+    def close(self):
+        self._closed = True
+        self._jobs.put(("stop", None))
+
+    def pop_standard(self):
+        try:
+            pool = self._standard.popleft()
+            perf.record("exam_pool.standard_hit", 0.0)
+        except IndexError:
+            perf.record("exam_pool.standard_miss", 0.0)
+            pool = self.bank.question_pool()
+        self._jobs.put(("standard", None))
+        return pool
+
+    def pop_personalized(self, email, test_type):
+        """(pool, message) built ahead of time, or None when nothing fresh is ready"""
+        with self._lock:
+            entry = self._personalized.get(email)
+            if entry is None or time.monotonic() - entry["built"] > PERSONALIZED_TTL:
+                perf.record("exam_pool.personalized_miss", 0.0)
+                return None
+            exam = entry["exams"].pop(test_type, None)
+            self._personalized.move_to_end(email)
+        perf.record("exam_pool.personalized_hit" if exam else "exam_pool.personalized_miss", 0.0)
+        return exam
+
+    def prefetch(self, email, load_history):
+        """Build this user's personalized exams in the background; load_history runs on the worker thread"""
+        with self._lock:
+            entry = self._personalized.get(email)
+            fresh = entry is not None and time.monotonic() - entry["built"] <= PERSONALIZED_TTL
+            if email in self._pending or (fresh and all(t in entry["exams"] for t in PERSONALIZED_TYPES)):
+                return
+            self._pending[email] = 0
+        self._jobs.put(("personalized", (email, load_history)))
+
+    def invalidate(self, email):
+        """The user's history changed - their prepared exams no longer match it"""
+        with self._lock:
+            self._personalized.pop(email, None)
+            if email in self._pending:
+                # A build in flight may have read the old history
+                self._pending[email] += 1
+
+    def _work(self):
+        while not self._closed:
+            kind, payload = self._jobs.get()
+            try:
+                if kind == "standard":
+                    while len(self._standard) < self.standard_size and not self._closed:
+                        with perf.span("exam_pool.build_standard"):
+                            self._standard.append(self.bank.question_pool())
+                elif kind == "personalized":
+                    self._build_personalized(*payload)
+            except Exception:
+                # A failed build only means the next click builds synchronously
+                pass
+
+    def _build_personalized(self, email, load_history):
+        stale = False
+        try:
+            with self._lock:
+                generation = self._pending[email]
+            with perf.span("exam_pool.build_personalized"):
+                profile = history_profile(load_history(), self.bank)
+                exams = {t: build_personalized_pool(self.bank, profile, t) for t in PERSONALIZED_TYPES}
+            with self._lock:
+                stale = self._pending[email] != generation
+                if not stale:
+                    self._personalized[email] = {"built": time.monotonic(), "exams": exams}
+                    self._personalized.move_to_end(email)
+                    while len(self._personalized) > self.max_users:
+                        self._personalized.popitem(last=False)
+        finally:
+            if stale:
+                # Saved while we were building - build again from the new history
+                perf.record("exam_pool.personalized_stale", 0.0)
+                self._jobs.put(("personalized", (email, load_history)))
+            else:
+                with self._lock:
+                    self._pending.pop(email, None)
+
+
+_reservoirs = {}
+_reservoir_lock = threading.Lock()
+
+
+def get_reservoir(bank):
+    """The process-wide reservoir for this version of a question bank - one per bank in use"""
+    with _reservoir_lock:
+        reservoir = _reservoirs.get(bank.spec.key)
+        if reservoir is None or reservoir.bank is not bank:
+            if reservoir is not None:
+                reservoir.close()
+            reservoir = _reservoirs[bank.spec.key] = ExamReservoir(bank)
+        return reservoir
@@ -0,0 +1,10 @@
+"""Session state keys of an exam in progress.
+
+Import-free, so the app shell (see session_memory.py) can name them without
+loading the exam page and its dependencies.
+"""
+
+# Per-question session keys, cleared whenever a new exam starts
+QUESTION_KEY_PREFIXES = ("shuffled_options_", "option_order_", "submitted_", "answered_", "shown_")
+# The rest of an exam's own state that grows with it
+EXAM_KEYS = ("question_pool", "answers")
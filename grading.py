@@ -0,0 +1,287 @@
+"""Grading and saving finished exams - shared by the Streamlit pages and the JSON API"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import activity
+import confusion
+import exam_pool
+import mastery
+import perf
+from question_bank import ANSWER_COLUMNS
+from storage import SHARDS, get_storage_manager
+
+# Letters printed next to the options of a paper exam, top to bottom
+OPTION_LETTERS = "ABCD"
+
+log = logging.getLogger(__name__)
+
+
+def shuffled_order(n_options=len(ANSWER_COLUMNS)):
+    """Display order of a question's options as indices into ANSWER_COLUMNS (0 is the correct answer)"""
+    order = list(range(n_options))
+    random.shuffle(order)
+    return order
+
+
+def answer_record(row, order, position, time_ms=None):
+    """The stored form of one answer: the option shown at `position` was picked from bank row `row`"""
+    selected_option = order[position]
+    selected = row[ANSWER_COLUMNS[selected_option]]
+    return {
+        "section": row['Section'],
+        "group": row['Group'],
+        "question": row['question_english'],
+        # Links the answer to its question even if the wording is edited later
+        "question_id": row['question_id'],
+        "selected": selected,
+        # 0 is the correct answer, 1-3 incorrect_answer_N; position is where it was shown (0 = top)
+        "selected_option": selected_option,
+        "position": position,
+        "correct": row['correct_answer_english'],
+        "is_correct": selected == row['correct_answer_english'],
+        "time_ms": time_ms
+    }
+
+
+def option_orders(n_questions, seed):
+    """Display order of every question's options on a paper exam - row i is question i's shuffled_order()"""
+    rng = np.random.default_rng(seed)
+    return rng.permuted(np.tile(np.arange(len(ANSWER_COLUMNS)), (n_questions, 1)), axis=1)
+
+
+def paper_exam(bank, seed):
+    """The exam and option orders printed for `seed` - the same seed gives the same paper for a bank version"""
+    pool = bank.question_pool(seed=seed)
+    return pool, option_orders(len(pool), seed)
+
+
+def grade_sheets(bank, sheets, storage_mgr=None, workers=len(SHARDS)):
+    """Grade answer sheets in one pass of array comparisons.
+
+    A sheet is {"email", "seed", "question_ids", "answers", "timestamp"}: answers
+    are the letters ticked (blank when left out) for the paper exam of `seed`,
+    or for the listed question_ids with their options in option_orders(n, seed)
+    order. Returns ([(email, result)], [(sheet number, error)], [sheet numbers
+    skipped]) - results in the form save_result stores, sheets that can't be
+    graded in the errors.
+
+    A timestamp must be ISO 8601 and is stored normalized (local time, no
+    offset, like the app's); sheets without one are stamped now. A user's tests
+    get distinct timestamps - the activity log is keyed by them - so a clash
+    moves the later sheet on by a microsecond. With storage_mgr, sheets whose
+    timestamp is already in the user's stored history are skipped, so grading a
+    file with timestamps again saves nothing twice.
+    """
+    stored = {}
+    if storage_mgr is not None:
+        emails = list({sheet["email"].lower().strip() for sheet in sheets})
+        with ThreadPoolExecutor(workers) as pool:
+            histories = pool.map(storage_mgr.get_test_results, emails)
+        stored = {email: {str(result.get("timestamp")) for result in history} for email, history in zip(emails, histories)}
+    test = bank.test
+    first = pd.Series(np.arange(len(test)), index=test['question_id'])
+    first = first[~first.index.duplicated()]
+    papers = {}
+    accepted, errors, skipped = [], [], []
+    question_ids, orders, letters, stamps = [], [], [], []
+    now = datetime.now()
+    taken = set()
+    for number, sheet in enumerate(sheets, 1):
+        try:
+            stamp = datetime.fromisoformat(str(sheet["timestamp"])) if sheet.get("timestamp") else now
+        except ValueError:
+            errors.append((number, f"timestamp {sheet['timestamp']!r} is not ISO 8601"))
+            continue
+        if stamp.tzinfo is not None:
+            stamp = stamp.astimezone().replace(tzinfo=None)
+        seed = sheet.get("seed")
+        if sheet.get("question_ids"):
+            ids = list(sheet["question_ids"])
+            order = option_orders(len(ids), seed or 0)
+        elif seed is not None:
+            if seed not in papers:
+                pool, order = paper_exam(bank, seed)
+                papers[seed] = (pool['question_id'].tolist(), order)
+            ids, order = papers[seed]
+        else:
+            errors.append((number, "needs a seed or question_ids"))
+            continue
+        if len(sheet["answers"]) != len(ids):
+            errors.append((number, f"{len(sheet['answers'])} answers for {len(ids)} questions"))
+            continue
+        unknown = [question_id for question_id in ids if question_id not in first.index]
+        if unknown:
+            errors.append((number, f"questions not in bank version {bank.version}: {', '.join(map(str, unknown[:5]))}"))
+            continue
+        email = sheet["email"].lower().strip()
+        while (email, stamp) in taken:
+            stamp += timedelta(microseconds=1)
+        taken.add((email, stamp))
+        if stamp.isoformat() in stored.get(email, ()):
+            skipped.append(number)
+            continue
+        accepted.append(sheet)
+        stamps.append(stamp.isoformat())
+        question_ids.extend(ids)
+        orders.append(order)
+        letters.extend(sheet["answers"])
+    if not accepted:
+        return [], errors, skipped
+
+    with perf.span("grading.grade_sheets"):
+        sizes = np.array([len(sheet["answers"]) for sheet in accepted])
+        sheet_of = np.repeat(np.arange(len(accepted)), sizes)
+        rows = first.reindex(question_ids).to_numpy()
+        orders = np.concatenate(orders)
+        position = pd.Series(letters, dtype=object).fillna("").astype(str).str.strip().str.upper().map(
+            {letter: i for i, letter in enumerate(OPTION_LETTERS)}
+        ).fillna(-1).astype(int).to_numpy()
+        answered = position >= 0
+        selected_option = np.where(answered, orders[np.arange(len(rows)), np.maximum(position, 0)], -1)
+        options = test[ANSWER_COLUMNS].to_numpy(dtype=object)[rows]
+        selected = options[np.arange(len(rows)), np.maximum(selected_option, 0)]
+        # Text comparison, as on the page - an option worded like the correct answer counts as correct
+        is_correct = answered & (selected == options[:, 0])
+        scores = np.bincount(sheet_of, weights=is_correct, minlength=len(accepted)).astype(int)
+
+        # Left-out questions count towards the total but store no answer, like questions a timed exam never reached
+        bank_rows = test.iloc[rows[answered]]
+        columns = {
+            "section": bank_rows['Section'].tolist(),
+            "group": bank_rows['Group'].tolist(),
+            "question": bank_rows['question_english'].tolist(),
+            "question_id": bank_rows['question_id'].tolist(),
+            "selected": selected[answered].tolist(),
+            "selected_option": selected_option[answered].tolist(),
+            "position": position[answered].tolist(),
+            "correct": options[answered, 0].tolist(),
+            "is_correct": is_correct[answered].tolist(),
+            "time_ms": [None] * int(answered.sum()),
+        }
+        answers = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        ends = np.cumsum(np.bincount(sheet_of[answered], minlength=len(accepted))).tolist()
+        results = [
+            (sheet["email"].lower().strip(), {
+                "timestamp": stamp,
+                "score": int(score),
+                "total": int(total),
+                "answers": answers[start:end],
+            })
+            for sheet, stamp, score, total, start, end in zip(accepted, stamps, scores, sizes, [0] + ends[:-1], ends)
+        ]
+    return results, errors, skipped
+
+
+def save_results(bank, results, workers=len(SHARDS)):
+    """save_result for many graded tests at once: one history write per user, users in parallel, one confusion update.
+
+    Returns (tests saved, names of the derived updates that failed for anyone).
+    As in save_result, only a failure to store the tests themselves raises.
+    """
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+    reservoir = exam_pool.get_reservoir(bank)
+    by_email = {}
+    for email, result in results:
+        by_email.setdefault(email.lower().strip(), []).append(prepare_result(result))
+
+    def save_user(email):
+        user_results = by_email[email]
+        storage_mgr.save_test_result(email, user_results)
+        # Their prepared personalized exams were built from the old history
+        reservoir.invalidate(email)
+        failed = set()
+        if not _derived_update("mastery", mastery.record_attempts, storage_mgr, email, user_results):
+            failed.add("mastery")
+        for result in user_results:
+            if not _derived_update("activity", activity.record_attempt, storage_mgr, bank.spec, email, result):
+                failed.add("activity")
+        return len(user_results), failed
+
+    def add_confusion():
+        answers = pd.DataFrame([answer for user_results in by_email.values() for result in user_results for answer in result["answers"]])
+        if not answers.empty:
+            confusion.add_answers(storage_mgr, confusion.with_options(answers, bank.test))
+
+    with perf.span("grading.save_results"):
+        with ThreadPoolExecutor(workers) as pool:
+            outcomes = list(pool.map(save_user, by_email))
+        saved = sum(count for count, _ in outcomes)
+        failed = set().union(*(names for _, names in outcomes))
+        if not _derived_update("confusion", add_confusion):
+            failed.add("confusion")
+    return saved, sorted(failed)
+
+
+def convert_to_serializable(obj):
+    if isinstance(obj, (datetime, pd.Timestamp)):
+        return obj.isoformat()
+    elif hasattr(obj, 'item'):  # numpy types
+        return obj.item()
+    elif pd.isna(obj):  # pandas NA/NaN
+        return None
+    elif hasattr(obj, '__dict__'):  # custom objects
+        return str(obj)
+    return obj
+
+
+def prepare_result(result):
+    """A copy of the result with every value JSON serializable"""
+    processed_result = {
+        "timestamp": convert_to_serializable(result["timestamp"]),
+        "score": int(result["score"]),
+        "total": int(result["total"]),
+        "answers": []
+    }
+    if result.get("time_limit_s"):
+        processed_result["time_limit_s"] = int(result["time_limit_s"])
+
+    # Process each answer
+    for answer in result["answers"]:
+        processed_answer = {}
+        for key, value in answer.items():
+            processed_answer[key] = convert_to_serializable(value)
+        processed_result["answers"].append(processed_answer)
+    return processed_result
+
+
+def _derived_update(name, update, *args):
+    """Run an update derived from a saved test; a failure is logged and counted, never raised.
+
+    The test is stored by then, so raising would only invite a retry that saves
+    it twice. Each derived store can be rebuilt from the histories.
+    """
+    try:
+        update(*args)
+        return True
+    except Exception:
+        log.exception("%s update failed after the test was saved", name)
+        perf.record(f"grading.{name}_failed", 0.0)
+        return False
+
+
+def save_result(bank, email, result):
+    """Store a finished exam and update everything derived from the user's history.
+
+    Returns (the stored result, names of the derived updates that failed). Only
+    a failure to store the test itself raises.
+    """
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+    processed_result = prepare_result(result)
+    email = email.lower().strip()
+    storage_mgr.save_test_result(email, processed_result)
+    updates = [
+        ("mastery", mastery.record_attempt, storage_mgr, email, processed_result),
+        ("confusion", confusion.record_attempt, storage_mgr, bank, processed_result),
+        ("activity", activity.record_attempt, storage_mgr, bank.spec, email, processed_result),
+    ]
+    failed = [name for name, update, *args in updates if not _derived_update(name, update, *args)]
+    # Their prepared personalized exams were built from the old history
+    reservoir = exam_pool.get_reservoir(bank)
+    reservoir.invalidate(email)
+    reservoir.prefetch(email, lambda: storage_mgr.get_test_results(email))
+    return processed_result, failed
@@ -0,0 +1,136 @@
+"""Two-tier user histories: recent tests in full, older ones folded into a small cold rollup.
+
+A compacted user's results blob starts with a marker entry and holds only the
+last few tests. Everything older lives in one cold document: each old test's
+score, plus answered/correct counts per question and per section/group.
+StorageManager.get_test_results merges the tiers into a History - a plain list
+of results, oldest first, where compacted tests keep their score but no
+answers - and analytics.flatten_answers adds the folded answers back as one
+row per answer, so coverage, weak areas, heatmaps and trends come out as
+before. Only answer-level detail of old tests (the chosen option, response
+time) is gone.
+"""
+import numpy as np
+import pandas as pd
+
+# Tests kept in full by the compaction job
+HOT_ATTEMPTS = 50
+
+
+def is_marker(entry):
+    return isinstance(entry, dict) and "compacted" in entry
+
+
+def empty():
+    return {"through": None, "attempts": [], "questions": {}, "groups": []}
+
+
+class History(list):
+    """A user's results, oldest first, with the cold rollup of the compacted ones attached.
+
+    A slice keeps the rollup only if it includes every compacted test - the
+    rollup can't be split by test.
+    """
+
+    def __init__(self, results=(), cold=None):
+        super().__init__(results)
+        self.cold = cold
+
+    def __getitem__(self, index):
+        value = super().__getitem__(index)
+        if not isinstance(index, slice):
+            return value
+        start, stop, step = index.indices(len(self))
+        compacted = len(self.cold["attempts"]) if self.cold else 0
+        whole = step == 1 and start == 0 and stop >= compacted
+        return History(value, self.cold if whole else None)
+
+
+def unfolded(hot, cold):
+    """The results in the blob (marker included) that the cold document doesn't hold yet.
+
+    Compaction folds the oldest entries, writes the cold document and then the
+    blob with a marker counting the tests folded so far. If the blob write never
+    happened, the cold document counts more tests than the marker; the surplus
+    are the first entries of the blob.
+    """
+    entries = [entry for entry in hot if not is_marker(entry)]
+    if cold is None:
+        return entries
+    marked = hot[0]["compacted"]["attempts"] if hot and is_marker(hot[0]) else 0
+    return entries[max(len(cold["attempts"]) - marked, 0):]
+
+
+def merge(hot, cold):
+    """One History from the results blob (marker included) and its cold document"""
+    entries = unfolded(hot, cold)
+    if cold is None:
+        return History(entries)
+    compacted = [
+        {"timestamp": timestamp, "score": score, "total": total, "time_limit_s": time_limit_s, "answers": [], "compacted": True}
+        for timestamp, score, total, time_limit_s in cold["attempts"]
+    ]
+    return History(compacted + entries, cold)
+
+
+def fold(cold, results, question_ids):
+    """Add full results (all of them - see unfolded) to the cold rollup; question_ids(answers_df) resolves each answer's question (BankVersion.question_ids)"""
+    cold = {**cold, "attempts": list(cold["attempts"]), "questions": dict(cold["questions"])}
+    if not results:
+        return cold
+    for r in results:
+        cold["attempts"].append([str(r["timestamp"]), r["score"], r["total"], r.get("time_limit_s")])
+    # Latest timestamp folded, for people reading the document - tests are matched by count, not by time
+    cold["through"] = max([str(r["timestamp"]) for r in results] + ([cold["through"]] if cold["through"] else []))
+
+    answers = pd.DataFrame([answer for r in results for answer in r["answers"]])
+    if answers.empty:
+        return cold
+    answers['question_id'] = question_ids(answers)
+    answers['is_correct'] = answers['is_correct'].astype(bool)
+
+    # Groups keep the type they were saved with (older tests stored them as text), like the full answers would
+    groups = {(section, group): [answered, correct] for section, group, answered, correct in cold["groups"]}
+    for (section, group), g in answers.groupby(['section', 'group'])['is_correct']:
+        answered, correct = groups.get((section, group), [0, 0])
+        groups[(section, group)] = [answered + int(g.size), correct + int(g.sum())]
+    cold["groups"] = [[section, _plain(group), answered, correct] for (section, group), (answered, correct) in groups.items()]
+    # Answers to questions no longer in the bank only count towards their section/group
+    resolved = answers[answers['question_id'].notna()]
+    for (question_id, section, group), g in resolved.groupby(['question_id', 'section', 'group'])['is_correct']:
+        _, _, answered, correct = cold["questions"].get(question_id, [section, group, 0, 0])
+        cold["questions"][question_id] = [section, _plain(group), answered + int(g.size), correct + int(g.sum())]
+    return cold
+
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def cold_answers(cold):
+    """The folded answers as answer rows (section, group, question_id, is_correct) - correct ones first within a question"""
+    rows = [(question_id, section, group, answered, correct) for question_id, (section, group, answered, correct) in cold["questions"].items()]
+    # Whatever a section/group holds beyond its questions' counts came from questions since removed
+    by_group = {}
+    for _, section, group, answered, correct in rows:
+        seen = by_group.setdefault((section, group), [0, 0])
+        seen[0] += answered
+        seen[1] += correct
+    for section, group, answered, correct in cold["groups"]:
+        seen_answered, seen_correct = by_group.get((section, group), [0, 0])
+        if answered > seen_answered:
+            rows.append((None, section, group, answered - seen_answered, correct - seen_correct))
+    if not rows:
+        return pd.DataFrame(columns=['section', 'group', 'question_id', 'is_correct'])
+
+    question_id, section, group, answered, correct = (np.array(column, dtype=object) for column in zip(*rows))
+    answered = answered.astype(int)
+    correct = correct.astype(int)
+    starts = np.cumsum(answered) - answered
+    rank = np.arange(answered.sum()) - np.repeat(starts, answered)
+    return pd.DataFrame({
+        'section': np.repeat(section, answered),
+        'group': np.repeat(group, answered),
+        'question_id': np.repeat(question_id, answered),
+        'is_correct': rank < np.repeat(correct, answered),
+    })
@@ -0,0 +1,51 @@
+"""In-process feed of exams in progress, for watching proctored sessions from the admin page.
+
+Test sessions publish a compact event on every submitted answer; the admin
+page reads the most recent ones. Events go into a fixed-size ring buffer, so
+publishing is a single append that never waits on a lock or on readers, and
+memory stays capped however many sessions there are. Only sessions served by
+this server process are seen.
+"""
+import itertools
+import os
+import time
+import uuid
+from collections import deque, namedtuple
+
+# Most recent events kept across all sessions (a few hundred bytes each)
+BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", "4096"))
+# Sessions with no event for this long are no longer shown as live
+ACTIVE_WINDOW_S = 15 * 60
+
+Event = namedtuple("Event", "seq time session label bank question answered correct total finished")
+
+
+class LiveBus:
+    def __init__(self, size=BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._seq = itertools.count(1)
+
+    def publish(self, session, label, bank, question, answered, correct, total, finished=False):
+        """O(1) and lock-free: the deque drops the oldest event once full"""
+        self._events.append(Event(next(self._seq), time.time(), session, label, bank, question, answered, correct, total, finished))
+
+    def events(self, since_seq=0):
+        """Buffered events newer than since_seq, oldest first"""
+        # copy() runs in C under the GIL, so a concurrent publish cannot interleave with it
+        return [event for event in self._events.copy() if event.seq > since_seq]
+
+    def sessions(self, window_s=ACTIVE_WINDOW_S):
+        """Latest event of every session heard from within the window, most recent first"""
+        cutoff = time.time() - window_s
+        latest = {}
+        for event in self.events():
+            if event.time >= cutoff:
+                latest[event.session] = event
+        return sorted(latest.values(), key=lambda event: event.time, reverse=True)
+
+
+bus = LiveBus()
+
+
+def new_session():
+    return uuid.uuid4().hex[:12]
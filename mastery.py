@@ -0,0 +1,132 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import perf
+from adaptive import HONOURS_MARK, PASS_MARK, score_distribution
+from storage import shard_of, user_key
+
+# Bayesian knowledge tracing parameters - guess is 1 in 4 for a four option question
+P_INIT = 0.3
+P_LEARN = 0.1
+P_SLIP = 0.1
+P_GUESS = 0.25
+# Per-answer decay of the recent-accuracy average (about the last 10 answers in a group matter)
+DECAY = 0.9
+
+
+def blob_name(email):
+    # Named by the same hashed user key as the results blob; a model missing after the switch is rebuilt from history
+    key = user_key(email)
+    return f"mastery/{shard_of(key)}/{key}.json"
+
+
+def group_key(section, group):
+    return f"{section}|{int(group)}"
+
+
+def p_correct(p_known):
+    return p_known * (1 - P_SLIP) + (1 - p_known) * P_GUESS
+
+
+def new_state():
+    return {"attempts": 0, "answers": 0, "updated": None, "groups": {}}
+
+
+@perf.timed("mastery.update")
+def update(state, result):
+    """Fold one saved test into the state - O(answers in that test)"""
+    groups = state["groups"]
+    for answer in result["answers"]:
+        key = group_key(answer["section"], answer["group"])
+        # [P(known), decayed correct, decayed count, answers seen]
+        p_known, correct, count, seen = groups.get(key, [P_INIT, 0.0, 0.0, 0])
+        if answer["is_correct"]:
+            evidence = p_known * (1 - P_SLIP) / p_correct(p_known)
+        else:
+            evidence = p_known * P_SLIP / (p_known * P_SLIP + (1 - p_known) * (1 - P_GUESS))
+        p_known = evidence + (1 - evidence) * P_LEARN
+        groups[key] = [
+            round(p_known, 6),
+            round(correct * DECAY + bool(answer["is_correct"]), 6),
+            round(count * DECAY + 1, 6),
+            seen + 1,
+        ]
+    state["attempts"] += 1
+    state["answers"] += len(result["answers"])
+    state["updated"] = datetime.now().isoformat()
+    return state
+
+
+def from_history(results):
+    state = new_state()
+    for result in results:
+        update(state, result)
+    return state
+
+
+def readiness(state, all_groups, pass_mark=PASS_MARK, honours_mark=HONOURS_MARK):
+    """Probability of passing / passing with honours a standard exam (one question per group)"""
+    p = np.array([
+        p_correct(state["groups"][key][0]) if key in state["groups"] else p_correct(P_INIT)
+        for key in all_groups
+    ])
+    dist = score_distribution(p)
+    n = len(all_groups)
+    return {
+        "pass": float(dist[int(np.ceil(pass_mark * n)):].sum()),
+        "honours": float(dist[int(np.ceil(honours_mark * n)):].sum()) if honours_mark else None,
+        "expected_score": float(p.mean() * 100),
+        "groups_practiced": sum(key in state["groups"] for key in all_groups),
+    }
+
+
+def group_table(state):
+    """Per section/group mastery (P(known)) and decayed recent accuracy, weakest first"""
+    rows = []
+    for key, (p_known, correct, count, seen) in state["groups"].items():
+        section, group = key.split("|")
+        rows.append({
+            "section": section,
+            "group": int(group),
+            "mastery": round(p_known * 100, 1),
+            "recent_accuracy": round(correct / count * 100, 1) if count else None,
+            "answers": seen,
+        })
+    return pd.DataFrame(rows, columns=["section", "group", "mastery", "recent_accuracy", "answers"]).sort_values("mastery")
+
+
+def bank_groups(test):
+    return [group_key(s, g) for s, g in test[['Section', 'Group']].drop_duplicates().itertuples(index=False)]
+
+
+def record_attempt(storage_mgr, email, result):
+    """Update the stored model with a test that has just been saved (conditionally, so a save from another tab isn't lost)"""
+    return record_attempts(storage_mgr, email, [result])
+
+
+def record_attempts(storage_mgr, email, results):
+    """record_attempt for several tests saved together - one conditional write"""
+    def apply(state):
+        if state is None:
+            # First time we see this user since mastery tracking started - replay what is stored once
+            return from_history(storage_mgr.get_test_results(email))
+        for result in results:
+            update(state, result)
+        return state
+
+    return storage_mgr.update_json(blob_name(email), apply)
+
+
+def load(storage_mgr, email, results=None):
+    """Stored model for the user, built from their history (and saved) if there is none yet"""
+    state = storage_mgr.read_json(blob_name(email))
+    if state is None:
+        if results is None:
+            results = storage_mgr.get_test_results(email)
+        if not results:
+            return None
+        state = from_history(results)
+        storage_mgr.write_json(blob_name(email), state)
+    return state
@@ -2,25 +2,25 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import json
-import os
 from glob import glob
-from functools import cache
-from storage import StorageManager
+from storage import get_storage_manager
+from question_bank import current_bank
+import activity
+import adaptive
+import banks
+import analytics
+import charts
+import components
+import confusion
+import live
+import perf
+import session_memory
 from dotenv import load_dotenv
 
 load_dotenv()
 
-storage_mgr = StorageManager(os.getenv('AZURE_STORAGE_CONNECTION_STRING'))
-
-@cache
-def read_excel():
-    study_guide = pd.read_excel("ham.xlsx", sheet_name="study guide", header=2)
-    test = pd.read_excel("ham.xlsx", sheet_name="test")
-    sections = study_guide["Section"].unique()
-    return study_guide, test, sections
-
-# Get test data
-study_guide, test, sections = read_excel()
+# Seconds between refreshes of the Live tab
+LIVE_REFRESH_S = 2
 
 # Hide the page from navigation
 st.set_page_config(
@@ -30,313 +30,404 @@ st.set_page_config(
    
 )
 
+# Get test data - each question bank keeps its own results
+bank_keys = banks.available_banks()
+bank_key = st.sidebar.selectbox(
+    "Question bank", bank_keys, format_func=lambda key: banks.BANKS[key].name
+) if len(bank_keys) > 1 else None
+bank = current_bank(bank_key)
+spec = bank.spec
+study_guide, test, sections = bank.study_guide, bank.test, bank.sections
+storage_mgr = get_storage_manager(prefix=spec.storage_prefix)
+
 st.title("Admin Dashboard")
 
-# Get all test result files
-emails = storage_mgr.list_users()
-
-if not emails:
-    st.warning("No test results found")
-else:
-    selected_email = st.selectbox("Select user to review:", emails)
-    results = storage_mgr.get_test_results(selected_email)
-    
-    # Add after loading results
-    if results:
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total Tests", len(results))
-        col2.metric("Average Score", f"{sum(r['score'] for r in results)/len(results):.1f}%")
-        col3.metric("Best Score", f"{max(r['score'] for r in results)}%")
-        col4.metric("Latest Score", f"{results[-1]['score']}%")
-    
-    # Create bar chart of scores over time
-    if results:
-        scores_df = pd.DataFrame([
-            {
-                'timestamp': pd.to_datetime(res['timestamp']),
-                'score': res['score'],
-                'test_number': f"Test {i+1}"
-            } for i, res in enumerate(results)
-        ])
-        scores_df = scores_df.sort_values('timestamp')
-        
-        # Add before creating scores_df
-        date_range = st.date_input(
-            "Filter by date range",
-            value=(scores_df['timestamp'].min().date(), scores_df['timestamp'].max().date()),
-            key="date_filter"
-        )
-        if len(date_range) == 2:
-            start_date, end_date = date_range
-            scores_df = scores_df[
-                (scores_df['timestamp'].dt.date >= start_date) & 
-                (scores_df['timestamp'].dt.date <= end_date)
-            ]
-        
-        # Create color array based on scores
-        scores_df['color'] = scores_df['score'].apply(
-            lambda x: 'lightblue' if x >= 80 
-            else 'lightgreen' if x >= 70 
-            else 'lightcoral'
-        )
-        
-        fig = px.bar(
-            scores_df,
-            x='test_number',
-            y='score',
-            labels={'test_number': 'Test Number', 'score': 'Score (%)'},
-            title=f'Test Scores Over Time - {selected_email}',
-            hover_data={'timestamp': '|%Y-%m-%d %H:%M:%S'},
-            text='score',
-            color='color',
-            color_discrete_map="identity"
-        )
-        
-        fig.add_hline(
-            y=70, 
-            line_dash="solid", 
-            line_color="red",
-            annotation_text="Pass (70%)",
-            annotation_position="right",
-            layer="below"
-        )
-        fig.add_hline(
-            y=80, 
-            line_dash="dash", 
-            line_color="green",
-            annotation_text="Honours (80%)",
-            annotation_position="right",
-            layer="below"
-        )
-        
-        fig.update_layout(
-            yaxis_range=[0, 100],
-            showlegend=False
-        )
-        fig.update_traces(
-            textposition='inside',
-            texttemplate='%{text}%'
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Overall summary stats
-        all_answers = [ans for res in results for ans in res['answers']]
-        df_all = pd.DataFrame(all_answers)
-        
-        if not df_all.empty:
-            # Create heatmap of section/group performance
-            st.subheader("Section/Group Breakdown - Heatmap")
-            df_all['group'] = pd.to_numeric(df_all['group'])
-            
-            pivot_table = df_all.pivot_table(
-                values='is_correct',
-                index='section',
-                columns='group',
-                aggfunc='mean'
-            ) * 100
-            
-            pivot_table = pivot_table.reindex(sorted(pivot_table.columns, key=int), axis=1)
-            
-            annotation_text = []
-            for idx in pivot_table.index:
-                row_annotations = []
-                for col in pivot_table.columns:
-                    val = pivot_table.loc[idx, col]
-                    row_annotations.append(f"{int(val)}" if not pd.isna(val) else "")
-                annotation_text.append(row_annotations)
-            
-            fig = px.imshow(
-                pivot_table,
-                labels=dict(x="Group", y="Section", color="% Correct"),
-                aspect="auto",
-                color_continuous_scale=["red", "orange", "yellow", "green", "blue"],
-                range_color=[0, 100]
-            )
-            
-            fig.update_traces(
-                text=annotation_text,
-                texttemplate="%{text}",
-                textfont={"size": 10},
-                hoverongaps=False,
-                hovertemplate="Section: %{y}<br>" +
-                            "Group: %{x}<br>" +
-                            "Score: %{z:.1f}%<br><extra></extra>"
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Question Coverage Analysis
-            st.subheader("Question Coverage Analysis")
-
-            # Get all unique questions answered by user
-            answered_questions = df_all[['section', 'group', 'question']].drop_duplicates()
-
-            # Create a dataframe of all possible questions from test bank
-            all_questions = test[['Section', 'Group', 'question_id', 'question_english']].copy()
-            all_questions.columns = ['section', 'group', 'question_id', 'question']
-
-            # Group by section and group to get totals
-            question_coverage = all_questions.groupby(['section', 'group']).agg({
-                'question': 'count'
-            }).reset_index()
-            question_coverage.columns = ['section', 'group', 'total_questions']
-
-            # Get count of answered questions by section and group
-            answered_counts = answered_questions.groupby(['section', 'group']).size().reset_index()
-            answered_counts.columns = ['section', 'group', 'answered_questions']
-
-            # Merge the counts
-            coverage_stats = question_coverage.merge(
-                answered_counts, 
-                on=['section', 'group'], 
-                how='left'
-            ).fillna(0)
-
-            coverage_stats['answered_questions'] = coverage_stats['answered_questions'].astype(int)
-            coverage_stats['remaining_questions'] = coverage_stats['total_questions'] - coverage_stats['answered_questions']
-            coverage_stats['coverage_percent'] = (coverage_stats['answered_questions'] / coverage_stats['total_questions'] * 100).round(1)
-
-            # Calculate overall statistics
-            total_questions_overall = coverage_stats['total_questions'].sum()
-            total_answered_overall = coverage_stats['answered_questions'].sum()
-            total_unanswered = total_questions_overall - total_answered_overall
-            overall_coverage = (total_answered_overall / total_questions_overall * 100).round(1)
-
-            # Display overall summary
-            st.info(
-                f"Overall Question Coverage: "
-                f"{total_answered_overall:,} of {total_questions_overall:,} questions answered "
-                f"({overall_coverage}% complete). "
-                f"**{total_unanswered:,} questions remaining.**"
-            )
+users_tab, live_tab, activity_tab, calibration_tab, distractors_tab, perf_tab = st.tabs(
+    ["Users", "Live", "Activity", "Adaptive Calibration", "Distractors", "Performance"]
+)
 
-            # Display coverage statistics
-            st.dataframe(
-                coverage_stats[[
-                    'section', 'group', 'total_questions', 'answered_questions', 
-                    'remaining_questions', 'coverage_percent'
-                ]].sort_values(['section', 'group']),
-                hide_index=True,
-                use_container_width=True,
-                column_config={
-                    'section': 'Section',
-                    'group': 'Group',
-                    'total_questions': 'Total Questions',
-                    'answered_questions': 'Questions Answered',
-                    'remaining_questions': 'Questions Remaining',
-                    'coverage_percent': st.column_config.NumberColumn(
-                        'Coverage %',
-                        format="%.1f%%"
-                    )
-                }
+with users_tab, perf.span("page.Admin"):
+    # Get all test result files
+    emails = storage_mgr.list_users()
+
+    if not emails:
+        st.warning("No test results found")
+    else:
+        selected_email = st.selectbox("Select user to review:", emails)
+        results = storage_mgr.get_test_results(selected_email)
+
+        # Add after loading results
+        if results:
+            metrics = analytics.summary_metrics(results)
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Total Tests", metrics["total_tests"])
+            col2.metric("Average Score", f"{metrics['average']:.1f}%")
+            col3.metric("Best Score", f"{metrics['best']}%")
+            col4.metric("Latest Score", f"{metrics['latest']}%")
+
+        # Create bar chart of scores over time
+        if results:
+            # Saved at whatever precision datetime.isoformat() gave (no microseconds at .000000), or imported as dates
+            timestamps = pd.to_datetime([res['timestamp'] for res in results], format="ISO8601")
+
+            # Limit the score chart to a date range
+            date_range = st.date_input(
+                "Filter by date range",
+                value=(timestamps.min().date(), timestamps.max().date()),
+                key="date_filter"
             )
+            window = tuple(date_range) if len(date_range) == 2 else None
+            st.plotly_chart(charts.score_trend(selected_email, results, spec, view="admin", window=window), use_container_width=True)
+
+            # Overall summary stats
+            df_all = analytics.flatten_answers(results)
+
+            if not df_all.empty:
+                df_all['question_id'] = bank.question_ids(df_all)
+                # Create heatmap of section/group performance
+                st.subheader("Section/Group Breakdown - Heatmap")
+                df_all['group'] = pd.to_numeric(df_all['group'])
+
+                fig = charts.section_heatmap(selected_email, results, view="admin")
 
-            # Add section to show unanswered questions
-            with st.expander("View Unanswered Questions", expanded=False):
-                # Get list of answered question texts
-                answered_texts = set(answered_questions['question'].unique())
-                
-                # Filter for unanswered questions - include full question details
-                unanswered = test[
-                    ~test['question_english'].isin(answered_texts)
-                ][['Section', 'Group', 'question_id', 'question_english', 'correct_answer_english']]
-                unanswered.columns = ['section', 'group', 'question_id', 'question', 'answer']
-                
-                if not unanswered.empty:
-                    # Add section/group selector for unanswered questions
-                    col1, col2 = st.columns(2)
-                    
-                    # Get unique sections that have unanswered questions
-                    sections_with_unanswered = sorted(unanswered['section'].unique())
-                    selected_section = col1.selectbox(
-                        "Select Section:", 
-                        sections_with_unanswered,
-                        key="unanswered_section"
+                st.plotly_chart(fig, use_container_width=True)
+
+                # Response times - how long each section takes, and how often answers look like guesses
+                times = analytics.response_times(df_all)
+                if not times.empty:
+                    st.subheader("Response Times by Section")
+                    st.dataframe(
+                        times,
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            'section': 'Section',
+                            'answers': 'Timed Answers',
+                            'median_s': st.column_config.NumberColumn('Median (s)', format="%.1f"),
+                            'p90_s': st.column_config.NumberColumn('90th Percentile (s)', format="%.1f"),
+                            'fast_percent': st.column_config.NumberColumn(
+                                f'Answered in < {analytics.GUESS_MS // 1000}s',
+                                format="%.1f%%",
+                                help="Very quick answers are often guesses"
+                            )
+                        }
                     )
-                    
-                    # Filter groups based on selected section
-                    groups_in_section = sorted(unanswered[unanswered['section'] == selected_section]['group'].unique())
-                    selected_group = col2.selectbox(
-                        "Select Group:",
-                        groups_in_section,
-                        key="unanswered_group"
+                    timed = df_all[df_all['time_ms'].notna()]
+                    fig = px.box(
+                        x=timed['section'],
+                        y=timed['time_ms'] / 1000,
+                        points=False,
+                        labels={'x': 'Section', 'y': 'Seconds per Question'},
+                        title='Time per Question by Section'
                     )
-                    
-                    # Get questions for selected section/group
-                    filtered_questions = unanswered[
-                        (unanswered['section'] == selected_section) & 
-                        (unanswered['group'] == selected_group)
-                    ]
-                    
-                    if not filtered_questions.empty:
-                        st.write(f"Found {len(filtered_questions)} unanswered questions:")
-                        for _, q in filtered_questions.iterrows():
-                            st.markdown(f"""
-                            ---
-                            **Question {q['question_id']}**  
-                            **Question:** {q['question']}  
-                            **Answer:** {q['answer']}
-                            """)
+                    st.plotly_chart(fig, use_container_width=True)
+
+                # Question Coverage Analysis
+                st.subheader("Question Coverage Analysis")
+
+                coverage_stats, answered_questions = analytics.question_coverage(df_all, test)
+
+                # Calculate overall statistics
+                total_questions_overall = coverage_stats['total_questions'].sum()
+                total_answered_overall = coverage_stats['answered_questions'].sum()
+                total_unanswered = total_questions_overall - total_answered_overall
+                overall_coverage = (total_answered_overall / total_questions_overall * 100).round(1)
+
+                # Display overall summary
+                st.info(
+                    f"Overall Question Coverage: "
+                    f"{total_answered_overall:,} of {total_questions_overall:,} questions answered "
+                    f"({overall_coverage}% complete). "
+                    f"**{total_unanswered:,} questions remaining.**"
+                )
+
+                # Display coverage statistics
+                st.dataframe(
+                    coverage_stats[[
+                        'section', 'group', 'total_questions', 'answered_questions', 
+                        'remaining_questions', 'coverage_percent'
+                    ]].sort_values(['section', 'group']),
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={
+                        'section': 'Section',
+                        'group': 'Group',
+                        'total_questions': 'Total Questions',
+                        'answered_questions': 'Questions Answered',
+                        'remaining_questions': 'Questions Remaining',
+                        'coverage_percent': st.column_config.NumberColumn(
+                            'Coverage %',
+                            format="%.1f%%"
+                        )
+                    }
+                )
+
+                # Add section to show unanswered questions
+                with st.expander("View Unanswered Questions", expanded=False):
+                    # Filter for unanswered questions - include full question details
+                    unanswered = test[~test['question_id'].isin(answered_questions['question_id'])]
+
+                    if not unanswered.empty:
+                        # Add section/group selector for unanswered questions
+                        col1, col2 = st.columns(2)
+
+                        # Get unique sections that have unanswered questions
+                        sections_with_unanswered = sorted(unanswered['Section'].unique())
+                        selected_section = col1.selectbox(
+                            "Select Section:", 
+                            sections_with_unanswered,
+                            key="unanswered_section"
+                        )
+
+                        # Filter groups based on selected section
+                        groups_in_section = sorted(unanswered[unanswered['Section'] == selected_section]['Group'].unique())
+                        selected_group = col2.selectbox(
+                            "Select Group:",
+                            groups_in_section,
+                            key="unanswered_group"
+                        )
+
+                        # Get questions for selected section/group
+                        filtered_questions = unanswered[
+                            (unanswered['Section'] == selected_section) & 
+                            (unanswered['Group'] == selected_group)
+                        ]
+
+                        if not filtered_questions.empty:
+                            st.write(f"Found {len(filtered_questions)} unanswered questions:")
+                            components.question_list(filtered_questions, key="unanswered_questions")
+                        else:
+                            st.info("No unanswered questions in this section/group!")
                     else:
-                        st.info("No unanswered questions in this section/group!")
-                else:
-                    st.success("This user has answered all questions in the test bank!")
-            
-            # Summary statistics table
-            st.subheader("Section/Group Performance")
-            stats = df_all.groupby(['section', 'group'])['is_correct'].agg([
-                ('correct', 'sum'),
-                ('total', 'count'),
-                ('percent', lambda x: (x.mean() * 100).round(1))
-            ]).reset_index()
-            stats['Summary'] = stats.apply(
-                lambda x: f"{int(x['correct'])}/{int(x['total'])} ({x['percent']}%)", 
-                axis=1
-            )
-            st.dataframe(
-                stats[['section', 'group', 'Summary', 'percent']].sort_values('percent', ascending=False),
-                hide_index=True,
-                use_container_width=True
-            )
-            
-            # Individual test selection
-            st.subheader("Individual Test Results")
-            test_options = [
-                f"Test on {res['timestamp']} - Score: {res['score']}/{res['total']} ({round(res['score']/res['total']*100)}%)"
-                for res in results
-            ]
-            selected_test = st.selectbox("Select a test to review:", test_options)
-            
-            test_idx = test_options.index(selected_test)
-            res = results[::-1][test_idx]
-            
-            df = pd.DataFrame(res['answers'])
-            df['Result'] = df['is_correct'].map({True: '✅ Correct', False: '❌ Incorrect'})
+                        st.success("This user has answered all questions in the test bank!")
+
+                # Summary statistics table
+                st.subheader("Section/Group Performance")
+                stats = analytics.add_summary_column(analytics.section_group_stats(df_all))
+                st.dataframe(
+                    stats[['section', 'group', 'Summary', 'percent']].sort_values('percent', ascending=False),
+                    hide_index=True,
+                    use_container_width=True
+                )
+
+                # Individual test selection
+                st.subheader("Individual Test Results")
+                # Compacted tests only kept their score
+                detailed = [res for res in results if not res.get("compacted")]
+                if len(detailed) < len(results):
+                    st.caption(f"{len(results) - len(detailed)} older tests are compacted into totals and not listed here")
+                test_options = [
+                    f"Test on {res['timestamp']} - Score: {res['score']}/{res['total']} ({round(res['score']/res['total']*100)}%)"
+                    for res in detailed
+                ]
+                selected_test = st.selectbox("Select a test to review:", test_options)
+
+                test_idx = test_options.index(selected_test)
+                res = detailed[::-1][test_idx]
+
+                df = pd.DataFrame(res['answers'])
+                df['Result'] = df['is_correct'].map({True: '✅ Correct', False: '❌ Incorrect'})
+                st.dataframe(
+                    df[["section", "group", "question", "Result", "selected", "correct"]],
+                    hide_index=True,
+                    use_container_width=True
+                )
+
+                # Add after the dataframe display
+                if st.button("Download User Data"):
+                    csv = df.to_csv(index=False)
+                    st.download_button(
+                        label="Download CSV",
+                        data=csv,
+                        file_name=f"test_results_{selected_email}.csv",
+                        mime="text/csv"
+                    )
+
+                # Add JSON download option
+                with st.expander("Download User Data - JSON"):
+                    # Read the JSON file
+                    json_data = storage_mgr.download_json(selected_email)
+
+                    st.download_button(
+                        label="Download JSON",
+                        data=json_data,
+                        file_name=f"test_results_{selected_email}.json",
+                        mime="application/json"
+                    )
+
+@st.fragment(run_every=LIVE_REFRESH_S)
+def live_sessions():
+    """Exams in progress on this server, refreshed without rerunning the rest of the page"""
+    sessions = [event for event in live.bus.sessions() if event.bank == spec.key]
+    if not sessions:
+        st.info(f"No exams in progress in the last {live.ACTIVE_WINDOW_S // 60} minutes")
+        return
+    now = pd.Timestamp.now().timestamp()
+    st.dataframe(
+        pd.DataFrame([
+            {
+                'user': event.label,
+                'progress': event.answered / event.total * 100 if event.total else 0,
+                'question': f"{event.answered}/{event.total}",
+                'score': round(event.correct / event.answered * 100) if event.answered else 0,
+                'status': "Saved" if event.finished else "Answered all" if event.answered >= event.total else "In progress",
+                'last_answer': f"{int(now - event.time)}s ago",
+            }
+            for event in sessions
+        ]),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'user': 'User',
+            'progress': st.column_config.ProgressColumn('Progress', format="%.0f%%", min_value=0, max_value=100),
+            'question': 'Answered',
+            'score': st.column_config.NumberColumn('Score So Far', format="%d%%"),
+            'status': 'Status',
+            'last_answer': 'Last Answer',
+        }
+    )
+
+
+with live_tab:
+    st.caption(f"Sessions on this server that answered a question in the last {live.ACTIVE_WINDOW_S // 60} minutes, refreshed every {LIVE_REFRESH_S} seconds. Users are named once they enter an email.")
+    live_sessions()
+
+with activity_tab:
+    # Reads one rollup per day, not every user's history
+    today = pd.Timestamp.today().date()
+    activity_range = st.date_input(
+        "Date range",
+        value=(today - pd.Timedelta(days=29), today),
+        max_value=today,
+        key="activity_range"
+    )
+    if len(activity_range) == 2:
+        rollups = activity.daily_rollups(storage_mgr, *activity_range)
+        summary = activity.range_summary(rollups)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Tests Taken", f"{summary['attempts']:,}")
+        col2.metric("Active Users", f"{summary['active_users']:,}")
+        col3.metric("Pass Rate", f"{summary['pass_rate']:.1f}%" if summary['attempts'] else "-")
+        col4.metric("Average Score", f"{summary['mean_score']:.1f}%" if summary['attempts'] else "-")
+
+        if summary['attempts']:
+            daily_df = activity.daily_frame(rollups)
+            fig = px.bar(daily_df, x='day', y=['passed', 'attempts'], barmode='overlay',
+                         labels={'day': 'Day', 'value': 'Tests', 'variable': ''})
+            st.plotly_chart(fig, use_container_width=True)
             st.dataframe(
-                df[["section", "group", "question", "Result", "selected", "correct"]],
+                daily_df,
                 hide_index=True,
-                use_container_width=True
+                use_container_width=True,
+                column_config={
+                    'day': st.column_config.DateColumn('Day'),
+                    'attempts': 'Tests',
+                    'passed': 'Passed',
+                    'timed': 'Timed',
+                    'mean_score': st.column_config.NumberColumn('Average Score', format="%.1f%%"),
+                    'active_users': 'Active Users',
+                    'pass_rate': st.column_config.NumberColumn('Pass Rate', format="%.1f%%"),
+                }
             )
-            
-            # Add after the dataframe display
-            if st.button("Download User Data"):
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    label="Download CSV",
-                    data=csv,
-                    file_name=f"test_results_{selected_email}.csv",
-                    mime="text/csv"
-                )
+        else:
+            st.info("No tests logged in this range")
+    st.caption("Tests saved before the activity log existed are added with `python storage_jobs.py backfill-activity`.")
+
+with calibration_tab:
+    calibration = storage_mgr.read_json(adaptive.CALIBRATION_BLOB)
+    if calibration:
+        st.info(f"Question difficulties last calibrated {calibration['created']} from {calibration['responses']:,} answers")
+    else:
+        st.info("Not calibrated yet - adaptive tests treat every question as average difficulty")
+    st.caption("Recalibrating reads every user's history, so run it occasionally rather than on every visit.")
+    if st.button("Recalibrate from all users"):
+        with st.spinner("Loading every user's history..."):
+            histories = storage_mgr.map_users(lambda email: analytics.flatten_answers(storage_mgr.get_test_results(email)))
+            answers = pd.concat(histories) if histories else pd.DataFrame()
+            if not answers.empty:
+                answers['question_id'] = bank.question_ids(answers)
+            calibration = adaptive.calibrate(test, answers)
+            storage_mgr.write_json(adaptive.CALIBRATION_BLOB, calibration)
+        st.success(f"Calibrated {len(calibration['difficulty'])} questions from {calibration['responses']:,} answers")
+
+with distractors_tab:
+    table = confusion.load(storage_mgr)
+    if table is None:
+        st.info("No answers counted yet - the table fills in as tests are saved, or rebuild it from the stored histories")
+    else:
+        st.caption(f"{table.answers:,} answers counted, last updated {table.updated}")
+
+        st.subheader("Most Confused Questions")
+        st.caption(f"Questions where one wrong answer draws the most picks (at least {confusion.MIN_ANSWERS} answers)")
+        st.dataframe(
+            table.most_confused(test),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'question_id': 'Question',
+                'question': 'Question Text',
+                'correct': 'Correct Answer',
+                'distractor': 'Most Picked Wrong Answer',
+                'distractor_percent': st.column_config.NumberColumn('Picked %', format="%.1f%%"),
+                'wrong_percent': st.column_config.NumberColumn('Wrong %', format="%.1f%%"),
+                'answers': 'Answers',
+            }
+        )
+
+        st.subheader("Answer Position")
+        positions, chi2 = table.position_bias()
+        if positions['answers'].sum():
+            # Options are shuffled, so without a bias every position is picked about a quarter of the time
+            fig = px.bar(positions, x='position', y='percent', text='percent',
+                         labels={'position': 'Position Shown (1 = top)', 'percent': 'Picked (%)'})
+            fig.add_hline(y=100 / confusion.N_OPTIONS, line_dash="dash", line_color="gray")
+            st.plotly_chart(fig, use_container_width=True)
+            if chi2 > confusion.POSITION_BIAS_CHI2:
+                st.warning(f"Users favour some positions over others (chi-square {chi2:.1f} > {confusion.POSITION_BIAS_CHI2})")
+            else:
+                st.success(f"No position bias detected (chi-square {chi2:.1f})")
+        else:
+            st.info("No answers with a recorded position yet")
+
+    st.caption("Rebuilding reads every user's history. Answers saved before positions were recorded only count towards the options table.")
+    if st.button("Rebuild from all users"):
+        with st.spinner("Loading every user's history..."):
+            histories = storage_mgr.map_users(lambda email: analytics.flatten_answers(storage_mgr.get_test_results(email)))
+            answers = pd.concat(histories) if histories else pd.DataFrame()
+            if not answers.empty:
+                answers['question_id'] = bank.question_ids(answers)
+            table = confusion.from_answers(answers, test)
+            storage_mgr.write_json(confusion.CONFUSION_BLOB, table.to_json())
+        st.success(f"Counted {table.answers:,} answers over {len(table.question_ids)} questions")
+        st.rerun()
+
+with perf_tab:
+    st.subheader("Session memory")
+    memory = session_memory.stats()
+    mib = lambda n: f"{n / 2**20:.1f} MiB"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Sessions", memory["sessions"], f"{memory['offloaded_sessions']} on disk", delta_color="off")
+    col2.metric("Exam state in memory", mib(memory["resident_bytes"]), f"budget {mib(memory['budget_bytes'])}" if memory["budget_bytes"] else "no budget", delta_color="off")
+    col3.metric("Largest session", mib(memory["largest_bytes"]))
+    col4.metric("Offloads / restores", f"{memory['evictions']} / {memory['restores']}", f"{mib(memory['offloaded_bytes'])} on disk", delta_color="off")
 
-            # Add JSON download option
-            with st.expander("Download User Data - JSON"):
-                # Read the JSON file
-                json_data = storage_mgr.download_json(selected_email)
-                
-                st.download_button(
-                    label="Download JSON",
-                    data=json_data,
-                    file_name=f"test_results_{selected_email}.json",
-                    mime="application/json"
-                )
\ No newline at end of file
+    st.caption("Timings from this server process since it started (or since the last reset). Percentiles cover the most recent samples of each span.")
+    rows = perf.snapshot()
+    if not rows:
+        st.info("No timings recorded yet")
+    else:
+        perf_df = pd.DataFrame(rows)
+        for title, prefixes in [
+            ("Reruns and pages", ("rerun", "page.")),
+            ("Storage calls", ("storage.",)),
+            ("Question bank and analytics", ("read_excel", "bank.", "search_index", "get_question_pool", "analytics.", "confusion.", "charts.", "activity.")),
+            ("Exam reservoir (hits are instant starts)", ("exam_pool.",)),
+            ("Session memory", ("session.",)),
+        ]:
+            section_df = perf_df[perf_df['span'].str.startswith(prefixes)]
+            if not section_df.empty:
+                st.subheader(title)
+                st.dataframe(section_df, hide_index=True, use_container_width=True)
+    if st.button("Reset timings"):
+        perf.reset()
+        st.rerun()
@@ -0,0 +1,129 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# Set PERF_ENABLED=0 to turn spans into no-ops, PERF_JSONL_PATH=<file> to also log every span
+ENABLED = os.getenv("PERF_ENABLED", "1") != "0"
+JSONL_PATH = os.getenv("PERF_JSONL_PATH")
+SAMPLES_PER_SPAN = 2048
+
+_lock = threading.Lock()
+_stats = {}
+_sink = None
+
+
+class SpanStats:
+    """Lifetime counters plus a ring buffer of the most recent samples for one span name"""
+
+    def __init__(self, size=SAMPLES_PER_SPAN):
+        self.durations = deque(maxlen=size)
+        self.sizes = deque(maxlen=size)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+
+    def add(self, seconds, nbytes):
+        self.durations.append(seconds)
+        self.count += 1
+        self.total_seconds += seconds
+        if nbytes is not None:
+            self.sizes.append(nbytes)
+            self.total_bytes += nbytes
+
+
+class Span:
+    """Times from construction to exit; set span.bytes to record a payload size"""
+    __slots__ = ("name", "start", "bytes")
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes = None
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start, self.bytes)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ("bytes",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def span(name):
+    if not ENABLED:
+        return _NoopSpan()
+    return Span(name)
+
+
+def timed(name):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, seconds, nbytes=None):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = SpanStats()
+        stats.add(seconds, nbytes)
+    if JSONL_PATH:
+        _write_jsonl(name, seconds, nbytes)
+
+
+def _write_jsonl(name, seconds, nbytes):
+    global _sink
+    line = json.dumps({"ts": time.time(), "span": name, "ms": round(seconds * 1000, 3), "bytes": nbytes, "pid": os.getpid()})
+    with _lock:
+        if _sink is None:
+            _sink = open(JSONL_PATH, "a", buffering=1)  # line buffered so readers see complete spans
+            atexit.register(_sink.close)
+        _sink.write(line + "\n")
+
+
+def snapshot():
+    """One row per span name with latency percentiles (ms) over the recent samples"""
+    # Only the admin page reports - recording spans must not pull numpy into a cold start
+    import numpy as np
+
+    with _lock:
+        items = [(name, list(s.durations), list(s.sizes), s.count, s.total_seconds, s.total_bytes) for name, s in _stats.items()]
+
+    rows = []
+    for name, durations, sizes, count, total_seconds, total_bytes in sorted(items):
+        ms = np.asarray(durations) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+        rows.append({
+            "span": name,
+            "count": count,
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "total_s": round(total_seconds, 3),
+            "avg_bytes": int(np.mean(sizes)) if sizes else None,
+            "total_bytes": total_bytes or None,
+        })
+    return rows
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+import analytics
+import banks
+import perf
+import shared_cache
+
+# Every bank keeps <workbook>.wording.json next to its workbook: each wording a question_id has had,
+# so answers saved before a wording fix still find their question.
+# Set BANK_WATCH=0 to load workbooks once and ignore later edits
+WATCH = os.getenv("BANK_WATCH", "1") != "0"
+# Editors and copies write a file in several steps - wait for it to settle before reloading
+RELOAD_DELAY = 1.0
+
+ANSWER_COLUMNS = ['correct_answer_english', 'incorrect_answer_1_english', 'incorrect_answer_2_english', 'incorrect_answer_3_english']
+
+
+def _answers_as_text(df):
+    """Excel turns some answers into numbers or times (e.g. a "4:1" ratio) - keep them as the text the page shows"""
+    for col in ANSWER_COLUMNS:
+        if col in df:
+            # Missing stays NaN (Arrow hands it back as None)
+            df[col] = df[col].map(lambda v: v if isinstance(v, str) else np.nan if pd.isna(v) else str(v))
+    return df
+
+
+def _update_wording(test, path):
+    """Record the current wording of every question and return {any wording ever seen: question_id}"""
+    try:
+        with open(path) as f:
+            wording = json.load(f)
+    except (OSError, ValueError):
+        wording = {"questions": {}, "aliases": {}}
+
+    current = dict(zip(test['question_id'].astype(str), test['question_english'].astype(str)))
+    changed = current != wording["questions"]
+    for question_id, text in wording["questions"].items():
+        if current.get(question_id, text) != text:
+            wording["aliases"][text] = question_id
+    wording["questions"] = current
+
+    if changed:
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(wording, f, indent=1, sort_keys=True)
+
+        try:
+            shared_cache.atomic_write(path, write)
+        except OSError:
+            pass  # read-only checkout - aliases still apply for this process
+    return {**wording["aliases"], **{text: question_id for question_id, text in current.items()}}
+
+
+def load_bank(spec=None):
+    """Parse the bank's workbook (or map the Arrow copy another process left) into a new BankVersion"""
+    spec = spec or banks.get_spec()
+    with perf.span("read_excel"):
+        # Parsed once per machine: other server processes map the Arrow copy instead of re-reading the workbook
+        version = shared_cache.file_version(spec.file)
+        frames = shared_cache.read_frames(f"bank-{spec.key}", version, ["study_guide", "test"])
+        if frames is not None:
+            study_guide, test = (_answers_as_text(df) for df in frames)
+        else:
+            study_guide = _answers_as_text(pd.read_excel(spec.file, sheet_name=spec.study_guide_sheet, header=spec.study_guide_header))
+            test = _answers_as_text(pd.read_excel(spec.file, sheet_name=spec.test_sheet))
+            shared_cache.write_frames(f"bank-{spec.key}", version, {"study_guide": study_guide, "test": test})
+    return BankVersion(spec, version, study_guide, test, _update_wording(test, spec.wording_file))
+
+
+class BankVersion:
+    """One load of a question bank and everything derived from it.
+
+    Never modified after it is published, so a rerun that picked up this
+    version keeps a consistent view even if a newer version is swapped in
+    halfway through.
+    """
+
+    def __init__(self, spec, version, study_guide, test, text_to_id):
+        self.spec = spec
+        self.version = version
+        self.study_guide = study_guide
+        self.test = test
+        self.sections = study_guide["Section"].unique()
+        self.text_to_id = text_to_id
+        self._search_index = None
+        self._lock = threading.Lock()
+
+    def search_index(self):
+        """Full-text index over this version of the bank, built on first use"""
+        if self._search_index is None:
+            from search import SearchIndex
+
+            with self._lock:
+                if self._search_index is None:
+                    with perf.span("search_index"):
+                        self._search_index = SearchIndex.from_frame(self.test)
+        return self._search_index
+
+    def question_ids(self, answers_df):
+        """question_id of each stored answer - saved with newer answers, looked up from the wording for older ones"""
+        if 'question' not in answers_df:
+            return answers_df['question_id']  # only folded answers from a compacted history, which all have one
+        by_text = answers_df['question'].astype(str).map(self.text_to_id)
+        if 'question_id' in answers_df:
+            return answers_df['question_id'].where(answers_df['question_id'].notna(), by_text)
+        return by_text
+
+    def question_pool(self, test_df=None, seed=None):
+        """A standard exam for this bank - from test_df when given (a personalized subset), else the whole bank.
+
+        The same seed draws the same exam from the same version of the bank (paper exams).
+        """
+        return get_question_pool(self.test if test_df is None else test_df, self.spec.stratify, seed)
+
+
+class BankLoader:
+    """Holds the current BankVersion of one registered bank and replaces it when the workbook changes"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.current = None
+        self._lock = threading.Lock()
+        self._observer = None
+        self._reload_timer = None
+
+    def get(self):
+        if self.current is None:
+            with self._lock:
+                if self.current is None:
+                    self.current = load_bank(self.spec)
+                    if WATCH:
+                        self._watch()
+        return self.current
+
+    def reload(self):
+        """Build the new version off to the side (indexes included) and swap it in with one assignment"""
+        with self._lock:
+            try:
+                if self.current is not None and shared_cache.file_version(self.spec.file) == self.current.version:
+                    return self.current
+                bank = load_bank(self.spec)
+                bank.search_index()
+            except Exception:
+                # Half-written or broken workbook - keep serving the version we have
+                perf.record("bank.reload_failed", 0.0)
+                return self.current
+            self.current = bank
+        perf.record("bank.reloaded", 0.0)
+        return bank
+
+    def _schedule_reload(self):
+        if self._reload_timer is not None:
+            self._reload_timer.cancel()
+        self._reload_timer = threading.Timer(RELOAD_DELAY, self.reload)
+        self._reload_timer.daemon = True
+        self._reload_timer.start()
+
+    def _watch(self):
+        """Reload when the workbook is modified or replaced (watching the folder catches saves that rename over it)"""
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        loader = self
+
+        class BankFileHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = {getattr(event, "src_path", None), getattr(event, "dest_path", None)}
+                if loader.spec.file in {os.path.abspath(p) for p in paths if p}:
+                    loader._schedule_reload()
+
+        try:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.schedule(BankFileHandler(), os.path.dirname(self.spec.file), recursive=False)
+            self._observer.start()
+        except Exception:
+            self._observer = None  # no inotify etc. - the bank then only changes on restart, as before
+
+
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def current_bank(key=None):
+    """The latest BankVersion of a registered bank (the default one if no key) - loaded on first use only"""
+    spec = banks.get_spec(key)
+    if spec.key not in _loaders:
+        with _loaders_lock:
+            _loaders.setdefault(spec.key, BankLoader(spec))
+    return _loaders[spec.key].get()
+
+
+def read_excel(key=None):
+    """Load the study guide and test sheets from the question bank workbook"""
+    bank = current_bank(key)
+    return bank.study_guide, bank.test, bank.sections
+
+
+@perf.timed("get_question_pool")
+def get_question_pool(test_df, stratify=("Section", "Group"), seed=None):
+    rng = None if seed is None else np.random.default_rng(seed)
+    # For each section and group, pick one random question
+    pool = (
+        test_df.groupby(list(stratify))
+        .apply(lambda x: x.sample(1, random_state=rng))
+        .reset_index(drop=True)
+    )
+    pool = pool.sample(frac=1, random_state=rng).reset_index(drop=True)  # Shuffle
+    return pool
+
+
+def history_profile(results, bank):
+    """The parts of a user's history the personalized tests need: question_ids seen and scored below the pass mark on"""
+    df_all = analytics.flatten_answers(results)
+    if df_all.empty:
+        return {"has_history": bool(results), "answered": frozenset(), "weak": frozenset()}
+
+    df_all['question_id'] = bank.question_ids(df_all)
+    question_stats = df_all.groupby('question_id')['is_correct'].agg(['mean', 'count']).reset_index()
+    return {
+        "has_history": True,
+        "answered": frozenset(df_all['question_id'].dropna()),
+        "weak": frozenset(question_stats[question_stats['mean'] < bank.spec.pass_mark]['question_id']),
+        "answer_count": len(df_all),
+    }
+
+
+def build_personalized_pool(bank, profile, test_type):
+    """Exam for one of the personalized test types, with the message to show the user as (level, text)"""
+    test = bank.test
+    exam_size = bank.spec.exam_size
+    if test_type == "Standard Random Test":
+        return bank.question_pool(), None
+
+    if not profile["has_history"]:
+        if test_type == "New Questions Only":
+            return bank.question_pool(), ("success", "No test history found - all questions will be new!")
+        return bank.question_pool(), ("info", "No test history found. Using standard random test.")
+
+    if test_type == "New Questions Only":
+        # Get questions user hasn't seen
+        available_questions = test[~test['question_id'].isin(profile["answered"])].copy()
+        if len(available_questions) >= exam_size:
+            return bank.question_pool(available_questions), ("success", f"Found {len(available_questions)} unasked questions available!")
+        # Add random questions to make up the difference
+        additional_questions = test.sample(n=exam_size-len(available_questions))
+        combined_questions = pd.concat([available_questions, additional_questions])
+        return bank.question_pool(combined_questions), (
+            "warning", f"Only {len(available_questions)} unasked questions available. Adding some random questions to complete the test."
+        )
+
+    if not profile.get("answer_count"):
+        return bank.question_pool(), ("info", "No test history found. Using standard random test.")
+
+    # Get questions user performed poorly on
+    weak_pool = test[test['question_id'].isin(profile["weak"])].copy()
+    if len(weak_pool) >= exam_size // 2:
+        return bank.question_pool(weak_pool), ("success", f"Found {len(weak_pool)} questions you can improve on!")
+    # Add random questions to make up the difference
+    additional_questions = test.sample(n=exam_size-len(weak_pool))
+    combined_questions = pd.concat([weak_pool, additional_questions])
+    return bank.question_pool(combined_questions), (
+        "warning", f"Only {len(weak_pool)} questions found for practice. Adding some random questions to complete the test."
+    )
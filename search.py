@@ -0,0 +1,92 @@
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SEARCH_COLUMNS = [
+    'question_english',
+    'correct_answer_english',
+    'incorrect_answer_1_english',
+    'incorrect_answer_2_english',
+    'incorrect_answer_3_english',
+]
+MAX_PREFIX_EXPANSIONS = 64
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class SearchIndex:
+    """Inverted index over the question bank ranked with BM25.
+
+    Every query term is treated as a prefix ("freq" matches "frequency"), all
+    terms have to match, and the BM25 weight of every posting is computed once
+    at build time so a query is a handful of small numpy additions.
+    """
+
+    def __init__(self, doc_ids, texts, k1=1.2, b=0.75):
+        self.doc_ids = np.asarray(doc_ids)
+        n_docs = len(texts)
+
+        postings = {}
+        doc_len = np.zeros(n_docs)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc] = counts.get(doc, 0) + 1
+
+        avgdl = doc_len.mean() if n_docs else 0.0
+        self.terms = sorted(postings)
+        self.postings = {}
+        for term in self.terms:
+            docs = np.fromiter(postings[term].keys(), dtype=np.int32)
+            tf = np.fromiter(postings[term].values(), dtype=np.float64)
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            weight = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[docs] / avgdl))
+            self.postings[term] = (docs, weight)
+        self._n_docs = n_docs
+
+    @classmethod
+    def from_frame(cls, test):
+        texts = test[SEARCH_COLUMNS].astype(str).agg(" ".join, axis=1).tolist()
+        return cls(test['question_id'].tolist(), texts)
+
+    def _expand(self, prefix):
+        """Vocabulary terms starting with prefix"""
+        start = bisect_left(self.terms, prefix)
+        matches = []
+        for term in self.terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query, limit=None):
+        """Question ids matching every term of the query, best match first"""
+        return self.doc_ids[self.positions(query, limit)].tolist()
+
+    def positions(self, query, limit=None):
+        """Row positions (in the frame the index was built from) of the matches, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return np.array([], dtype=np.int64)
+
+        scores = np.zeros(self._n_docs)
+        matched = np.ones(self._n_docs, dtype=bool)
+        for prefix in terms:
+            hit = np.zeros(self._n_docs, dtype=bool)
+            for term in self._expand(prefix):
+                docs, weight = self.postings[term]
+                scores[docs] += weight
+                hit[docs] = True
+            matched &= hit
+
+        candidates = np.flatnonzero(matched)
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        if limit is not None:
+            order = order[:limit]
+        return order
@@ -0,0 +1,220 @@
+"""Memory accounting for the exam state Streamlit sessions keep, with a budget for the whole server process.
+
+Every rerun of the app reports how many bytes its session's exam state takes
+(track). When the sessions together go over the budget, the exam state of the
+sessions idle the longest is pickled to local disk and dropped from memory; the
+session's next rerun loads it back before the page runs (restore). Counters for
+the admin page's Performance tab come from stats().
+"""
+import glob
+import os
+import pickle
+import sys
+import threading
+import time
+import weakref
+
+import perf
+import shared_cache
+from exam_state import EXAM_KEYS, QUESTION_KEY_PREFIXES
+
+# Exam state summed per session (0 disables offloading)
+BUDGET_BYTES = int(float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256")) * 2**20)
+# Sessions active more recently than this are never offloaded - they are likely mid-question
+MIN_IDLE_S = 120
+OFFLOAD_DIR = os.path.join(shared_cache.CACHE_DIR, "sessions")
+# Set in an offloaded session: the file its exam state went to
+OFFLOAD_KEY = "_offloaded_exam"
+
+
+def _sizeof(value):
+    # Duck-typed, so the app shell doesn't have to import pandas and numpy to measure them
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def exam_keys(state):
+    return [key for key in state.filtered_state if key in EXAM_KEYS or key.startswith(QUESTION_KEY_PREFIXES)]
+
+
+class _Session:
+    def __init__(self, state):
+        # Weak, so a disconnected session's state can still be freed; the SessionState
+        # outlives every rerun's ScriptRunner, unlike the wrapper st.session_state hands out
+        self.state = weakref.ref(state)
+        self.bytes = 0
+        self.last_seen = time.time()
+        self.offloaded = None
+        self.lock = threading.Lock()
+
+
+_sessions = {}
+_lock = threading.Lock()
+_counters = {"evictions": 0, "restores": 0, "evicted_bytes": 0}
+_prepared = False
+
+
+def _remove_stale_files():
+    """Offloaded state of processes that are gone - Streamlit sessions do not survive a restart"""
+    for path in glob.glob(os.path.join(OFFLOAD_DIR, "*-*.pkl")):
+        pid = int(os.path.basename(path).split("-", 1)[0])
+        try:
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except (PermissionError, OSError):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _prepare():
+    """Create the offload folder and sweep stale files - once, on the first offload rather than at import"""
+    global _prepared
+    with _lock:
+        if _prepared:
+            return
+        os.makedirs(OFFLOAD_DIR, exist_ok=True)
+        _remove_stale_files()
+        _prepared = True
+
+
+def _current():
+    """(session id, its SessionState) for the rerun running on this thread, or (None, None) outside Streamlit"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None, None
+    return ctx.session_id, ctx.session_state._state
+
+
+def _entry(session_id, state):
+    with _lock:
+        entry = _sessions.get(session_id)
+        if entry is None or entry.state() is not state:
+            entry = _sessions[session_id] = _Session(state)
+        return entry
+
+
+def restore():
+    """Start of a rerun: bring back this session's exam state if it was offloaded"""
+    session_id, state = _current()
+    if state is None:
+        return
+    entry = _entry(session_id, state)
+    with entry.lock:
+        entry.last_seen = time.time()
+        path = state[OFFLOAD_KEY] if OFFLOAD_KEY in state else None
+        if path is None:
+            return
+        with perf.span("session.restore"):
+            try:
+                with open(path, "rb") as f:
+                    saved = pickle.load(f)
+                os.remove(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                saved = {}  # lost with a wiped cache folder - the page starts a new exam
+            for key, value in saved.items():
+                state[key] = value
+            del state[OFFLOAD_KEY]
+        entry.offloaded = None
+        _counters["restores"] += 1
+
+
+def track():
+    """End of a rerun: record this session's exam state size and enforce the budget"""
+    session_id, state = _current()
+    if state is None:
+        return
+    entry = _entry(session_id, state)
+    with entry.lock:
+        entry.bytes = sum(_sizeof(state[key]) for key in exam_keys(state))
+        entry.last_seen = time.time()
+    enforce_budget()
+
+
+def _offload(session_id, entry):
+    """Pickle a session's exam state to disk and drop it from memory; returns the bytes freed"""
+    _prepare()
+    with entry.lock:
+        state = entry.state()
+        if state is None or entry.offloaded or time.time() - entry.last_seen < MIN_IDLE_S:
+            return 0
+        with perf.span("session.offload") as span:
+            saved = {key: state[key] for key in exam_keys(state)}
+            path = os.path.join(OFFLOAD_DIR, f"{os.getpid()}-{session_id}.pkl")
+            payload = pickle.dumps(saved, pickle.HIGHEST_PROTOCOL)
+            shared_cache.atomic_write(path, lambda tmp: open(tmp, "wb").write(payload))
+            for key in saved:
+                del state[key]
+            state[OFFLOAD_KEY] = path
+            span.bytes = len(payload)
+        freed, entry.bytes, entry.offloaded = entry.bytes, 0, path
+    _counters["evictions"] += 1
+    _counters["evicted_bytes"] += freed
+    return freed
+
+
+def _forget_closed():
+    """Drop sessions whose state has been freed (the browser tab closed), with any file they left"""
+    with _lock:
+        closed = [(session_id, entry) for session_id, entry in _sessions.items() if entry.state() is None]
+        for session_id, _ in closed:
+            del _sessions[session_id]
+    for _, entry in closed:
+        if entry.offloaded:
+            try:
+                os.remove(entry.offloaded)
+            except OSError:
+                pass
+
+
+def enforce_budget(budget=None):
+    """Offload the longest-idle sessions until the resident exam state fits the budget; returns the bytes freed"""
+    budget = BUDGET_BYTES if budget is None else budget
+    _forget_closed()
+    with _lock:
+        entries = sorted(_sessions.items(), key=lambda item: item[1].last_seen)
+    resident = sum(entry.bytes for _, entry in entries)
+    freed = 0
+    if not budget:
+        return freed
+    for session_id, entry in entries:
+        if resident - freed <= budget:
+            break
+        freed += _offload(session_id, entry)
+    return freed
+
+
+def stats():
+    """Counters for sizing servers"""
+    _forget_closed()
+    with _lock:
+        entries = list(_sessions.values())
+    offloaded = [entry.offloaded for entry in entries if entry.offloaded]
+    disk = 0
+    for path in offloaded:
+        try:
+            disk += os.path.getsize(path)
+        except OSError:
+            pass
+    return {
+        "sessions": len(entries),
+        "resident_bytes": sum(entry.bytes for entry in entries),
+        "largest_bytes": max((entry.bytes for entry in entries), default=0),
+        "offloaded_sessions": len(offloaded),
+        "offloaded_bytes": disk,
+        "budget_bytes": BUDGET_BYTES,
+        **_counters,
+    }
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import perf
+
+# Shared by every server process on the machine. SHARED_CACHE=0 turns it off.
+ENABLED = os.getenv("SHARED_CACHE", "1") != "0"
+CACHE_DIR = os.getenv(
+    "SHARED_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+
+def file_version(path):
+    """Content hash of a file - the version stamp of everything derived from it"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def atomic_write(path, write):
+    """Write to a temporary name and rename, so other processes never see half a file"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_frames(name, version, parts):
+    """DataFrames saved by write_frames for this version, memory-mapped from Arrow IPC files, or None"""
+    if not ENABLED:
+        return None
+    import pyarrow as pa
+
+    paths = [os.path.join(CACHE_DIR, f"{name}-{version}-{part}.arrow") for part in parts]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    with perf.span("shared_cache.read_frames") as span:
+        frames = []
+        for path in paths:
+            with pa.memory_map(path) as source:
+                frames.append(pa.ipc.open_file(source).read_all().to_pandas())
+            span.bytes = (span.bytes or 0) + os.path.getsize(path)
+    return frames
+
+
+def write_frames(name, version, frames):
+    """Save {part: DataFrame} for other processes and drop files of older versions"""
+    if not ENABLED:
+        return
+    import pyarrow as pa
+
+    with perf.span("shared_cache.write_frames"):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+        except OSError:
+            return  # read-only deployment - every process parses for itself as before
+        for part, df in frames.items():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+
+            def write(tmp, table=table):
+                with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+            atomic_write(os.path.join(CACHE_DIR, f"{name}-{version}-{part}.arrow"), write)
+
+        for filename in os.listdir(CACHE_DIR):
+            if filename.startswith(f"{name}-") and filename.endswith(".arrow") and f"-{version}-" not in filename:
+                try:
+                    os.remove(os.path.join(CACHE_DIR, filename))
+                except OSError:
+                    pass  # another process got there first
+
+
+class DocumentStore:
+    """JSON documents in SQLite, each stored with the version stamp it was built from.
+
+    A lookup only returns a document when the caller's current version matches,
+    so a stale entry is never served - it is simply replaced on the next write.
+    WAL mode lets every server process read while one of them writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents "
+                "(key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, version):
+        with perf.span("shared_cache.get") as span:
+            try:
+                row = self._connection().execute(
+                    "SELECT value FROM documents WHERE key = ? AND version = ?", (key, version)
+                ).fetchone()
+            except (sqlite3.Error, OSError):
+                row = None  # a busy or unwritable cache only costs the download
+            if row is None:
+                perf.record("shared_cache.miss", 0.0)
+                return None
+            span.bytes = len(row[0])
+            return json.loads(row[0])
+
+    def put(self, key, version, value):
+        with perf.span("shared_cache.put") as span:
+            payload = json.dumps(value)
+            span.bytes = len(payload)
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO documents (key, version, value, updated) VALUES (?, ?, ?, ?)",
+                        (key, version, payload, time.time()),
+                    )
+            except (sqlite3.Error, OSError):
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def document_store():
+    """The process's handle on the shared document store, or None when the cache is off"""
+    global _store
+    if not ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore(os.path.join(CACHE_DIR, "documents.sqlite"))
+        return _store
@@ -0,0 +1,266 @@
+"""Render a question bank's Study Guide as plain HTML pages with a client-side search.
+
+    python static_guide.py [--bank basic | --all] [--out static/guide] [--force]
+
+Writes OUT/<bank>/index.html (contents and search box), one page per section
+and group, the search index as JSON and the shared CSS and JS. Asset names
+carry a hash of their content so browsers can cache them for good. A bank is
+only rebuilt when its workbook's content hash differs from the one recorded in
+OUT/<bank>/manifest.json. Any static file server can host the output; the JSON
+API serves it under /guide/.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import banks
+import perf
+from question_bank import current_bank
+from search import MAX_PREFIX_EXPANSIONS
+
+OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "guide")
+# Characters of question text shown with each search result
+SNIPPET_LENGTH = 100
+# BM25 weights are shipped as integers in hundredths - plenty to rank by, and far shorter JSON
+WEIGHT_SCALE = 100
+
+CSS = """
+body { font-family: sans-serif; color: #262730; max-width: 72rem; margin: 0 auto; padding: 1rem 2rem; }
+a { color: #1c6fd9; }
+nav { margin: 1rem 0; display: flex; gap: 1.5rem; }
+.cards { display: grid; grid-template-columns: repeat(auto-fill, minmax(20rem, 1fr)); gap: 1rem; }
+.card { border-top: 1px solid #d6d6d9; padding: 0.75rem 0; }
+.card:target { background: #f0f2f6; }
+.section { margin-top: 1.5rem; }
+.groups { display: flex; flex-wrap: wrap; gap: 0.5rem 1rem; }
+#search { width: 100%; font-size: 1rem; padding: 0.5rem; border: 1px solid #d6d6d9; border-radius: 0.4rem; }
+#results li { margin: 0.5rem 0; }
+.muted { color: #808495; font-size: 0.85rem; }
+"""
+
+# Same matching as search.SearchIndex: every term is a prefix, all terms must match, BM25 weights summed
+JS = """
+(function () {
+  var box = document.getElementById("search"), list = document.getElementById("results"), status = document.getElementById("status");
+  if (!box) return;
+  var index = null, terms = null;
+  function load() {
+    if (index) return Promise.resolve(index);
+    return fetch(box.dataset.index).then(function (r) { return r.json(); }).then(function (data) {
+      index = data; terms = Object.keys(data.postings).sort(); return index;
+    });
+  }
+  function expand(prefix) {
+    var lo = 0, hi = terms.length, out = [];
+    while (lo < hi) { var mid = (lo + hi) >> 1; if (terms[mid] < prefix) lo = mid + 1; else hi = mid; }
+    for (var i = lo; i < terms.length && out.length < index.max_expansions && terms[i].lastIndexOf(prefix, 0) === 0; i++) out.push(terms[i]);
+    return out;
+  }
+  function search(query) {
+    var words = query.toLowerCase().match(/[a-z0-9]+/g) || [], scores = null;
+    words.forEach(function (prefix) {
+      var hit = {};
+      expand(prefix).forEach(function (term) {
+        var p = index.postings[term];
+        for (var i = 0; i < p.length; i += 2) hit[p[i]] = (hit[p[i]] || 0) + p[i + 1];
+      });
+      if (scores === null) { scores = hit; return; }
+      var both = {};
+      for (var doc in scores) if (doc in hit) both[doc] = scores[doc] + hit[doc];
+      scores = both;
+    });
+    return Object.keys(scores || {}).sort(function (a, b) { return scores[b] - scores[a] || a - b; });
+  }
+  function render() {
+    var query = box.value.trim();
+    list.innerHTML = "";
+    if (!query) { status.textContent = ""; return; }
+    load().then(function () {
+      var docs = search(query);
+      status.textContent = docs.length + " matching questions";
+      docs.slice(0, index.limit).forEach(function (d) {
+        var doc = index.docs[d], li = document.createElement("li"), a = document.createElement("a"), span = document.createElement("div");
+        a.href = index.pages[doc[1]] + "#" + doc[0]; a.textContent = doc[0];
+        span.textContent = doc[2]; span.className = "muted";
+        li.appendChild(a); li.appendChild(span); list.appendChild(li);
+      });
+    });
+  }
+  var timer = null;
+  box.addEventListener("input", function () { clearTimeout(timer); timer = setTimeout(render, 120); });
+})();
+"""
+
+
+def _hashed(name, content):
+    """name.<content hash>.ext, so a changed asset never reuses a cached URL"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]}{ext}"
+
+
+def group_page(section, group):
+    return f"{section}-{int(group):02d}.html"
+
+
+def _page(title, assets, body):
+    return (
+        "<!doctype html>\n<html lang=\"en\"><head><meta charset=\"utf-8\">"
+        "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+        f"<title>{html.escape(title)}</title><link rel=\"stylesheet\" href=\"{assets['css']}\"></head>\n"
+        f"<body>\n{body}\n<script src=\"{assets['js']}\"></script></body></html>\n"
+    )
+
+
+def _card(row):
+    return (
+        f"<div class=\"card\" id=\"{html.escape(str(row.question_id))}\">"
+        f"<strong>Question {html.escape(str(row.question_id))}</strong>"
+        f"<p>{html.escape(str(row.question_english))}</p>"
+        f"<p><strong>Answer:</strong> {html.escape(str(row.correct_answer_english))}</p></div>"
+    )
+
+
+def search_index_json(bank, pages):
+    """The bank's BM25 index flattened to {term: [doc, weight, doc, weight, ...]}, plus each doc's id, page and snippet"""
+    index = bank.search_index()
+    test = bank.test
+    page_names = list(dict.fromkeys(pages))
+    page_number = {page: i for i, page in enumerate(page_names)}
+    return json.dumps({
+        "pages": page_names,
+        "docs": [
+            [str(question_id), page_number[page], str(text)[:SNIPPET_LENGTH]]
+            for question_id, page, text in zip(test['question_id'], pages, test['question_english'])
+        ],
+        "postings": {
+            term: [
+                value for doc, weight in zip(docs.tolist(), np.rint(weights * WEIGHT_SCALE).astype(int).tolist())
+                for value in (doc, max(weight, 1))
+            ]
+            for term, (docs, weights) in index.postings.items()
+        },
+        "max_expansions": MAX_PREFIX_EXPANSIONS,
+        "limit": 100,
+    }, separators=(",", ":"))
+
+
+def render_bank(bank):
+    """{relative path: file content} for one bank version"""
+    test = bank.test
+    spec = bank.spec
+    pages = [group_page(section, group) for section, group in zip(test['Section'], test['Group'])]
+
+    files = {}
+    assets = {"css": _hashed("guide.css", CSS), "js": _hashed("guide.js", JS)}
+    files[assets["css"]] = CSS
+    files[assets["js"]] = JS
+    search_json = search_index_json(bank, pages)
+    search_name = _hashed("search.json", search_json)
+    files[search_name] = search_json
+
+    groups = list(test.groupby(['Section', 'Group'], sort=False))
+    contents = []
+    for i, ((section, group), questions) in enumerate(groups):
+        page = group_page(section, group)
+        section_name = questions['Section Name'].iloc[0]
+        links = ["<a href=\"index.html\">All sections</a>"]
+        if i > 0:
+            links.append(f"<a href=\"{group_page(*groups[i - 1][0])}\">&larr; Previous group</a>")
+        if i + 1 < len(groups):
+            links.append(f"<a href=\"{group_page(*groups[i + 1][0])}\">Next group &rarr;</a>")
+        title = f"{section} {section_name} - Group {int(group)}"
+        files[page] = _page(f"{title} | {spec.name}", assets, (
+            f"<h1>{html.escape(title)}</h1><nav>{''.join(links)}</nav>"
+            f"<p class=\"muted\">{len(questions)} questions</p>"
+            f"<div class=\"cards\">{''.join(_card(row) for row in questions.itertuples(index=False))}</div>"
+            f"<nav>{''.join(links)}</nav>"
+        ))
+        if not contents or contents[-1][0] != section:
+            contents.append((section, section_name, []))
+        contents[-1][2].append(f"<a href=\"{page}\">Group {int(group)}</a> <span class=\"muted\">({len(questions)})</span>")
+
+    files["index.html"] = _page(f"{spec.name} Study Guide", assets, (
+        f"<h1>{html.escape(spec.name)} Study Guide</h1>"
+        f"<input id=\"search\" type=\"search\" placeholder=\"Search questions and answers, e.g. antenna gain, ohm, repeater offset\" "
+        f"data-index=\"{search_name}\" autofocus>"
+        "<p id=\"status\" class=\"muted\"></p><ol id=\"results\"></ol>"
+        + "".join(
+            f"<div class=\"section\"><h2>{html.escape(section)} {html.escape(section_name)}</h2>"
+            f"<div class=\"groups\">{''.join(links)}</div></div>"
+            for section, section_name, links in contents
+        )
+        + f"<p class=\"muted\">{len(test)} questions, bank version {bank.version}</p>"
+    ))
+    return files
+
+
+def read_manifest(bank_dir):
+    try:
+        with open(os.path.join(bank_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build(bank, out_dir=OUT_DIR, force=False):
+    """Write the bank's static guide unless it is already built from this version. Returns the manifest."""
+    bank_dir = os.path.join(out_dir, bank.spec.key)
+    manifest = read_manifest(bank_dir)
+    if not force and manifest is not None and manifest["version"] == bank.version:
+        return manifest
+
+    with perf.span("static_guide.build"):
+        files = render_bank(bank)
+        manifest = {
+            "bank": bank.spec.key,
+            "version": bank.version,
+            "built": datetime.now().isoformat(),
+            "files": sorted(files),
+            "bytes": sum(len(content.encode("utf-8")) for content in files.values()),
+        }
+        # Built next to the live copy and swapped in, so a server never serves half a build
+        tmp_dir = f"{bank_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, content in files.items():
+            with open(os.path.join(tmp_dir, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=1)
+        old_dir = f"{bank_dir}.{os.getpid()}.old"
+        if os.path.exists(bank_dir):
+            os.replace(bank_dir, old_dir)
+        os.replace(tmp_dir, bank_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank", default=banks.DEFAULT_BANK, choices=sorted(banks.BANKS))
+    parser.add_argument("--all", action="store_true", help="every bank whose workbook is deployed")
+    parser.add_argument("--out", default=OUT_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the bank has not changed")
+    args = parser.parse_args(argv)
+
+    for key in banks.available_banks() if args.all else [args.bank]:
+        start = time.perf_counter()
+        bank = current_bank(key)
+        manifest = build(bank, args.out, args.force)
+        print(
+            f"{key}: {len(manifest['files'])} files, {manifest['bytes'] / 1024:.0f} KiB, "
+            f"version {manifest['version']} ({time.perf_counter() - start:.2f}s)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
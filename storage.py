@@ -1,20 +1,283 @@
-from azure.storage.blob import BlobServiceClient
+import hashlib
 import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, time
+import threading
+import uuid
+from functools import cache
+from time import sleep
+from urllib.parse import parse_qs
 import pandas as pd
 import numpy as np
+import history
+import perf
+import shared_cache
+
+MEMORY_PREFIX = "memory://"
+
+# User blobs are named after a hash of the normalized email and spread over fixed shard prefixes,
+# so addresses stay out of blob names and listing, export and migration can run one worker per shard
+SHARDS = [f"{i:x}" for i in range(16)]
+RESULTS_BLOB = "test_results/{shard}/{key}.json"
+# Per-shard {user key: email} map - the only place the addresses are kept
+DIRECTORY_BLOB = "directory/{shard}.json"
+# Tests folded out of a long history by compaction (see history.py)
+COLD_BLOB = "cold/{shard}/{key}.json"
+# Layout before sharding, still read for users who have not been migrated
+LEGACY_RESULTS_BLOB = "test_results/test_results_{email}.json"
+DIRECTORY_RETRIES = 10
+# Concurrent reads of the same history share one download (set STORAGE_SINGLE_FLIGHT=0 to turn off)
+SINGLE_FLIGHT = os.getenv("STORAGE_SINGLE_FLIGHT", "1") != "0"
+# A caller waits this long for a read already in flight before making its own
+SINGLE_FLIGHT_TIMEOUT_S = 30
+
+
+def normalize_email(email):
+    return email.lower().strip()
+
+
+def user_key(email):
+    return hashlib.sha256(normalize_email(email).encode("utf-8")).hexdigest()[:32]
+
+
+def shard_of(key):
+    return key[0]
+
+
+def results_blob_name(email):
+    key = user_key(email)
+    return RESULTS_BLOB.format(shard=shard_of(key), key=key)
+
+
+def cold_blob_name(email):
+    key = user_key(email)
+    return COLD_BLOB.format(shard=shard_of(key), key=key)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one call and its result - or its exception.
+
+    Only calls that overlap are merged; nothing is kept once the call returns.
+    Every caller gets the same object back, so it must be treated as read-only.
+    """
+
+    def __init__(self, timeout=SINGLE_FLIGHT_TIMEOUT_S):
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            perf.record("storage.single_flight.shared", 0.0)
+            if not flight.done.wait(self.timeout):
+                perf.record("storage.single_flight.timeout", 0.0)
+                return fn()  # the first caller is stuck - don't queue behind it
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = fn()
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self.forget(key, flight)
+            flight.done.set()
+
+    def forget(self, key, flight=None):
+        """Callers from now on start a new call - for after a write, so they never get data older than it"""
+        with self._lock:
+            if key in self._flights and (flight is None or self._flights[key] is flight):
+                del self._flights[key]
+
+
+class _MemoryBlob:
+    def __init__(self, name, data):
+        self.name = name
+        self.size = len(data)
+
+
+class _MemoryProperties:
+    def __init__(self, etag, size):
+        self.etag = etag
+        self.size = size
+
+
+class _MemoryDownload:
+    def __init__(self, data, etag):
+        self._data = data
+        self.properties = _MemoryProperties(etag, len(data))
+
+    def readall(self):
+        return self._data
+
+
+class _MemoryBlobClient:
+    def __init__(self, container, blob_name):
+        self._container = container
+        self.blob_name = blob_name
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._container._round_trip()
+        with self._container._lock:
+            if not overwrite and self.blob_name in self._container._blobs:
+                raise FileExistsError(self.blob_name)
+            # Conditional write: only replace the version the caller read
+            if etag is not None and self._container._etags.get(self.blob_name) != etag:
+                raise FileExistsError(f"{self.blob_name} was modified")
+            self._container._blobs[self.blob_name] = bytes(data)
+            # Unique per upload, like an Azure ETag, so versions never collide across processes
+            self._container._etags[self.blob_name] = uuid.uuid4().hex
+
+    def download_blob(self):
+        self._container._round_trip()
+        with self._container._lock:
+            if self.blob_name not in self._container._blobs:
+                raise FileNotFoundError(self.blob_name)
+            return _MemoryDownload(self._container._blobs[self.blob_name], self._container._etags[self.blob_name])
+
+    def get_blob_properties(self):
+        self._container._round_trip()
+        with self._container._lock:
+            if self.blob_name not in self._container._blobs:
+                raise FileNotFoundError(self.blob_name)
+            return _MemoryProperties(self._container._etags[self.blob_name], len(self._container._blobs[self.blob_name]))
+
+    def delete_blob(self):
+        self._container._round_trip()
+        with self._container._lock:
+            self._container._etags.pop(self.blob_name, None)
+            if self._container._blobs.pop(self.blob_name, None) is None:
+                raise FileNotFoundError(self.blob_name)
+
+
+class MemoryContainerClient:
+    """Process-local stand-in for an Azure container client, used for local runs and benchmarks"""
+    _containers = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self):
+        self._blobs = {}
+        self._etags = {}
+        self._lock = threading.Lock()
+        # Seconds added to every call, standing in for a network round trip (memory://name?latency_ms=20)
+        self.latency = 0.0
+        # Calls made, for benchmarks
+        self.calls = 0
+
+    @classmethod
+    def get(cls, name, latency=None):
+        """Containers are shared by name so every StorageManager in the process sees the same data"""
+        with cls._registry_lock:
+            if name not in cls._containers:
+                cls._containers[name] = cls()
+            if latency is not None:
+                cls._containers[name].latency = latency
+            return cls._containers[name]
+
+    def _round_trip(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def create_container(self):
+        pass
+
+    def get_blob_client(self, blob_name):
+        return _MemoryBlobClient(self, blob_name)
+
+    def list_blobs(self, name_starts_with=None):
+        self._round_trip()
+        with self._lock:
+            items = list(self._blobs.items())
+        return [
+            _MemoryBlob(name, data) for name, data in sorted(items)
+            if name_starts_with is None or name.startswith(name_starts_with)
+        ]
+
 
 class StorageManager:
-    def __init__(self, connection_string):
-        self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+    def __init__(self, connection_string, cache=None, prefix=""):
         self.container_name = "test-results"
-        self.container_client = self.blob_service_client.get_container_client(self.container_name)
-        
-        # Ensure container exists
-        try:
-            self.container_client.create_container()
-        except:
-            pass
+        self.connection_string = connection_string
+        # Blob name prefix of the question bank this manager stores results for ("" is the original Basic layout)
+        self.prefix = prefix
+        # Optional shared_cache.DocumentStore - decoded JSON blobs shared with the other server processes
+        self.cache = cache
+        # The client (and the Azure SDK import) is created on first use - pages that never touch storage don't pay for it
+        self._container_client = None
+        self._client_lock = threading.Lock()
+        # History reads in flight, by email
+        self.single_flight = SINGLE_FLIGHT
+        self._flights = SingleFlight()
+
+    @property
+    def container_client(self):
+        if self._container_client is None:
+            with self._client_lock:
+                if self._container_client is None:
+                    self._container_client = self._connect()
+        return self._container_client
+
+    def _connect(self):
+        with perf.span("storage.connect"):
+            # "memory://<name>" keeps everything in this process - handy without an Azure account
+            if self.connection_string and self.connection_string.startswith(MEMORY_PREFIX):
+                name, _, query = self.connection_string[len(MEMORY_PREFIX):].partition("?")
+                latency_ms = parse_qs(query).get("latency_ms")
+                return MemoryContainerClient.get(
+                    name or self.container_name, latency=float(latency_ms[0]) / 1000 if latency_ms else None
+                )
+
+            from azure.storage.blob import BlobServiceClient
+            self.blob_service_client = BlobServiceClient.from_connection_string(self.connection_string)
+            container_client = self.blob_service_client.get_container_client(self.container_name)
+
+            # Ensure container exists
+            try:
+                container_client.create_container()
+            except:
+                pass
+            return container_client
+
+    def _blob(self, blob_name):
+        return self.container_client.get_blob_client(self.prefix + blob_name)
+
+    def _download_json(self, blob_client, span, clean=None):
+        """Decoded (and cleaned) JSON of a blob, taken from the shared cache while the blob's ETag still matches"""
+        if self.cache is not None:
+            # A properties call is much cheaper than downloading a long history; raises if the blob is missing
+            version = blob_client.get_blob_properties().etag
+            value = self.cache.get(blob_client.blob_name, version)
+            if value is not None:
+                return value
+        downloader = blob_client.download_blob()
+        data = downloader.readall()
+        span.bytes = len(data)
+        value = json.loads(data)
+        if clean is not None:
+            value = clean(value)
+        if self.cache is not None:
+            self.cache.put(blob_client.blob_name, downloader.properties.etag, value)
+        return value
 
     def _serialize_data(self, obj):
         """Convert non-serializable types to serializable ones"""
@@ -34,52 +297,289 @@ class StorageManager:
             return str(obj)
         return obj
 
+    def _results_blob(self, email):
+        return self._blob(results_blob_name(email))
+
+    def _legacy_blob(self, email):
+        return self._blob(LEGACY_RESULTS_BLOB.format(email=email))
+
+    def _read_results(self, email, span):
+        """(results, where they came from) - the sharded blob, else the pre-sharding one, else ([], None)"""
+        clean = lambda data: [self._serialize_data(item) for item in data]
+        for source, blob_client in (("sharded", self._results_blob(email)), ("legacy", self._legacy_blob(email))):
+            try:
+                # Clean the data when reading (cached already cleaned)
+                return self._download_json(blob_client, span, clean=clean), source
+            except:
+                continue
+        return [], None
+
+    def _match_condition(self):
+        if isinstance(self.container_client, MemoryContainerClient):
+            return None
+        from azure.core import MatchConditions
+        return MatchConditions.IfNotModified
+
+    def _update_directory(self, shard, entries):
+        """Add {user key: email} entries to a shard's directory without losing a concurrent writer's entries"""
+        blob_client = self._blob(DIRECTORY_BLOB.format(shard=shard))
+        with perf.span("storage.update_directory"):
+            for attempt in range(DIRECTORY_RETRIES):
+                if attempt:
+                    # Back off with jitter so writers racing on one shard stop colliding
+                    sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                try:
+                    downloader = blob_client.download_blob()
+                    directory, etag = json.loads(downloader.readall()), downloader.properties.etag
+                except:
+                    directory, etag = {}, None
+                if all(directory.get(key) == email for key, email in entries.items()):
+                    return
+                directory.update(entries)
+                try:
+                    if etag is None:
+                        blob_client.upload_blob(json.dumps(directory), overwrite=False)
+                    else:
+                        blob_client.upload_blob(
+                            json.dumps(directory), overwrite=True, etag=etag, match_condition=self._match_condition()
+                        )
+                    return
+                except:
+                    continue  # someone else wrote the directory since we read it - read it again
+            raise RuntimeError(f"Could not update the user directory for shard {shard}")
+
     def save_test_result(self, email, results):
         """Save test results to blob storage"""
-        blob_name = f"test_results/test_results_{email}.json"
-        blob_client = self.container_client.get_blob_client(blob_name)
+        email = normalize_email(email)
+        blob_client = self._results_blob(email)
         
-        try:
-            # Get and clean existing data
-            existing_data = self.get_test_results(email)
+        with perf.span("storage.save_test_result") as span:
+            # Get and clean existing data (a user's first save under the sharded layout carries their old history over)
+            existing_data, source = self._read_results(email, span)
+            if source != "sharded":
+                # Directory first, so a listed user never lacks an address
+                key = user_key(email)
+                self._update_directory(shard_of(key), {key: email})
             existing_data = [self._serialize_data(item) for item in existing_data]
-            
+
             # Clean and add new results
             new_data = self._serialize_data(results)
             existing_data.extend([new_data] if not isinstance(new_data, list) else new_data)
-            
+
             # Upload the cleaned data
-            blob_client.upload_blob(json.dumps(existing_data), overwrite=True)
-            
-        except Exception as e:
-            # If no existing data, start fresh
-            new_data = self._serialize_data(results)
-            data_to_save = [new_data] if not isinstance(new_data, list) else new_data
-            blob_client.upload_blob(json.dumps(data_to_save), overwrite=True)
+            payload = json.dumps(existing_data)
+            blob_client.upload_blob(payload, overwrite=True)
+            span.bytes = len(payload)
+        self._flights.forget(email)
 
     def get_test_results(self, email):
-        """Get test results from blob storage"""
-        blob_name = f"test_results/test_results_{email}.json"
-        blob_client = self.container_client.get_blob_client(blob_name)
-        
-        try:
-            data = blob_client.download_blob().readall()
-            # Clean the data when reading
-            return [self._serialize_data(item) for item in json.loads(data)]
-        except:
-            return []
+        """Get test results from blob storage - a compacted history comes back merged with its cold rollup.
 
-    def list_users(self):
+        Calls for the same user at the same time (their open tabs, an admin
+        looking at them) share one download and the decoded list; don't modify it.
+        """
+        email = normalize_email(email)
+        if not self.single_flight:
+            return self._get_test_results(email)
+        return self._flights.do(email, lambda: self._get_test_results(email))
+
+    def _get_test_results(self, email):
+        with perf.span("storage.get_test_results") as span:
+            results = self._read_results(email, span)[0]
+            if results and history.is_marker(results[0]):
+                return history.merge(results, self.read_json(cold_blob_name(email)))
+            return results
+
+    def compact_results(self, email, fold, keep=history.HOT_ATTEMPTS):
+        """Fold all but the last `keep` tests into the user's cold rollup with fold(cold, results). Returns how many were folded."""
+        email = normalize_email(email)
+        blob_client = self._results_blob(email)
+        with perf.span("storage.compact_results") as span:
+            for _ in range(DIRECTORY_RETRIES):
+                try:
+                    downloader = blob_client.download_blob()
+                except:
+                    return 0  # no results under the sharded layout (legacy users are migrated first)
+                data, etag = json.loads(downloader.readall()), downloader.properties.etag
+                cold = self.read_json(cold_blob_name(email)) or history.empty()
+                # Tests a stopped run (or the try before a conflict) already folded are not folded again
+                entries = history.unfolded(data, cold)
+                if len(entries) <= keep:
+                    return 0
+                split = len(entries) - keep
+                cold = fold(cold, entries[:split])
+                # Cold first: should the results write never happen, merging skips the tests already folded
+                self.write_json(cold_blob_name(email), cold)
+                marker = {"compacted": {"attempts": len(cold["attempts"]), "through": cold["through"]}}
+                payload = json.dumps([marker] + entries[split:])
+                try:
+                    blob_client.upload_blob(payload, overwrite=True, etag=etag, match_condition=self._match_condition())
+                except:
+                    continue  # a test was saved meanwhile - fold again from the new blob
+                span.bytes = len(payload)
+                self._flights.forget(email)
+                return split
+            raise RuntimeError(f"Could not compact the results of {email}")
+
+    def _list_shard(self, shard):
+        """{user key: email} of everyone with results in one shard"""
+        prefix = self.prefix + RESULTS_BLOB.split("{key}")[0].format(shard=shard)
+        with perf.span("storage.list_shard"):
+            keys = [blob.name[len(prefix):-len(".json")] for blob in self.container_client.list_blobs(name_starts_with=prefix)]
+            directory = self.read_json(DIRECTORY_BLOB.format(shard=shard), {}) if keys else {}
+        return {key: directory[key] for key in keys if key in directory}
+
+    def _list_legacy(self):
+        prefix = self.prefix + LEGACY_RESULTS_BLOB.split("{email}")[0]
+        return [
+            blob.name[len(prefix):].replace(".json", "")
+            for blob in self.container_client.list_blobs(name_starts_with=prefix)
+        ]
+
+    def map_shards(self, fn, workers=len(SHARDS)):
+        """fn(shard) for every shard, `workers` shards at a time; results in shard order"""
+        if workers <= 1:
+            return [fn(shard) for shard in SHARDS]
+        with ThreadPoolExecutor(min(workers, len(SHARDS))) as pool:
+            return list(pool.map(fn, SHARDS))
+
+    def list_users(self, workers=len(SHARDS)):
         """List all users with test results"""
-        users = []
-        for blob in self.container_client.list_blobs():
-            if blob.name.startswith("test_results/test_results_"):
-                email = blob.name.replace("test_results/test_results_", "").replace(".json", "")
-                users.append(email)
-        return users
+        with perf.span("storage.list_users"):
+            shards = self.map_shards(self._list_shard, workers)
+            users = {email for directory in shards for email in directory.values()}
+            # Users not migrated yet
+            users.update(self._list_legacy())
+        return sorted(users)
+
+    def map_users(self, fn, workers=len(SHARDS)):
+        """fn(email) for every user, one worker per shard - for jobs that read everyone's history"""
+        def run_shard(shard):
+            emails = list(self._list_shard(shard).values())
+            return emails, [fn(email) for email in emails]
+
+        with perf.span("storage.map_users"):
+            shards = self.map_shards(run_shard, workers)
+            migrated = {email for emails, _ in shards for email in emails}
+            results = [value for _, values in shards for value in values]
+            # Users not migrated yet
+            results.extend(fn(email) for email in self._list_legacy() if email not in migrated)
+        return results
+
+    def migrate_legacy(self, workers=len(SHARDS), delete=False):
+        """Copy pre-sharding results blobs to their sharded names, one worker per shard. Returns the users moved."""
+        by_shard = {}
+        for email in self._list_legacy():
+            by_shard.setdefault(shard_of(user_key(email)), []).append(email)
+
+        def migrate_shard(shard):
+            emails = by_shard.get(shard, [])
+            if not emails:
+                return []
+            self._update_directory(shard, {user_key(email): normalize_email(email) for email in emails})
+            moved = []
+            for email in emails:
+                legacy = self._legacy_blob(email)
+                sharded = self._results_blob(email)
+                try:
+                    sharded.get_blob_properties()
+                    # Saved since the rollout - the sharded blob already includes the old history
+                except:
+                    sharded.upload_blob(legacy.download_blob().readall(), overwrite=False)
+                if delete:
+                    legacy.delete_blob()
+                moved.append(email)
+            return moved
+
+        with perf.span("storage.migrate_legacy"):
+            return [email for shard in self.map_shards(migrate_shard, workers) for email in shard]
+
+    def results_version(self, email):
+        """ETag of the user's results blob, or None if they have none - a properties call, no download"""
+        email = normalize_email(email)
+        with perf.span("storage.results_version"):
+            for blob_client in (self._results_blob(email), self._legacy_blob(email)):
+                try:
+                    return blob_client.get_blob_properties().etag
+                except:
+                    continue
+            return None
 
     def download_json(self, email):
         """Get raw JSON for a user"""
-        blob_name = f"test_results/test_results_{email}.json"
-        blob_client = self.container_client.get_blob_client(blob_name)
-        return blob_client.download_blob().readall()
\ No newline at end of file
+        email = normalize_email(email)
+        with perf.span("storage.download_json") as span:
+            try:
+                data = self._results_blob(email).download_blob().readall()
+            except:
+                data = self._legacy_blob(email).download_blob().readall()
+            span.bytes = len(data)
+        return data
+
+    def list_json(self, prefix):
+        """Names of the documents under `prefix`, as read_json expects them"""
+        with perf.span("storage.list_json"):
+            return [
+                blob.name[len(self.prefix):]
+                for blob in self.container_client.list_blobs(name_starts_with=self.prefix + prefix)
+            ]
+
+    def read_json(self, blob_name, default=None):
+        """Load any other JSON document kept in the container (calibration, summaries...)"""
+        blob_client = self._blob(blob_name)
+        with perf.span("storage.read_json") as span:
+            try:
+                return self._download_json(blob_client, span)
+            except:
+                return default
+
+    def write_json(self, blob_name, data):
+        """Store a JSON document in the container, replacing any previous version"""
+        blob_client = self._blob(blob_name)
+        with perf.span("storage.write_json") as span:
+            payload = json.dumps(self._serialize_data(data))
+            blob_client.upload_blob(payload, overwrite=True)
+            span.bytes = len(payload)
+
+    def update_json(self, blob_name, update):
+        """Read-modify-write a JSON document without losing a concurrent writer's change.
+
+        update(the stored document, or None) returns the new one. When someone
+        else writes the document in between, it is called again on their version.
+        """
+        blob_client = self._blob(blob_name)
+        with perf.span("storage.update_json") as span:
+            for attempt in range(DIRECTORY_RETRIES):
+                if attempt:
+                    sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                try:
+                    downloader = blob_client.download_blob()
+                    data, etag = json.loads(downloader.readall()), downloader.properties.etag
+                except:
+                    data, etag = None, None
+                data = update(data)
+                payload = json.dumps(self._serialize_data(data))
+                try:
+                    if etag is None:
+                        blob_client.upload_blob(payload, overwrite=False)
+                    else:
+                        blob_client.upload_blob(payload, overwrite=True, etag=etag, match_condition=self._match_condition())
+                except:
+                    continue  # written since we read it - update the new version
+                span.bytes = len(payload)
+                return data
+            raise RuntimeError(f"Could not update {blob_name}")
+
+
+@cache
+def get_storage_manager(connection_string=None, prefix=""):
+    """One StorageManager (and so one client and one container check) per connection string and bank for the whole process.
+
+    It reads through the shared cache, so a history another server process has
+    already downloaded costs a properties call instead of a download.
+    """
+    return StorageManager(
+        connection_string or os.getenv('AZURE_STORAGE_CONNECTION_STRING'),
+        cache=shared_cache.document_store(),
+        prefix=prefix,
+    )
@@ -0,0 +1,112 @@
+"""Whole-container jobs on the sharded user layout, one worker per shard.
+
+    python storage_jobs.py list [--bank basic]
+    python storage_jobs.py migrate [--workers 16] [--delete-legacy]
+    python storage_jobs.py export OUT_DIR [--workers 16]
+    python storage_jobs.py backfill-activity [--bank basic]
+    python storage_jobs.py rollup [--days 7]
+    python storage_jobs.py compact [--keep 50]
+
+migrate copies results saved under the old email-named blobs to their hashed,
+sharded names and records the addresses in the shard directories. Users are
+read from the old blobs until then, so it can run while the app is up.
+
+backfill-activity logs every stored attempt in the day-partitioned activity
+log (safe to repeat). rollup rebuilds the stored per-day totals for the last
+--days settled days; days are also rolled up on first query, so run it after
+changing events by hand or on a schedule to keep admin queries fast.
+
+compact keeps each user's last --keep tests in full and folds older ones into
+their cold rollup (see history.py), so reading a long history stays cheap.
+Run migrate first; users still on the old layout are skipped.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+
+import activity
+import banks
+import history
+import mastery
+from question_bank import current_bank
+from storage import SHARDS, cold_blob_name, get_storage_manager, user_key
+
+load_dotenv()
+
+
+def export_users(storage_mgr, out_dir, workers=len(SHARDS)):
+    """Write every user's raw results JSON to OUT_DIR/<user key>.json plus an index of addresses"""
+    os.makedirs(out_dir, exist_ok=True)
+
+    def export(email):
+        key = user_key(email)
+        with open(os.path.join(out_dir, f"{key}.json"), "wb") as f:
+            f.write(storage_mgr.download_json(email))
+        cold = storage_mgr.read_json(cold_blob_name(email))
+        if cold is not None:
+            with open(os.path.join(out_dir, f"{key}.cold.json"), "w") as f:
+                json.dump(cold, f)
+        return key, email
+
+    index = dict(storage_mgr.map_users(export, workers))
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    return index
+
+
+def compact_user(storage_mgr, bank, email, keep=history.HOT_ATTEMPTS):
+    """Fold the user's older tests into their cold rollup; returns how many were folded"""
+    # The mastery model replays answers in order, which the rollup can't - make sure it is stored before they go
+    mastery.load(storage_mgr, email)
+    return storage_mgr.compact_results(email, lambda cold, results: history.fold(cold, results, bank.question_ids), keep)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("job", choices=["list", "migrate", "export", "backfill-activity", "rollup", "compact"])
+    parser.add_argument("out_dir", nargs="?", help="export destination")
+    parser.add_argument("--bank", default=banks.DEFAULT_BANK, choices=sorted(banks.BANKS))
+    parser.add_argument("--workers", type=int, default=len(SHARDS))
+    parser.add_argument("--days", type=int, default=7, help="settled days to roll up, counting back from yesterday")
+    parser.add_argument("--keep", type=int, default=history.HOT_ATTEMPTS, help="tests kept in full by compact")
+    parser.add_argument("--delete-legacy", action="store_true", help="remove the old blobs once copied")
+    args = parser.parse_args(argv)
+
+    spec = banks.get_spec(args.bank)
+    storage_mgr = get_storage_manager(prefix=spec.storage_prefix)
+    start = time.perf_counter()
+    if args.job == "list":
+        users = storage_mgr.list_users(args.workers)
+        print("\n".join(users))
+        count = len(users)
+    elif args.job == "migrate":
+        count = len(storage_mgr.migrate_legacy(args.workers, delete=args.delete_legacy))
+    elif args.job == "backfill-activity":
+        days = activity.backfill(storage_mgr, spec, args.workers)
+        print(f"{len(days)} days logged" + (f", {days[0]} to {days[-1]}" if days else ""))
+        count = len(storage_mgr.list_users(args.workers))
+    elif args.job == "rollup":
+        end = date.today() - timedelta(days=activity.SETTLE_DAYS + 1)
+        rollups = activity.rollup_range(storage_mgr, end - timedelta(days=args.days - 1), end, args.workers)
+        print(f"{len(rollups)} days rolled up, {sum(rollup['attempts'] for rollup in rollups)} attempts")
+        count = len({user for rollup in rollups for user in rollup["users"]})
+    elif args.job == "compact":
+        bank = current_bank(args.bank)
+        folded = storage_mgr.map_users(lambda email: compact_user(storage_mgr, bank, email, args.keep), args.workers)
+        print(f"{sum(folded)} tests folded into cold rollups")
+        count = sum(1 for n in folded if n)
+    else:
+        if not args.out_dir:
+            parser.error("export needs OUT_DIR")
+        count = len(export_users(storage_mgr, args.out_dir, args.workers))
+    print(f"{args.job}: {count} users in {time.perf_counter() - start:.2f}s with {args.workers} workers", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
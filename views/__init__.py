@@ -0,0 +1,5 @@
+"""One module per page of the main app.
+
+test.py imports a page's module only when that page is shown, so each page
+pays for its own heavy imports (pandas, plotly, the Azure SDK) on first use.
+"""
@@ -0,0 +1,99 @@
+"""Home page - kept free of pandas, plotly and the Azure SDK so a cold start renders it fast"""
+import streamlit as st
+
+
+def render():
+    st.markdown("""
+## Welcome to the Amateur Radio Study Guide!
+
+This application helps you prepare for your Basic Amateur Radio License exam in Canada. Here's how to use each section:
+
+### 📝 Take Test
+- Simulates the actual exam environment
+- 100 questions selected from the question bank
+- Questions are randomly selected from all sections/groups
+- Immediate feedback on your answers
+- Save your results to track progress over time
+- Pass mark is 70%, Honours at 80%
+- Adaptive mode picks each question from your answers so far and estimates your chance of passing
+
+### 📊 Review History
+- View your test history and progress
+- See your performance trends over time
+- Analyze your strengths and weaknesses by section
+- Track which questions you've seen and which you haven't
+- Focus on areas that need improvement
+
+### 📚 Study Guide (under construction)
+- Browse all questions by section and group
+- Search questions and answers by keyword
+- Review specific topics
+- See correct answers for all questions
+- Practice areas where you need improvement
+
+### 📈 Features
+- Performance tracking across all attempts
+- Detailed analytics of your progress
+- Section-by-section breakdown
+- Question coverage analysis
+- Visual heatmap of your performance
+
+### 🎯 Getting Started
+1. Take a practice test to assess your current knowledge
+2. Review your results to identify weak areas
+3. Use the Study Guide to focus on those areas
+4. Track your progress in Review History
+5. Repeat until you consistently score above 70%
+
+### About Basic Amateur Radio License
+The Basic qualification is the entry-level amateur radio operator certificate in Canada. 
+You need to score at least 70% to pass, and 80% or higher grants you additional operating privileges (Honours).
+
+Good luck with your studies! 📡
+                
+73,
+
+VA3 ECC
+
+Jonathan
+""")
+
+    # Readiness estimate from the user's knowledge-tracing model
+    st.markdown("---")
+    st.subheader("🎓 Am I ready?")
+    email = st.text_input("Enter your email to see your estimated chance of passing:", key="home_email")
+    if email:
+        # The model needs pandas/numpy and storage - only load them once someone asks
+        import components
+        import mastery
+        from question_bank import current_bank
+        from storage import get_storage_manager
+
+        bank = current_bank(st.session_state.get("bank"))
+        state = mastery.load(get_storage_manager(prefix=bank.spec.storage_prefix), email.lower().strip())
+        if state is None:
+            st.info(f"No test history found for {email}. Take a practice test first.")
+        else:
+            components.readiness(state, bank)
+
+    # Add contact/about section at the bottom
+    st.markdown("---")
+    with st.expander("About This Project"):
+        st.markdown("""
+        This study tool was created to help amateur radio enthusiasts prepare for their Basic qualification exam. 
+        It uses the official Industry Canada question bank and simulates the actual exam environment.
+        
+        **Features:**
+        - Full question bank coverage
+        - Realistic exam simulation
+        - Progress tracking
+        - Performance analytics
+        - Focused study recommendations
+        
+        For more information about amateur radio licensing in Canada, visit the 
+        [Innovation, Science and Economic Development Canada website](https://www.ic.gc.ca/eic/site/025.nsf/eng/home).
+        
+        Created by VA3 ECC
+                    
+        Created and used to pass with honours on 2025/06/03
+        """)
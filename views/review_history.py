@@ -0,0 +1,269 @@
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import analytics
+import charts
+import components
+import mastery
+from question_bank import current_bank
+from storage import get_storage_manager
+
+
+def render():
+    bank = current_bank(st.session_state.get("bank"))
+    spec = bank.spec
+    test = bank.test
+    storage_mgr = get_storage_manager(prefix=spec.storage_prefix)
+
+    st.header("Review History")
+    
+    email = st.text_input("Enter your email address to view your history:", key="view_email")
+    
+    if email:
+        try:
+            user = email.lower().strip()
+            results = storage_mgr.get_test_results(user)
+            if not results:
+                st.info(f"No test history found for {email}")
+            else:
+                # Add summary metrics at the top
+                if results:
+                    metrics = analytics.summary_metrics(results)
+                    col1, col2, col3, col4, col5 = st.columns(5)
+                    col1.metric("Total Tests", metrics["total_tests"])
+                    col2.metric("Average Score", f"{metrics['average']:.1f}%")
+                    col3.metric("Best Score", f"{metrics['best']}%")
+                    col4.metric("Latest Score", f"{metrics['latest']}%")
+                    # Add Last 5 Average
+                    col5.metric("Last 5 Average", f"{metrics['last_5_average']:.1f}%")
+                    
+                    state = mastery.load(storage_mgr, user, results)
+                    components.readiness(state, bank)
+                    with st.expander("Mastery by Section/Group", expanded=False):
+                        st.dataframe(
+                            mastery.group_table(state),
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={
+                                'mastery': st.column_config.ProgressColumn('Mastery', format="%.0f%%", min_value=0, max_value=100),
+                                'recent_accuracy': st.column_config.NumberColumn('Recent Accuracy', format="%.0f%%"),
+                            }
+                        )
+                
+                # Create bar chart of scores over time
+                if results:
+                    # Rebuilt only when a test is saved - other widgets on this page re-send the cached figure
+                    st.plotly_chart(charts.score_trend(user, results, spec), use_container_width=True)
+                
+                # Existing code for heatmap and other visualizations...
+                # Overall summary stats
+                df_all = analytics.flatten_answers(results)
+                
+                if not df_all.empty:
+                    df_all['question_id'] = bank.question_ids(df_all)
+                    st.subheader("Section/Group Breakdown - Heatmap")
+                    # Add test selection slider
+                    total_tests = len(results)
+                    if total_tests > 1:
+                        num_tests = st.slider(
+                            "Number of recent tests to analyze:",
+                            min_value=1,
+                            max_value=total_tests,
+                            value=total_tests,
+                            help="Select how many of your most recent tests to include in the analysis"
+                        )
+                    else:
+                        num_tests = 1
+                        st.info("Only one test result available.")
+                    
+                    # Create heatmap of section/group performance
+                    
+                    # Convert group column to integer for proper sorting
+                    df_all['group'] = pd.to_numeric(df_all['group'])
+                    
+                    # Only the selected number of recent tests - memoized per slider position
+                    fig = charts.section_heatmap(user, results, window=num_tests)
+                    
+                    # Display the plot and capture clicks
+                    clicked = st.plotly_chart(
+                        fig, 
+                        use_container_width=True,
+                        # on_select="click",  # Capture click events
+                        key="heatmap",
+                        selection_mode=('box'),
+                        
+                        on_select="rerun"
+                        
+                    )
+                    st.markdown("_Draw a rectangle above to see questions._ </br> _Top left of the rectangle will be the questions displayed below_", 
+                                unsafe_allow_html=True)
+                    # click_data = st.session_state.get("plotly_clickData")
+                    # st.write(clicked)
+                    if clicked is not None and "box" in clicked.get("selection").keys():  # Check if there was a valid click event
+                        # st.write("Tru fasd")
+                        try:
+                            clicked_section = 1 + round(clicked.get("selection")["box"][0]["y"][0],0)
+                            clicked_group =  round(clicked.get("selection")["box"][0]["x"][0],0)
+                            
+                            clicked_group = int(clicked_group) if int(clicked_group) > 0 else 1
+                            clicked_group = f"{clicked_group}"
+                            clicked_section = f"B-00{int(clicked_section)}"
+                            
+
+                            questions = test[
+                                    (test["Section"] == str(clicked_section)) & 
+                                    (test["Group"] == int(clicked_group))
+                                ]
+                            ex = st.container(border=False)
+                            
+                            with ex.expander(f"Show Questions for Section {clicked_section}, Group {clicked_group} - {len(questions)} Questions", expanded=False):
+                                components.question_list(questions, key="heatmap_questions")
+                        except:
+                            pass
+                                   
+                    
+                    # Summary statistics table
+                    st.subheader("Section/Group Performance")
+                    stats = analytics.add_summary_column(analytics.section_group_stats(df_all))
+                    st.dataframe(
+                        stats[['section', 'group', 'Summary', 'percent']].sort_values('percent', ascending=False),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+
+                    # Response times - how long each section takes, and how often answers look like guesses
+                    times = analytics.response_times(df_all)
+                    if not times.empty:
+                        st.subheader("Response Times by Section")
+                        st.dataframe(
+                            times,
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={
+                                'section': 'Section',
+                                'answers': 'Timed Answers',
+                                'median_s': st.column_config.NumberColumn('Median (s)', format="%.1f"),
+                                'p90_s': st.column_config.NumberColumn('90th Percentile (s)', format="%.1f"),
+                                'fast_percent': st.column_config.NumberColumn(
+                                    f'Answered in < {analytics.GUESS_MS // 1000}s',
+                                    format="%.1f%%",
+                                    help="Very quick answers are often guesses"
+                                )
+                            }
+                        )
+                        timed = df_all[df_all['time_ms'].notna()]
+                        fig = px.box(
+                            x=timed['section'],
+                            y=timed['time_ms'] / 1000,
+                            points=False,
+                            labels={'x': 'Section', 'y': 'Seconds per Question'},
+                            title='Time per Question by Section'
+                        )
+                        st.plotly_chart(fig, use_container_width=True)
+
+                    # Question Coverage Analysis
+                    st.subheader("Question Coverage Analysis")
+
+                    coverage_stats, answered_questions = analytics.question_coverage(df_all, test)
+
+                    # Calculate overall statistics
+                    total_questions_overall = coverage_stats['total_questions'].sum()
+                    total_answered_overall = coverage_stats['answered_questions'].sum()
+                    total_unanswered = total_questions_overall - total_answered_overall
+                    overall_coverage = (total_answered_overall / total_questions_overall * 100).round(1)
+
+                    # Display overall summary
+                    st.info(
+                        f"Overall Question Coverage: "
+                        f"{total_answered_overall:,} of {total_questions_overall:,} questions answered "
+                        f"({overall_coverage}% complete). "
+                        f"**{total_unanswered:,} questions remaining.**"
+                    )
+
+                    # Display coverage statistics (existing code)
+                    st.dataframe(
+                        coverage_stats[[
+                            'section', 'group', 'total_questions', 'answered_questions', 
+                            'remaining_questions', 'coverage_percent'
+                        ]].sort_values(['section', 'group']),
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            'section': 'Section',
+                            'group': 'Group',
+                            'total_questions': 'Total Questions',
+                            'answered_questions': 'Questions Answered',
+                            'remaining_questions': 'Questions Remaining',
+                            'coverage_percent': st.column_config.NumberColumn(
+                                'Coverage %',
+                                format="%.1f%%"
+                            )
+                        }
+                    )
+
+                    # Add section to show unanswered questions
+                    with st.expander("View Unanswered Questions", expanded=False):
+                        # Filter for unanswered questions - include full question details
+                        unanswered = test[~test['question_id'].isin(answered_questions['question_id'])]
+                        
+                        if not unanswered.empty:
+                            # Add section/group selector for unanswered questions
+                            col1, col2 = st.columns(2)
+                            
+                            # Get unique sections that have unanswered questions
+                            sections_with_unanswered = sorted(unanswered['Section'].unique())
+                            selected_section = col1.selectbox(
+                                "Select Section:", 
+                                sections_with_unanswered,
+                                key="unanswered_section"
+                            )
+                            
+                            # Filter groups based on selected section
+                            groups_in_section = sorted(unanswered[unanswered['Section'] == selected_section]['Group'].unique())
+                            selected_group = col2.selectbox(
+                                "Select Group:",
+                                groups_in_section,
+                                key="unanswered_group"
+                            )
+                            
+                            # Get questions for selected section/group
+                            filtered_questions = unanswered[
+                                (unanswered['Section'] == selected_section) & 
+                                (unanswered['Group'] == selected_group)
+                            ]
+                            
+                            if not filtered_questions.empty:
+                                st.write(f"Found {len(filtered_questions)} unanswered questions:")
+                                components.question_list(filtered_questions, key="unanswered_questions")
+                            else:
+                                st.info("No unanswered questions in this section/group!")
+                        else:
+                            st.success("You have answered all questions in the test bank!")
+
+                    # Individual test selection
+                    st.subheader("Individual Test Results")
+                    # Compacted tests only kept their score
+                    detailed = [res for res in results if not res.get("compacted")]
+                    if len(detailed) < len(results):
+                        st.caption(f"Your {len(results) - len(detailed)} oldest tests are summarized - their answers count above but can't be reviewed one by one.")
+                    test_options = [
+                        f"Test on {res['timestamp']} - Score: {res['score']}/{res['total']} ({round(res['score']/res['total']*100)}%)"
+                        for res in detailed
+                    ]
+                    selected_test = st.selectbox("Select a test to review:", test_options)
+                    
+                    # Show details of selected test
+                    test_idx = test_options.index(selected_test)
+                    res = detailed[::-1][test_idx]  # Get selected test
+                    
+                    # Show test details in a clean table
+                    df = pd.DataFrame(res['answers'])
+                    df['Result'] = df['is_correct'].map({True: '✅ Correct', False: '❌ Incorrect'})
+                    st.dataframe(
+                        df[["section", "group", "question", "Result", "selected", "correct"]],
+                        hide_index=True,
+                        use_container_width=True
+                    )
+        except Exception as e:
+            st.error(f"Error loading results: {str(e)}")
@@ -0,0 +1,137 @@
+import os
+
+import streamlit as st
+
+import analytics
+import components
+from question_bank import current_bank
+from storage import get_storage_manager
+
+# Where the pages built by static_guide.py are served, e.g. http://localhost:8600/guide (the JSON API serves them)
+STATIC_GUIDE_URL = os.getenv("STATIC_GUIDE_URL")
+
+
+def render():
+    bank = current_bank(st.session_state.get("bank"))
+    test = bank.test
+    storage_mgr = get_storage_manager(prefix=bank.spec.storage_prefix)
+
+    st.header("Study Guide")
+    if STATIC_GUIDE_URL:
+        st.link_button("Open the printable Study Guide", f"{STATIC_GUIDE_URL.rstrip('/')}/{bank.spec.key}/")
+    
+    # Add email input at the top
+    
+    
+    with st.expander("Browse Questions", expanded=True):
+        query = st.text_input(
+            "Search questions and answers",
+            key="browse_search",
+            placeholder="e.g. antenna gain, ohm, repeater offset"
+        )
+        
+        if query:
+            # Ranked matches from the full-text index built with this version of the bank
+            questions = test.iloc[bank.search_index().positions(query)]
+            st.caption(f"{len(questions)} matching questions")
+        else:
+            section = st.selectbox("Select Section", test["Section"].unique(), key="browse_section")
+            groups = test[test["Section"] == section]["Group"].unique()
+            group = st.selectbox("Select Group (optional)", ["All"] + list(groups), key="browse_group")
+            
+            # Filter questions based on selection
+            if group == "All":
+                questions = test[test["Section"] == section]
+            else:
+                questions = test[(test["Section"] == section) & (test["Group"] == group)]
+        
+        # Display questions as cards in 3 columns, one page at a time
+        components.question_cards(questions, key="browse_questions")
+    
+    # Only show practice areas if email is provided
+    
+    with st.expander("Areas Needing Practice", expanded=True):
+        email = st.text_input("Enter your email to see personalized recommendations:", key="study_guide_email")
+        if email:
+            try:
+                # Load test history from storage
+                results = storage_mgr.get_test_results(email.lower().strip())
+                
+                if results:
+                    # Calculate performance stats
+                    df_all = analytics.flatten_answers(results)
+                    if not df_all.empty:
+                        stats = analytics.section_group_stats(df_all)
+                        
+                        # Add threshold selector
+                        threshold = st.select_slider(
+                            "Show topics below score threshold:",
+                            options=[50, 70, 80],
+                            value=70
+                        )
+                        
+                        # Filter areas needing practice
+                        needs_practice = stats[stats['percent'] < threshold].sort_values(['section', 'group'])
+                        if not needs_practice.empty:
+                            st.warning(f"Topics scoring below {threshold}%!")
+                            
+                            # Create section dropdown with scores
+                            practice_sections = needs_practice['section'].unique()
+                            section_options = [
+                                f"{section} ({needs_practice[needs_practice['section'] == section]['percent'].mean():.1f}%)"
+                                for section in practice_sections
+                            ]
+                            selected_practice_section_full = st.selectbox(
+                                "Select Section to Practice:", 
+                                section_options,
+                                key="practice_section"
+                            )
+                            selected_practice_section = practice_sections[section_options.index(selected_practice_section_full)]
+
+                            # Filter groups for selected section and create group dropdown with scores
+                            section_groups_df = needs_practice[needs_practice['section'] == selected_practice_section]
+                            section_groups = section_groups_df['group'].unique()
+                            group_options = [
+                                f"Group {group} ({section_groups_df[section_groups_df['group'] == group]['percent'].iloc[0]:.1f}%)"
+                                for group in section_groups
+                            ]
+                            selected_practice_group_full = st.selectbox(
+                                "Select Group to Practice:",
+                                group_options,
+                                key="practice_group"
+                            )
+                            selected_practice_group = section_groups[group_options.index(selected_practice_group_full)]
+                            
+                            # Show performance for selected section/group
+                            group_stats = needs_practice[
+                                (needs_practice['section'] == selected_practice_section) &
+                                (needs_practice['group'] == selected_practice_group)
+                            ].iloc[0]
+                            
+                            st.info(
+                                f"Current Performance for {selected_practice_section} - Group {selected_practice_group}: "
+                                f"{int(group_stats['correct'])}/{int(group_stats['total'])} "
+                                f"({group_stats['percent']}%)"
+                            )
+                            
+                            # Get and display questions for practice
+                            practice_questions = test[
+                                (test['Section'] == selected_practice_section) &
+                                (test['Group'] == int(selected_practice_group))
+                            ]
+                            
+                            if not practice_questions.empty:
+                                st.markdown("### Practice Questions")
+                                components.question_list(practice_questions, key="practice_questions")
+                            else:
+                                st.warning("No questions found for this section and group combination")
+                        else:
+                            st.success(f"No topics below {threshold}%!")
+                    else:
+                        st.info("No test history available for analysis.")
+                else:
+                    st.info(f"No test history found for {email}. Take some tests to see performance analysis.")
+            except Exception as e:
+                st.error(f"Error loading results: {str(e)}")
+        else:
+            st.info("Enter your email above to see personalized practice recommendations based on your test history.")
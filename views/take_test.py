@@ -0,0 +1,326 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import adaptive
+import exam_pool
+import grading
+import live
+from exam_state import QUESTION_KEY_PREFIXES
+from question_bank import current_bank, history_profile, build_personalized_pool
+from storage import get_storage_manager
+
+# Default budget offered for a timed practice exam
+TIMED_EXAM_MINUTES = 90
+
+
+def start_exam(pool, bank, adaptive_session=None, time_limit_s=None):
+    """Reset the session for a new exam on this pool"""
+    for k in [k for k in st.session_state.keys() if k.startswith(QUESTION_KEY_PREFIXES)]:
+        del st.session_state[k]
+    st.session_state.question_pool = pool
+    # The exam is saved to (and sized by) the bank it was drawn from, even if another bank is picked meanwhile
+    st.session_state.exam_bank = bank.spec.key
+    st.session_state.adaptive = adaptive_session
+    st.session_state.time_limit_s = time_limit_s
+    st.session_state.deadline = time.time() + time_limit_s if time_limit_s else None
+    st.session_state.current_q = 0
+    st.session_state.correct = 0
+    st.session_state.incorrect = 0
+    st.session_state.answers = []
+    st.session_state.live_session = live.new_session()
+
+
+def publish_progress(bank, total, finished=False, label=None):
+    """Tell the admin page's live view where this exam is"""
+    if "live_session" not in st.session_state:
+        return
+    label = label or (st.session_state.get("personalized_test_email") or "").lower().strip() or "Anonymous"
+    live.bus.publish(
+        st.session_state.live_session, label, bank.spec.key, st.session_state.current_q,
+        len(st.session_state.answers), st.session_state.correct, total, finished,
+    )
+
+
+def time_is_up():
+    deadline = st.session_state.get("deadline")
+    return deadline is not None and time.time() >= deadline
+
+
+@st.fragment(run_every=1)
+def countdown():
+    """Time left in a timed exam; ends the exam for the whole page when it runs out"""
+    remaining = max(0, int(st.session_state.deadline - time.time()))
+    st.metric("Time left", f"{remaining // 60}:{remaining % 60:02d}")
+    if remaining == 0:
+        st.rerun(scope="app")
+
+
+def save_test_result(result, email, bank):
+    try:
+        _, failed = grading.save_result(bank, email, result)
+    except Exception as e:
+        st.error(f"Error saving results: {str(e)}")
+        return False
+    if failed:
+        # The test itself is stored - saving again would only store it twice
+        st.warning(f"Your result is saved, but some of your statistics ({', '.join(failed)}) could not be updated.")
+    return True
+
+
+def render():
+    bank = current_bank(st.session_state.get("bank"))
+    spec = bank.spec
+    test = bank.test
+    storage_mgr = get_storage_manager(prefix=spec.storage_prefix)
+    reservoir = exam_pool.get_reservoir(bank)
+
+    col1, col2, col4 = st.columns([5, 1, 3])
+    col1.header("Multiple Choice Test")
+    
+    # Initialize session state if needed
+    if 'question_pool' not in st.session_state:
+        start_exam(reservoir.pop_standard(), bank)  # Default to random test
+    
+    # Add personalized test options
+    with st.expander("Personalized Test Options", expanded=False):
+        email_for_test = st.text_input("Enter your email for a personalized test:", key="personalized_test_email")
+        if email_for_test:
+            prefetch_email = email_for_test.lower().strip()
+            reservoir.prefetch(prefetch_email, lambda: storage_mgr.get_test_results(prefetch_email))
+            test_type = st.radio(
+                "Choose your test type:",
+                ["New Questions Only", "Practice Weak Areas", "Standard Random Test"],
+                help=f"""
+                - New Questions Only: Questions you haven't seen before
+                - Practice Weak Areas: Questions you've scored < {spec.pass_mark:.0%} on
+                - Standard Random Test: Random selection from all questions
+                """
+            )
+            
+            # Add Start Test button
+            if st.button("Start Personalized Test", key="start_personalized"):
+                if test_type != "Standard Random Test":
+                    email = email_for_test.lower().strip()
+                    try:
+                        # Usually built in the background while the email was being typed
+                        exam = reservoir.pop_personalized(email, test_type)
+                        if exam is None:
+                            exam = build_personalized_pool(bank, history_profile(storage_mgr.get_test_results(email), bank), test_type)
+                        pool, message = exam
+                        if message:
+                            level, text = message
+                            getattr(st, level)(text)
+                    except Exception as e:
+                        st.error(f"Error loading test history: {str(e)}")
+                        pool = reservoir.pop_standard()
+                    # Have the next one ready too
+                    reservoir.prefetch(email, lambda: storage_mgr.get_test_results(email))
+                else:
+                    pool = reservoir.pop_standard()
+                start_exam(pool, bank)
+                st.rerun()
+    
+    # Adaptive test - each question is chosen from the answers given so far
+    with st.expander("Adaptive Test", expanded=False):
+        st.markdown(
+            "Questions are picked one at a time to match your estimated ability, still one from every "
+            "section and group. Your chance of passing the real exam is updated after every answer."
+        )
+        stop_early = st.checkbox(
+            "Finish as soon as the pass/fail estimate is confident",
+            key="adaptive_stop_early",
+            help=f"Ends the test once the pass probability is above {adaptive.CONFIDENCE:.0%} or below {1 - adaptive.CONFIDENCE:.0%} (after at least {adaptive.MIN_QUESTIONS} questions)"
+        )
+        if st.button("Start Adaptive Test", key="start_adaptive"):
+            calibration = storage_mgr.read_json(adaptive.CALIBRATION_BLOB)
+            session = adaptive.AdaptiveSession(adaptive.item_bank(bank, calibration), stop_when_confident=stop_early)
+            start_exam(test.iloc[[session.next_item()]], bank, adaptive_session=session)
+            st.rerun()
+    
+    # Timed test - a standard exam that ends when the time budget runs out
+    with st.expander("Timed Test", expanded=False):
+        minutes = st.number_input(
+            "Time allowed (minutes)", min_value=5, max_value=240, value=TIMED_EXAM_MINUTES, step=5, key="timed_minutes",
+            help="Questions not answered when time runs out count as incorrect"
+        )
+        if st.button("Start Timed Test", key="start_timed"):
+            start_exam(reservoir.pop_standard(), bank, time_limit_s=int(minutes * 60))
+            st.rerun()
+    
+    # Add Restart button for the main test
+    if col4.button("Restart Test", key="restart_top"):
+        start_exam(reservoir.pop_standard(), bank)  # Reset to random test
+        st.rerun()
+
+    # An exam in progress stays on the bank it was drawn from; the selection applies to the next one
+    exam_bank = current_bank(st.session_state.get("exam_bank", spec.key))
+    exam_spec = exam_bank.spec
+    if exam_spec.key != spec.key:
+        st.info(f"This test is from the {exam_spec.name} bank. Finish it, or restart for a test from the {spec.name} bank.")
+
+    # Show test interface (existing code)
+    if st.session_state.question_pool is not None:
+        pool = st.session_state.question_pool
+        q_idx = st.session_state.current_q
+        adaptive_session = st.session_state.get("adaptive")
+        exam_length = adaptive_session.target if adaptive_session is not None else min(exam_spec.exam_size, len(pool))
+        time_up = time_is_up()
+        if q_idx < len(pool) and q_idx < exam_spec.exam_size and not time_up:
+            row = pool.iloc[q_idx]
+            if st.session_state.get("deadline") is not None:
+                countdown()
+            
+            # Create a key for storing shuffled options
+            options_key = f"shuffled_options_{q_idx}"
+            
+            # Only create and shuffle options if not already in session state
+            if options_key not in st.session_state:
+                options = [
+                    row['correct_answer_english'],
+                    row['incorrect_answer_1_english'],
+                    row['incorrect_answer_2_english'],
+                    row['incorrect_answer_3_english'],
+                ]
+                # Shuffle positions rather than texts so the saved answer can say which option was picked where
+                order = grading.shuffled_order(len(options))
+                st.session_state[options_key] = [options[i] for i in order]
+                st.session_state[f"option_order_{q_idx}"] = order
+                # Response time runs from the first time the question is shown to its submission
+                st.session_state[f"shown_{q_idx}"] = time.monotonic()
+            
+            # Reorganize the question header and metrics
+            col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+            col1.metric("Question", f"{q_idx+1}/{exam_length}")
+            col2.metric("Correct", st.session_state.correct)
+            col3.metric("Incorrect", st.session_state.incorrect)
+            
+            # Calculate percentage if any questions have been answered
+            total_answered = st.session_state.correct + st.session_state.incorrect
+            if total_answered > 0:
+                percentage = round((st.session_state.correct / total_answered) * 100)
+                if exam_spec.honours_mark is not None and percentage >= exam_spec.honours_mark * 100:
+                    col4.metric("Score", f"{percentage}%", delta="Honours", delta_color="normal")
+                elif percentage >= exam_spec.pass_mark * 100:
+                    col4.metric("Score", f"{percentage}%", delta="Pass", delta_color="normal")
+                else:
+                    col4.metric("Score", f"{percentage}%", delta="Fail", delta_color="inverse")
+            else:
+                col4.metric("Score", "0%", delta="--", delta_color="off")
+            
+            if adaptive_session is not None:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Pass probability", f"{adaptive_session.pass_probability:.0%}")
+                if adaptive_session.honours_probability is not None:
+                    col2.metric("Honours probability", f"{adaptive_session.honours_probability:.0%}")
+                if adaptive_session.confident:
+                    col3.metric("Estimate", "Confident")
+            
+            st.info(f"**{row['Section Name']} - {row['Section']}** | Question: {row['question_id']}")
+            st.markdown(f"**{row['question_english']}**")
+            
+            # Replace the radio button and submission section with:
+            submitted = st.session_state.get(f"submitted_{q_idx}", False)
+            
+            # Disable radio button if already submitted
+            answer = st.radio(
+                "Choose an answer:", 
+                st.session_state[options_key], 
+                key=q_idx,
+                disabled=submitted
+            )
+            
+            col1, col2 = st.columns([2, 5])  # Adjust ratio as needed
+            
+            # Only show Submit Answer if not yet submitted
+            if not submitted:
+                if col1.button("Submit Answer", key=f"submit_{q_idx}"):
+                    if time_is_up():
+                        # Submitted after the deadline - the answer does not count
+                        st.rerun()
+                    shown = st.session_state.get(f"shown_{q_idx}")
+                    time_ms = int((time.monotonic() - shown) * 1000) if shown is not None else None
+                    st.session_state[f"submitted_{q_idx}"] = True
+                    is_correct = answer == row['correct_answer_english']
+                    position = st.session_state[options_key].index(answer)
+                    if is_correct:
+                        st.success("✅ Correct!")
+                    else:
+                        st.error(f"❌ Incorrect. The correct answer is: {row['correct_answer_english']}")
+                    
+                    if f"answered_{q_idx}" not in st.session_state:
+                        st.session_state[f"answered_{q_idx}"] = True
+                        st.session_state.answers.append(
+                            grading.answer_record(row, st.session_state[f"option_order_{q_idx}"], position, time_ms)
+                        )
+                        if is_correct:
+                            st.session_state.correct += 1
+                        else:
+                            st.session_state.incorrect += 1
+                        
+                        # Adaptive tests pick the next question from the updated ability estimate
+                        if adaptive_session is not None:
+                            adaptive_session.record(adaptive_session.items[q_idx], is_correct)
+                            next_item = adaptive_session.next_item()
+                            if next_item is not None:
+                                st.session_state.question_pool = pd.concat([pool, adaptive_session.bank.test.iloc[[next_item]]])
+                        publish_progress(exam_bank, exam_length)
+                    st.rerun()
+            else:
+                # Show the feedback and Next Question button
+                is_correct = answer == row['correct_answer_english']
+                if is_correct:
+                    st.success("✅ Correct!")
+                else:
+                    st.error(f"❌ Incorrect. The correct answer is: {row['correct_answer_english']}")
+                
+                if col2.button("Next Question", key=f"next_{q_idx}"):
+                    # Nothing looks at an answered question again - drop its keys rather than carry them to the end
+                    for prefix in QUESTION_KEY_PREFIXES:
+                        st.session_state.pop(f"{prefix}{q_idx}", None)
+                    st.session_state.current_q += 1
+                    st.rerun()
+        else:
+            # Show test completion section
+            total_questions = min(exam_spec.exam_size, len(pool))
+            percentage = round((st.session_state.correct / total_questions) * 100)
+            
+            # Display results
+            if time_up:
+                st.warning(f"Time's up! {total_questions - len(st.session_state.answers)} unanswered questions count as incorrect.")
+            st.success(f"Test complete! Score: {st.session_state.correct}/{total_questions} ({percentage}%)")
+            if adaptive_session is not None:
+                estimate = f"Estimated chance of passing the real exam: {adaptive_session.pass_probability:.0%}"
+                if adaptive_session.honours_probability is not None:
+                    estimate += f" (honours: {adaptive_session.honours_probability:.0%})"
+                st.info(estimate)
+            
+            col1, col2, col3 = st.columns([2, 1, 1])
+            
+            email = col1.text_input("Enter your email address to save results:", key="save_email")
+            
+            if col2.button("Save Test Results"):
+                if not email:
+                    st.error("Please enter an email address to save your results.")
+                else:
+                    result = {
+                        "timestamp": datetime.now().isoformat(),
+                        "score": st.session_state.correct,
+                        "total": total_questions,
+                        "answers": st.session_state.answers
+                    }
+                    if st.session_state.get("time_limit_s"):
+                        result["time_limit_s"] = st.session_state.time_limit_s
+                    if save_test_result(result, email, exam_bank):
+                        publish_progress(exam_bank, total_questions, finished=True, label=email.lower().strip())
+                        st.success("Test results saved successfully!")
+            
+            if col3.button("Restart Test"):
+                # Clear all session state keys
+                keys_to_delete = [k for k in st.session_state.keys() if k.startswith(QUESTION_KEY_PREFIXES)]
+                for k in keys_to_delete + ['question_pool', 'current_q', 'correct', 'incorrect', 'answers', 'adaptive', 'deadline', 'time_limit_s']:
+                    if k in st.session_state:
+                        del st.session_state[k]
+                st.rerun()